@@ -72,6 +72,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': '../database.db', # Общая БД
+        # Те же настройки, что у FastAPI (app/db.py): WAL, ожидание блокировки вместо ошибки
+        'OPTIONS': {
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
     }
 }
 
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin
 from .models import ReviewReport
+from .search import fts_available, fts_matching_ids, to_fts_query
 
 
 @admin.register(ReviewReport)
@@ -8,8 +9,9 @@ class ReviewReportAdmin(ModelAdmin):
     # ... ваши настройки ...
     list_display = ('id', 'project_name', 'file_path', 'status', 'created_at')
     list_filter = ('status', 'created_at', 'content_type')
-    search_fields = ('project_name', 'review_result')
-    readonly_fields = ('id', 'created_at', 'file_path')
+    # Запасной LIKE-поиск, если FTS-индекса еще нет (текст ревью хранится сжатым — LIKE по нему невозможен)
+    search_fields = ('project_name', 'file_path')
+    readonly_fields = ('id', 'created_at', 'file_path', 'review_result')
 
     fieldsets = (
         (None, {"fields": ('project_name', 'status', 'content_type')}),
@@ -18,6 +20,16 @@ class ReviewReportAdmin(ModelAdmin):
         ("Meta информация", {"fields": ('id', 'created_at'), "classes": ('collapse',)}),
     )
 
+    def review_result(self, obj):
+        return obj.review_result
+    review_result.short_description = "Результат ревью"
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по FTS5-индексу (как /api/reports/search) вместо LIKE '%...%' по всему тексту
+        if search_term and to_fts_query(search_term) and fts_available():
+            return queryset.filter(id__in=fts_matching_ids(search_term)), False
+        return super().get_search_results(request, queryset, search_term)
+
     # --- ПОДКЛЮЧАЕМ СКРИПТ ТЕМЫ ---
     class Media:
         js = ('admin/theme.js',)
\ No newline at end of file
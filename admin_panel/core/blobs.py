@@ -0,0 +1,20 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Нужен, только если FastAPI пишет блобы в zstd
+    zstandard = None
+
+
+def decompress_blob(codec, data):
+    """Как app.blobs.decompress_blob: текст ревью из reviewblob (сжатие — на стороне FastAPI)."""
+    data = bytes(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed: install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "none":
+        return data.decode("utf-8")
+    raise ValueError(f"Unknown blob codec: {codec}")
@@ -1,12 +1,35 @@
 from django.db import models
 
+from .blobs import decompress_blob
+
+
+class ReviewBlob(models.Model):
+    """Сжатый текст ревью, один на уникальный текст (пишет FastAPI, app/blobs.py)."""
+    hash = models.CharField(max_length=64, primary_key=True)
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    size = models.IntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'reviewblob'
+
+    @property
+    def text(self):
+        return decompress_blob(self.codec, self.data)
+
+
 class ReviewReport(models.Model):
     id = models.IntegerField(primary_key=True)
     project_name = models.CharField(max_length=100)
     file_path = models.TextField()
     content_type = models.CharField(max_length=10)
     summary = models.TextField()
-    review_result = models.TextField()
+    # Блоб общий для одинаковых текстов: при удалении отчета не трогаем (см. python -m app.migrate_blobs --gc)
+    review_blob = models.ForeignKey(
+        ReviewBlob, db_column='review_hash', on_delete=models.DO_NOTHING, related_name='+', db_constraint=False
+    )
     status = models.CharField(max_length=20)
     created_at = models.DateTimeField()
 
@@ -15,4 +38,9 @@ class ReviewReport(models.Model):
         db_table = 'reviewreport'
 
     def __str__(self):
-        return f"{self.project_name} - {self.status}"
\ No newline at end of file
+        return f"{self.project_name} - {self.status}"
+
+    @property
+    def review_result(self):
+        """Распаковка при обращении: только на странице отчета, списки блоб не загружают."""
+        return self.review_blob.text
@@ -0,0 +1,28 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+# FTS5-индекс создает и поддерживает FastAPI (app/search.py); здесь только чтение
+FTS_TABLE = "reviewreport_fts"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def to_fts_query(query):
+    """Как app.search.to_fts_query: слова в кавычках, все обязательны, последнее — по префиксу."""
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def fts_available():
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def fts_matching_ids(query):
+    """Подзапрос id отчетов, подходящих под запрос (для filter(id__in=...))."""
+    return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (to_fts_query(query),))
@@ -21,4 +21,12 @@ class ReviewReportTests(TestCase):
         try:
             ReviewReport.objects.all()[:1]
         except Exception as e:
-            self.fail(f"Не удалось подключиться к таблице reviewreport: {e}")
\ No newline at end of file
+            self.fail(f"Не удалось подключиться к таблице reviewreport: {e}")
+
+class FtsQueryTests(TestCase):
+    def test_user_input_is_quoted(self):
+        """Синтаксис FTS5 из строки поиска не интерпретируется, последнее слово — префикс"""
+        from .search import to_fts_query
+        self.assertEqual(to_fts_query('sql "injection" OR *'), '"sql" "injection" "OR"*')
+        self.assertEqual(to_fts_query("инъекц"), '"инъекц"*')
+        self.assertIsNone(to_fts_query("?!"))
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import ReviewReportListView
+from .views import ReviewReportDetailView, ReviewReportListView
 
 urlpatterns = [
     path('', ReviewReportListView.as_view(), name='report_list'),
+    path('<int:pk>/', ReviewReportDetailView.as_view(), name='report_detail'),
 ]
\ No newline at end of file
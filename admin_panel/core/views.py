@@ -1,4 +1,4 @@
-from django.views.generic import ListView
+from django.views.generic import DetailView, ListView
 from .models import ReviewReport
 
 
@@ -14,4 +14,14 @@ class ReviewReportListView(ListView):
 
     def get_queryset(self):
         # Сортируем от новых к старым
-        return ReviewReport.objects.all().order_by('-created_at')
\ No newline at end of file
+        return ReviewReport.objects.all().order_by('-created_at')
+
+
+class ReviewReportDetailView(DetailView):
+    """Один отчет с текстом ревью (распаковывается из reviewblob только здесь)."""
+    model = ReviewReport
+    template_name = 'core/report_detail.html'
+    context_object_name = 'report'
+
+    def get_queryset(self):
+        return ReviewReport.objects.select_related('review_blob')
\ No newline at end of file
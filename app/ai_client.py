@@ -1,39 +1,317 @@
+import os
+import json
+import time
 import aiohttp
 import asyncio
-from typing import Optional, List
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, List, Tuple
 
-# Используем облачный API Mistral
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+from .resilience import TokenBucket, AdaptiveConcurrency, CircuitBreaker, backoff_delay, parse_retry_after
+from .metrics import Counter, Gauge, Histogram, SLOW_BUCKETS
+from .tracing import span
+
+# Используем облачный API Mistral (для нагрузочных тестов — benchmarks/fake_mistral.py)
+MISTRAL_API_URL = os.environ.get("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
 MODEL_NAME = "mistral-large-latest"
 
+# --- Настройки пула соединений (один клиент на всё приложение) ---
+HTTP_POOL_SIZE = int(os.environ.get("MISTRAL_POOL_SIZE", "100"))  # Всего соединений
+HTTP_POOL_PER_HOST = int(os.environ.get("MISTRAL_POOL_PER_HOST", "20"))  # Соединений на один хост
+HTTP_DNS_TTL = int(os.environ.get("MISTRAL_DNS_TTL", "300"))  # Кэш DNS, сек
+HTTP_KEEPALIVE = float(os.environ.get("MISTRAL_KEEPALIVE", "75"))  # Сколько держать простаивающее соединение
+HTTP_TIMEOUT = float(os.environ.get("MISTRAL_TIMEOUT", "180"))  # Общий таймаут запроса
 
-# --- Вспомогательная функция запроса ---
-async def _call_mistral(messages: List[dict], api_key: str) -> str:
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общий ClientSession (создается лениво внутри event loop)."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE,
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """Закрывает общий клиент. Вызывается при остановке приложения."""
+    global _http_session, _guard
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+    _guard = None
+
+
+# --- Устойчивость: лимиты RPM/TPM, адаптивная конкурентность, ретраи, circuit breaker ---
+MISTRAL_RPM = int(os.environ.get("MISTRAL_RPM", "120"))  # Запросов в минуту
+MISTRAL_TPM = int(os.environ.get("MISTRAL_TPM", "500000"))  # Токенов в минуту (промпт + ответ)
+MISTRAL_CONCURRENCY = int(os.environ.get("MISTRAL_CONCURRENCY", "8"))  # Стартовый лимит параллельных запросов
+MISTRAL_MAX_CONCURRENCY = int(os.environ.get("MISTRAL_MAX_CONCURRENCY", "32"))
+MISTRAL_MAX_RETRIES = int(os.environ.get("MISTRAL_MAX_RETRIES", "4"))
+MISTRAL_BACKOFF_BASE = float(os.environ.get("MISTRAL_BACKOFF_BASE", "1.0"))  # Сек
+MISTRAL_BACKOFF_CAP = float(os.environ.get("MISTRAL_BACKOFF_CAP", "30"))  # Сек
+MISTRAL_BREAKER_THRESHOLD = int(os.environ.get("MISTRAL_BREAKER_THRESHOLD", "5"))  # Сбоев подряд
+MISTRAL_BREAKER_COOLDOWN = float(os.environ.get("MISTRAL_BREAKER_COOLDOWN", "30"))  # Сек
+# Оценка длины ответа для TPM (уточняется по usage из ответа)
+MISTRAL_EXPECTED_OUTPUT_TOKENS = int(os.environ.get("MISTRAL_EXPECTED_OUTPUT_TOKENS", "800"))
+
+mistral_stats = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0, "rejected_by_breaker": 0}
+
+# Для /metrics. Задержка — одна попытка, до заголовков ответа (для stream — до начала потока)
+mistral_latency = Histogram("mistral_request_duration_seconds", "Mistral API attempt latency until response headers", ("status",), SLOW_BUCKETS)
+mistral_responses = Counter("mistral_responses_total", "Mistral API attempts by HTTP status (error = connection failure)", ("status",))
+mistral_retries = Counter("mistral_retries_total", "Mistral API retries (429, 5xx, connection errors)")
+mistral_tokens = Counter("mistral_tokens_total", "Tokens reported by Mistral usage", ("kind",))
+
+
+class MistralError(Exception):
+    """Запрос к Mistral не удался (после всех ретраев). status — HTTP-код или None для сетевых ошибок."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _Guard:
+    """Состояние лимитеров. Создается внутри event loop вместе с HTTP-клиентом."""
+
+    def __init__(self):
+        self.requests = TokenBucket(MISTRAL_RPM)
+        self.tokens = TokenBucket(MISTRAL_TPM)
+        self.concurrency = AdaptiveConcurrency(MISTRAL_CONCURRENCY, MISTRAL_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(MISTRAL_BREAKER_THRESHOLD, MISTRAL_BREAKER_COOLDOWN)
+        self.paused_until = 0.0  # После 429 все запросы ждут Retry-After
+
+    async def wait_turn(self, tokens: int):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        await self.requests.acquire()
+        await self.tokens.acquire(tokens)
+
+
+_guard: Optional[_Guard] = None
+
+
+def _get_guard() -> _Guard:
+    global _guard
+    if _guard is None:
+        _guard = _Guard()
+    return _guard
+
+
+mistral_in_flight = Gauge("mistral_requests_in_flight", "Mistral API requests in progress and the adaptive limit", ("kind",))
+mistral_in_flight.set_function(lambda: {
+    ("in_flight",): _get_guard().concurrency.in_flight,
+    ("limit",): round(_get_guard().concurrency.limit, 2),
+})
+
+
+def mistral_client_stats() -> dict:
+    guard = _get_guard()
+    return {
+        **mistral_stats,
+        "concurrency_limit": round(guard.concurrency.limit, 2),
+        "in_flight": guard.concurrency.in_flight,
+        "breaker": guard.breaker.state,
+    }
+
+
+@asynccontextmanager
+async def _mistral_response(payload: dict, api_key: str, tokens: int) -> AsyncIterator[aiohttp.ClientResponse]:
+    """
+    Открывает запрос к Mistral и отдает ответ со статусом 200.
+    429 и Retry-After уменьшают конкурентность и приостанавливают все запросы;
+    5xx и сетевые ошибки повторяются с экспоненциальной задержкой и считаются
+    circuit breaker'ом. Остальные 4xx не повторяются. Неудача -> MistralError.
+    """
+    guard = _get_guard()
+    # Пробный запрос half-open обязан освободить "пробу" на любом выходе: иначе breaker не закроется никогда
+    probe = guard.breaker.state == "half-open"
+    if not guard.breaker.allow():
+        mistral_stats["rejected_by_breaker"] += 1
+        raise MistralError("Mistral API is unavailable (circuit open)")
+    try:
+        async with _guarded_attempts(guard, payload, api_key, tokens) as response:
+            yield response
+    finally:
+        if probe:
+            guard.breaker.release_probe()
+
+
+@asynccontextmanager
+async def _guarded_attempts(guard: "_Guard", payload: dict, api_key: str, tokens: int) -> AsyncIterator[aiohttp.ClientResponse]:
+    """Попытки запроса с ретраями для _mistral_response (breaker уже пропустил запрос)."""
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
+    for attempt in range(MISTRAL_MAX_RETRIES + 1):
+        await guard.wait_turn(tokens)
+        retry_after = None
+        async with guard.concurrency:
+            mistral_stats["requests"] += 1
+            started = time.perf_counter()
+            try:
+                response = await get_http_session().post(MISTRAL_API_URL, json=payload, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, error = None, f"Connection Error: {e!r}"
+                mistral_latency.observe(time.perf_counter() - started, "error")
+                mistral_responses.inc("error")
+            else:
+                mistral_latency.observe(time.perf_counter() - started, response.status)
+                mistral_responses.inc(response.status)
+                if response.status == 200:
+                    try:
+                        yield response
+                    finally:
+                        response.release()
+                    guard.breaker.record_success()
+                    guard.concurrency.on_success()
+                    return
+                status = response.status
+                error = f"API Error {status}: {await response.text()}"
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                response.release()
+
+        if status == 429:
+            mistral_stats["throttled"] += 1
+            guard.concurrency.on_throttle()
+            delay = retry_after if retry_after is not None else backoff_delay(attempt, MISTRAL_BACKOFF_BASE, MISTRAL_BACKOFF_CAP)
+            guard.paused_until = max(guard.paused_until, time.monotonic() + delay)
+        elif status is None or status >= 500:
+            guard.breaker.record_failure()
+            delay = retry_after if retry_after is not None else backoff_delay(attempt, MISTRAL_BACKOFF_BASE, MISTRAL_BACKOFF_CAP)
+        else:
+            # Остальные 4xx (ключ, формат запроса): API доступен, для breaker это не сбой
+            guard.breaker.record_success()
+            mistral_stats["failed"] += 1
+            raise MistralError(error, status)
+
+        if attempt == MISTRAL_MAX_RETRIES or guard.breaker.state == "open":
+            mistral_stats["failed"] += 1
+            raise MistralError(error, status)
+        mistral_stats["retries"] += 1
+        mistral_retries.inc()
+        await asyncio.sleep(delay)
+
+
+def _estimate_tokens(messages: List[dict]) -> int:
+    return sum(len(m.get("content", "")) for m in messages) // 4 + MISTRAL_EXPECTED_OUTPUT_TOKENS
+
+
+def _count_usage(usage: Optional[dict]):
+    for kind in ("prompt", "completion"):
+        if usage and usage.get(f"{kind}_tokens"):
+            mistral_tokens.inc(kind, amount=usage[f"{kind}_tokens"])
+
+
+# --- Вспомогательная функция запроса ---
+async def _call_mistral(messages: List[dict], api_key: str) -> str:
+    """Текст ответа модели. При неудаче поднимает MistralError."""
     payload = {
         "model": MODEL_NAME,
         "messages": messages,
         "temperature": 0.7
     }
+    estimate = _estimate_tokens(messages)
+    with span("mistral.call", prompt_chars=sum(len(m.get("content", "")) for m in messages)) as trace_span:
+        try:
+            async with _mistral_response(payload, api_key, estimate) as response:
+                data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise MistralError(f"Connection Error: {e!r}") from e
+        trace_span.set(**{f"{kind}_tokens": data.get("usage", {}).get(f"{kind}_tokens") for kind in ("prompt", "completion")})
+    _count_usage(data.get("usage"))
+    used = data.get("usage", {}).get("total_tokens")
+    if used:
+        _get_guard().tokens.adjust(used - estimate)
+    content = data.get("choices", [{}])[0].get("message", {}).get("content")
+    if not content:
+        raise MistralError("Empty response from Mistral API")
+    return content
+
+
+# --- Потоковый запрос (stream: true, ответ приходит как SSE-чанки) ---
+# Последние замеры времени до первого токена (сек): сводка для /api/stream/stats; то же — гистограммой в /metrics
+ttft_samples = deque(maxlen=1000)
+mistral_ttft = Histogram(
+    "mistral_stream_ttft_seconds", "Streaming review: time until the first token", (),
+    (0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+)
+
+
+async def _stream_mistral(messages: List[dict], api_key: str) -> AsyncIterator[str]:
+    """
+    Отдает текст ответа по кусочкам по мере генерации. Ретраи возможны только
+    до начала ответа; обрыв посреди потока -> MistralError.
+    """
+    payload = {
+        "model": MODEL_NAME,
+        "messages": messages,
+        "temperature": 0.7,
+        "stream": True
+    }
+    started = time.perf_counter()
+    first_token = True
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(MISTRAL_API_URL, json=payload, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get("choices", [{}])[0].get("message", {}).get("content", "Error")
-                else:
-                    error_text = await response.text()
-                    return f"API Error {response.status}: {error_text}"
-    except Exception as e:
-        return f"Connection Error: {str(e)}"
+        async with _mistral_response(payload, api_key, _estimate_tokens(messages)) as response:
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8", errors="ignore").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                _count_usage(chunk.get("usage"))  # Приходит в последнем чанке
+                delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content")
+                if delta:
+                    if first_token:
+                        ttft = time.perf_counter() - started
+                        ttft_samples.append(ttft)
+                        mistral_ttft.observe(ttft)
+                        first_token = False
+                    yield delta
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise MistralError(f"Connection Error: {e!r}") from e
+
+
+def ttft_summary() -> dict:
+    """Сводка по времени до первого токена (мс)."""
+    samples = sorted(ttft_samples)
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "avg_ms": round(sum(samples) / len(samples) * 1000, 1),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+        "last_ms": round(ttft_samples[-1] * 1000, 1),
+    }
 
 
 # --- 1. Стандартный Ревью (с контекстом) ---
-async def get_code_review_async(code: str, context: str = "", api_key: str = "") -> str:
-    prompt = f"""
+# Меняйте при правке промпта ниже: старые записи кэша ревью станут недействительными
+REVIEW_PROMPT_VERSION = "1"
+
+def _review_prompt(code: str, context: str) -> str:
+    return f"""
     Ты опытный Python-разработчик и security-аудитор.
     ПРАВИЛА ПРОЕКТА (Из .clinerules):
     {context}
@@ -47,6 +325,63 @@ async def get_code_review_async(code: str, context: str = "", api_key: str = "")
     2. Найденные баги/риски.
     3. Рекомендации по рефакторингу.
     """
+
+
+async def get_code_review_async(code: str, context: str = "", api_key: str = "") -> str:
+    prompt = _review_prompt(code, context)
+    return await _call_mistral([{"role": "user", "content": prompt}], api_key)
+
+
+async def stream_code_review_async(code: str, context: str = "", api_key: str = "") -> AsyncIterator[str]:
+    """То же ревью, но токены отдаются по мере генерации."""
+    prompt = _review_prompt(code, context)
+    async for delta in _stream_mistral([{"role": "user", "content": prompt}], api_key):
+        yield delta
+
+
+# --- 1a. Ревью изменений (фрагменты git diff с окружающей функцией) ---
+async def get_diff_review_async(file_path: str, changes: str, context: str = "", api_key: str = "") -> str:
+    prompt = f"""
+    Ты опытный Python-разработчик и security-аудитор. Сделай ревью ТОЛЬКО изменений в файле {file_path}.
+    ПРАВИЛА ПРОЕКТА (Из .clinerules):
+    {context}
+
+    Измененные фрагменты вместе с функцией, в которой они находятся. Строки с ">" изменены,
+    номера строк — по текущей версии файла:
+    {changes}
+
+    Ответ в формате Markdown:
+    1. Найденные баги/риски в изменениях (с номерами строк).
+    2. Рекомендации.
+    Если проблем нет — так и напиши, не пересказывай код.
+    """
+    return await _call_mistral([{"role": "user", "content": prompt}], api_key)
+
+
+# --- 1b. Пакетное ревью мелких файлов (один запрос на несколько файлов) ---
+def batch_file_marker(index: int, path: str) -> str:
+    return f"=== FILE {index}: {path} ==="
+
+
+async def get_batch_review_async(files: List[Tuple[str, str]], context: str = "", api_key: str = "") -> str:
+    """files: [(путь, код)]. Ответ содержит раздел на каждый файл с маркером batch_file_marker."""
+    blocks = "\n\n".join(
+        f"{batch_file_marker(i, path)}\n```python\n{code}\n```" for i, (path, code) in enumerate(files, start=1)
+    )
+    markers = "\n".join(batch_file_marker(i, path) for i, (path, _) in enumerate(files, start=1))
+    prompt = f"""
+    Ты опытный Python-разработчик и security-аудитор. Сделай ревью КАЖДОГО файла ниже отдельно.
+    ПРАВИЛА ПРОЕКТА (Из .clinerules):
+    {context}
+
+    Файлы:
+    {blocks}
+
+    Формат ответа СТРОГО такой: для каждого файла сначала строка-маркер ровно как ниже,
+    затем ревью этого файла в Markdown (1. Общая оценка. 2. Найденные баги/риски. 3. Рекомендации).
+    Маркеры по порядку:
+    {markers}
+    """
     return await _call_mistral([{"role": "user", "content": prompt}], api_key)
 
 
@@ -1,9 +1,13 @@
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
 from sqlmodel import Session, select
 import os
 from dotenv import load_dotenv # 1. Импортируем
@@ -11,13 +15,20 @@ from dotenv import load_dotenv # 1. Импортируем
 # 2. Загружаем .env
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 
-from .db import get_session
+from .db import get_async_session, run_db, bump_auth_epoch, AUTH_EPOCH_FILE
 from .models import User
 
 # 3. Берем ключ из окружения
 SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 300
+# Служебные операции (профилирование) доступны только этому пользователю
+ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+
+# Кэш аутентификации: расшифрованные токены и записи пользователей, чтобы не делать
+# jwt.decode + SELECT на каждый запрос. 0 — кэш выключен
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "1024"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -42,21 +53,154 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+class _TTLCache:
+    """LRU на OrderedDict: запись живет ttl секунд, при переполнении вытесняется самая старая."""
+
+    def __init__(self, ttl: float, size: int):
+        self.ttl = ttl
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + min(self.ttl, ttl if ttl is not None else self.ttl))
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+_token_cache = _TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)  # token -> username
+_user_cache = _TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)  # username -> поля User
+_seen_epoch = None
+
+auth_stats = {"token_hits": 0, "token_misses": 0, "user_hits": 0, "user_misses": 0, "invalidations": 0}
+
+
+def invalidate_auth_cache():
+    """Сбрасывает кэш этого процесса (другие процессы увидят bump_auth_epoch)."""
+    _token_cache.clear()
+    _user_cache.clear()
+    auth_stats["invalidations"] += 1
+
+
+def _read_epoch() -> Optional[int]:
+    try:
+        return os.stat(AUTH_EPOCH_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _check_epoch():
+    # Пользователей изменили вне процесса (change_pass.py, другой воркер) — кэш устарел
+    global _seen_epoch
+    epoch = _read_epoch()
+    if epoch != _seen_epoch:
+        if _seen_epoch is not None or epoch is not None:
+            invalidate_auth_cache()
+        _seen_epoch = epoch
+
+
+def auth_cache_stats() -> dict:
+    def rate(hits, misses):
+        return round(hits / (hits + misses), 3) if hits + misses else None
+
+    return {
+        **auth_stats,
+        "token_hit_rate": rate(auth_stats["token_hits"], auth_stats["token_misses"]),
+        "user_hit_rate": rate(auth_stats["user_hits"], auth_stats["user_misses"]),
+        "cached_tokens": len(_token_cache.items),
+        "cached_users": len(_user_cache.items),
+        "ttl": AUTH_CACHE_TTL,
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _track_user_changes(session, flush_context):
+    if any(isinstance(obj, User) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["users_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_user_commit(session):
+    global _seen_epoch
+    if session.info.pop("users_changed", False):
+        invalidate_auth_cache()
+        bump_auth_epoch()
+        _seen_epoch = _read_epoch()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_user_changes(session):
+    session.info.pop("users_changed", None)
+
+
+def _decode_token(token: str) -> Optional[str]:
+    username = _token_cache.get(token)
+    if username is not None:
+        auth_stats["token_hits"] += 1
+        return username
+    auth_stats["token_misses"] += 1
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is not None:
+        # Токен из кэша не должен пережить свой exp
+        expires_in = payload["exp"] - time.time() if "exp" in payload else None
+        _token_cache.put(token, username, ttl=expires_in)
+    return username
+
+
+def _load_user(session: Session, username: str) -> Optional[User]:
+    return session.exec(select(User).where(User.username == username)).first()
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), session=Depends(get_async_session)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    _check_epoch()
+    username = _decode_token(token)
+    if username is None:
         raise credentials_exception
 
-    user = session.exec(select(User).where(User.username == username)).first()
+    fields = _user_cache.get(username)
+    if fields is not None:
+        auth_stats["user_hits"] += 1
+        # Каждому запросу своя копия: изменения объекта не попадут в кэш
+        return User(**fields)
+    auth_stats["user_misses"] += 1
+
+    user = await run_db(session, _load_user, username)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    _user_cache.put(username, user.model_dump())
+    return user
+
+
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.username != ADMIN_USERNAME:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return current_user
@@ -0,0 +1,126 @@
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .ai_client import get_batch_review_async
+from .chunker import estimate_tokens
+from .db import run_db
+from .review_cache import make_cache_key, store_reviews, review_with_cache
+from .scan_engine import run_bounded
+
+# Файл считается "мелким" (кандидат в пакет), если он меньше этого числа токенов
+BATCH_SMALL_FILE_TOKENS = int(os.environ.get("BATCH_SMALL_FILE_TOKENS", "400"))
+# Бюджет кода в одном пакетном запросе
+BATCH_TOKEN_BUDGET = int(os.environ.get("BATCH_TOKEN_BUDGET", "3000"))
+# Больше файлов в одном запросе модель начинает путать разделы
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "12"))
+
+_MARKER_RE = re.compile(r"^\s*=== FILE (\d+):.*?===\s*$", re.MULTILINE)
+
+batch_stats = {"batches": 0, "batched_files": 0, "fallback_files": 0}
+
+
+def is_small_file(code: str) -> bool:
+    return estimate_tokens(code) <= BATCH_SMALL_FILE_TOKENS
+
+
+def pack_batches(files: List[Tuple[str, str]], budget: int = BATCH_TOKEN_BUDGET) -> List[List[Tuple[str, str]]]:
+    """First-fit decreasing: раскладывает файлы по пакетам, не превышая бюджет и BATCH_MAX_FILES."""
+    bins: List[List[Tuple[str, str]]] = []
+    sizes: List[int] = []
+    for path, code in sorted(files, key=lambda item: estimate_tokens(item[1]), reverse=True):
+        size = estimate_tokens(code)
+        for index, used in enumerate(sizes):
+            if used + size <= budget and len(bins[index]) < BATCH_MAX_FILES:
+                bins[index].append((path, code))
+                sizes[index] += size
+                break
+        else:
+            bins.append([(path, code)])
+            sizes.append(size)
+    return bins
+
+
+def split_batch_response(text: str, count: int) -> Optional[Dict[int, str]]:
+    """Делит ответ по маркерам "=== FILE N: ... ===". None, если разобрать не удалось."""
+    matches = list(_MARKER_RE.finditer(text))
+    if not matches:
+        return None
+    sections = {}
+    for i, match in enumerate(matches):
+        index = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[match.end():end].strip()
+        if 1 <= index <= count and body:
+            sections[index] = body
+    return sections or None
+
+
+async def review_small_files(
+        session,
+        files: List[Tuple[str, str]],
+        rules: str = "",
+        context: str = "",
+        api_key: str = "",
+        on_result: Optional[Callable[[dict], None]] = None
+) -> Dict[str, dict]:
+    """
+    Ревью мелких файлов пакетами. Возвращает {путь: outcome} в формате run_bounded
+    ({"item": путь, "ok": True, "result": (ревью, из_кэша)} или {"ok": False, "error": ...}).
+    Кэш проверяет вызывающий код (review_files): сюда приходят только промахи. Если ответ пакета не разобрался
+    (или какого-то файла в нем нет), такие файлы ревьюятся по одному.
+    on_result вызывается для каждого файла, как только его ревью готово.
+    """
+    results: Dict[str, dict] = {}
+
+    def done(path: str, outcome: dict):
+        results[path] = outcome
+        if on_result is not None:
+            on_result(outcome)
+
+    async def review_batch(batch: List[Tuple[str, str]]) -> Dict[str, Tuple[str, bool]]:
+        if len(batch) == 1:
+            path, code = batch[0]
+            return {path: await review_with_cache(
+                session, code, rules=rules, context=f"{context}File: {path}", api_key=api_key, lookup=False
+            )}
+
+        response = await get_batch_review_async(batch, context=context, api_key=api_key)
+        batch_stats["batches"] += 1
+
+        sections = split_batch_response(response, len(batch)) or {}
+        reviewed = {}
+        fallback = []
+        to_store = {}
+        for index, (path, code) in enumerate(batch, start=1):
+            if index in sections:
+                to_store[make_cache_key(code, rules)] = sections[index]
+                reviewed[path] = (sections[index], False)
+                batch_stats["batched_files"] += 1
+            else:
+                fallback.append((path, code))
+        # Разобранные разделы пакета — в кэш одним коммитом
+        await run_db(session, store_reviews, to_store)
+
+        batch_stats["fallback_files"] += len(fallback)
+        single = await run_bounded(fallback, lambda item: review_with_cache(
+            session, item[1], rules=rules, context=f"{context}File: {item[0]}", api_key=api_key, lookup=False
+        ))
+        for outcome in single:
+            if not outcome["ok"]:
+                raise RuntimeError(outcome["error"])
+            reviewed[outcome["item"][0]] = outcome["result"]
+        return reviewed
+
+    async def run_batch(batch: List[Tuple[str, str]]):
+        try:
+            reviewed = await review_batch(batch)
+        except Exception as e:
+            for path, _ in batch:
+                done(path, {"item": path, "ok": False, "error": str(e)})
+            return
+        for path, result in reviewed.items():
+            done(path, {"item": path, "ok": True, "result": result})
+
+    await run_bounded(pack_batches(files), run_batch)
+    return results
@@ -0,0 +1,210 @@
+import os
+import zlib
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlalchemy import event, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, delete
+
+from .models import ReviewBlob, ReviewReport, ReviewReportDetail, ReviewUpdate, ReviewUpdateDetail
+
+try:
+    import zstandard
+except ImportError:  # Есть в requirements.txt; в окружении без него пишем zlib (zstd-блобы не прочитать)
+    zstandard = None
+
+# Тексты ревью хранятся в reviewblob: сжаты, по одной записи на уникальный текст (ключ — sha256).
+# Отчет хранит только ссылку review_hash; распаковка — только при открытии отчета.
+BLOB_CODEC = os.environ.get("BLOB_CODEC", "zstd" if zstandard is not None else "zlib")
+BLOB_ZSTD_LEVEL = int(os.environ.get("BLOB_ZSTD_LEVEL", "10"))
+BLOB_ZLIB_LEVEL = int(os.environ.get("BLOB_ZLIB_LEVEL", "6"))
+# Блоб без ссылок удаляется не сразу: его отчет может еще ждать коммита в другой сессии
+BLOB_GC_GRACE = int(os.environ.get("BLOB_GC_GRACE", "3600"))
+
+blob_stats = {"written": 0, "deduplicated": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+# session.info: блобы, ожидающие записи (пишутся перед flush), и исходные тексты до коммита
+_PENDING = "pending_blobs"
+_TEXTS = "blob_texts"
+
+
+def text_hash(review_text: str) -> str:
+    return hashlib.sha256(review_text.encode("utf-8")).hexdigest()
+
+
+def compress_text(review_text: str, codec: str = BLOB_CODEC) -> bytes:
+    raw = review_text.encode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("BLOB_CODEC=zstd requires the zstandard package")
+        return zstandard.ZstdCompressor(level=BLOB_ZSTD_LEVEL).compress(raw)
+    if codec == "zlib":
+        return zlib.compress(raw, BLOB_ZLIB_LEVEL)
+    raise ValueError(f"Unknown blob codec: {codec}")
+
+
+def decompress_blob(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed: install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "none":
+        return data.decode("utf-8")
+    raise ValueError(f"Unknown blob codec: {codec}")
+
+
+def make_blob_row(review_text: str) -> dict:
+    raw = review_text.encode("utf-8")
+    codec, data = BLOB_CODEC, compress_text(review_text)
+    if len(data) >= len(raw):
+        # Короткие тексты ("Нет замечаний", ошибки API) сжатие только увеличивает
+        codec, data = "none", raw
+    return {
+        "hash": text_hash(review_text),
+        "codec": codec,
+        "data": data,
+        "size": len(raw),
+        "created_at": datetime.utcnow(),
+    }
+
+
+def put_blob(session: Session, review_text: str) -> str:
+    """
+    Регистрирует текст и возвращает его хеш (для ReviewReport.review_hash). В БД пишется
+    при ближайшем flush сессии через INSERT OR IGNORE — одинаковые тексты хранятся один раз.
+    """
+    key = text_hash(review_text)
+    session.info.setdefault(_TEXTS, {})[key] = review_text
+    pending: Dict[str, str] = session.info.setdefault(_PENDING, {})
+    pending[key] = review_text
+    return key
+
+
+def new_report(session: Session, review_text: str, **fields) -> ReviewReport:
+    """ReviewReport с текстом ревью в reviewblob. Добавить в сессию/BatchWriter — вызывающему коду."""
+    return ReviewReport(review_hash=put_blob(session, review_text), **fields)
+
+
+def load_text(session: Session, review_hash: str) -> str:
+    pending = session.info.get(_TEXTS, {})
+    if review_hash in pending:
+        return pending[review_hash]
+    blob = session.get(ReviewBlob, review_hash)
+    if blob is None:
+        return ""
+    return decompress_blob(blob.codec, blob.data)
+
+
+def report_detail(session: Session, report: ReviewReport) -> ReviewReportDetail:
+    updates = session.exec(select(ReviewUpdate).where(ReviewUpdate.report_id == report.id).order_by(ReviewUpdate.id)).all()
+    return ReviewReportDetail(
+        **report.model_dump(),
+        review_result=load_text(session, report.review_hash),
+        updates=[
+            ReviewUpdateDetail(**update.model_dump(), review_result=load_text(session, update.review_hash))
+            for update in updates
+        ],
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _write_pending_blobs(session, flush_context, instances):
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    rows = [make_blob_row(review_text) for review_text in pending.values()]
+    result = session.connection().execute(sqlite_insert(ReviewBlob).on_conflict_do_nothing(index_elements=["hash"]), rows)
+    written = max(result.rowcount, 0)
+    blob_stats["written"] += written
+    blob_stats["deduplicated"] += len(rows) - written
+    blob_stats["raw_bytes"] += sum(row["size"] for row in rows)
+    blob_stats["stored_bytes"] += sum(len(row["data"]) for row in rows)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_texts(session):
+    session.info.pop(_TEXTS, None)
+
+
+def gc_blobs(session: Session) -> int:
+    """Удаляет блобы, на которые не ссылается ни один отчет или ревью изменений (например, после удаления в админке)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=BLOB_GC_GRACE)
+    removed = session.exec(
+        delete(ReviewBlob).where(
+            ReviewBlob.created_at < cutoff,
+            ReviewBlob.hash.not_in(select(ReviewReport.review_hash)),
+            ReviewBlob.hash.not_in(select(ReviewUpdate.review_hash)),
+        )
+    ).rowcount or 0
+    session.commit()
+    return removed
+
+
+def storage_stats(session: Session) -> dict:
+    row = session.connection().execute(text(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM reviewblob"
+    )).one()
+    # Сколько занимали бы тексты, храни каждый отчет свою копию (как до reviewblob)
+    reports, logical_bytes = session.connection().execute(text(
+        "SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM reviewreport r LEFT JOIN reviewblob b ON b.hash = r.review_hash"
+    )).one()
+    return {
+        "reports": reports,
+        "logical_bytes": logical_bytes,
+        "blobs": row[0],
+        "raw_bytes": row[1],
+        "stored_bytes": row[2],
+        "codec": BLOB_CODEC,
+        "process": blob_stats,
+    }
+
+
+def migrate_inline_reviews(engine, batch: int = 1000, log=print) -> int:
+    """
+    Переводит старую схему (review_result текстом в каждой строке reviewreport) на reviewblob.
+    Можно прерывать и запускать снова: обрабатываются строки без review_hash. Возвращает число строк.
+    """
+    with engine.connect() as conn:
+        columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(reviewreport)")]
+        if "review_result" not in columns:
+            return 0
+        ReviewBlob.__table__.create(conn, checkfirst=True)
+        log("📦 [DB]: Перенос текстов ревью в сжатое хранилище reviewblob...")
+        if "review_hash" not in columns:
+            conn.exec_driver_sql("ALTER TABLE reviewreport ADD COLUMN review_hash VARCHAR")
+        # Старый FTS-индекс (external content + триггеры) читает review_result — удаляем, он будет пересоздан
+        for trigger in ("reviewreport_fts_ai", "reviewreport_fts_ad", "reviewreport_fts_au"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.exec_driver_sql("DROP TABLE IF EXISTS reviewreport_fts")
+        conn.commit()
+
+        converted = 0
+        while True:
+            rows = conn.exec_driver_sql(
+                "SELECT id, review_result FROM reviewreport WHERE review_hash IS NULL ORDER BY id LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            blobs = {}
+            for _, review_text in rows:
+                review_text = review_text or ""
+                key = text_hash(review_text)
+                if key not in blobs:
+                    blobs[key] = make_blob_row(review_text)
+            conn.execute(sqlite_insert(ReviewBlob).on_conflict_do_nothing(index_elements=["hash"]), list(blobs.values()))
+            conn.exec_driver_sql(
+                "UPDATE reviewreport SET review_hash = ? WHERE id = ?",
+                [(text_hash(review_text or ""), report_id) for report_id, review_text in rows]
+            )
+            conn.commit()
+            converted += len(rows)
+            log(f"   ... {converted} отчетов")
+
+        conn.exec_driver_sql("ALTER TABLE reviewreport DROP COLUMN review_result")
+        conn.commit()
+        log(f"✅ [DB]: Перенесено {converted} отчетов")
+        return converted
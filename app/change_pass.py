@@ -1,7 +1,7 @@
 from sqlmodel import Session, select
 from passlib.context import CryptContext
 # Импортируем init_db, чтобы создать таблицы, если их нет
-from db import engine, init_db
+from db import engine, init_db, bump_auth_epoch
 from models import User
 
 # === НАСТРОЙКИ ===
@@ -31,6 +31,8 @@ with Session(engine) as session:
         user.hashed_password = get_password_hash(NEW_PASSWORD)
         session.add(user)
         session.commit()
+        # Запущенный API держит пользователя в кэше: сбрасываем
+        bump_auth_epoch()
         print("------------------------------------------------")
         print("✅ УСПЕХ!")
         print(f"Пароль для '{USERNAME_TO_CHANGE}' успешно изменен на: {NEW_PASSWORD}")
@@ -41,6 +43,7 @@ with Session(engine) as session:
         new_user = User(username=USERNAME_TO_CHANGE, hashed_password=get_password_hash(NEW_PASSWORD))
         session.add(new_user)
         session.commit()
+        bump_auth_epoch()
         print("------------------------------------------------")
         print("✅ ПОЛЬЗОВАТЕЛЬ СОЗДАН!")
         print(f"Логин: {USERNAME_TO_CHANGE}")
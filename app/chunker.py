@@ -0,0 +1,154 @@
+import os
+import ast
+from typing import List, Optional, Tuple
+
+from .scan_engine import run_bounded
+from .review_cache import review_with_cache
+from .tracing import span
+
+# Бюджет токенов на один фрагмент кода в промпте (грубая оценка: ~4 символа на токен)
+CHUNK_TOKEN_BUDGET = int(os.environ.get("CHUNK_TOKEN_BUDGET", "1500"))
+CHARS_PER_TOKEN = 4
+
+# Единица разбиения: (первая строка, последняя строка, класс-владелец или None), строки с 1
+Unit = Tuple[int, int, Optional[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _node_start(node: ast.AST) -> int:
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _split_lines(start: int, end: int, lines: List[str], budget: int, scope: Optional[str] = None) -> List[Unit]:
+    """Режет диапазон строк на куски не больше бюджета (для слишком длинных функций и невалидного кода)."""
+    units = []
+    chunk_start, size = start, 0
+    for line_no in range(start, end + 1):
+        size += estimate_tokens(lines[line_no - 1])
+        if size > budget and line_no > chunk_start:
+            units.append((chunk_start, line_no - 1, scope))
+            chunk_start, size = line_no, estimate_tokens(lines[line_no - 1])
+    units.append((chunk_start, end, scope))
+    return units
+
+
+def _units_for(start: int, end: int, lines: List[str], budget: int, scope: Optional[str] = None) -> List[Unit]:
+    text = "".join(lines[start - 1:end])
+    return [(start, end, scope)] if estimate_tokens(text) <= budget else _split_lines(start, end, lines, budget, scope)
+
+
+def split_python_units(code: str, budget: int = CHUNK_TOKEN_BUDGET) -> List[Unit]:
+    """
+    Делит модуль на единицы по границам верхнеуровневых функций/классов (через ast).
+    Большой класс делится на заголовок и отдельные методы. Комментарии между
+    определениями прикрепляются к следующему определению.
+    """
+    lines = code.splitlines(keepends=True)
+    if not lines:
+        return []
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return _split_lines(1, len(lines), lines, budget)
+
+    units: List[Unit] = []
+    prev_end = 0
+    for node in tree.body:
+        start, end = prev_end + 1, node.end_lineno
+        text = "".join(lines[start - 1:end])
+        if isinstance(node, ast.ClassDef) and estimate_tokens(text) > budget and node.body:
+            body_start = _node_start(node.body[0])
+            units.append((start, body_start - 1, None) if body_start > start else (start, start, None))
+            inner_prev = max(start, body_start - 1)
+            for child in node.body:
+                units.extend(_units_for(inner_prev + 1, child.end_lineno, lines, budget, node.name))
+                inner_prev = child.end_lineno
+            if inner_prev < end:
+                units.append((inner_prev + 1, end, node.name))
+        else:
+            units.extend(_units_for(start, end, lines, budget))
+        prev_end = end
+
+    if prev_end < len(lines):
+        units.append((prev_end + 1, len(lines), None))
+    return units
+
+
+def chunk_python_source(code: str, budget: int = CHUNK_TOKEN_BUDGET) -> List[dict]:
+    """Упаковывает соседние единицы в фрагменты до бюджета. Возвращает [{"start", "end", "text"}]."""
+    lines = code.splitlines(keepends=True)
+    chunks = []
+    current: List[Unit] = []
+    size = 0
+
+    def flush():
+        if not current:
+            return
+        start, end, scope = current[0][0], current[-1][1], current[0][2]
+        text = "".join(lines[start - 1:end])
+        if scope:
+            # Фрагмент начинается внутри класса: подсказываем модели, чей это метод
+            text = f"# ... class {scope}: (продолжение)\n{text}"
+        chunks.append({"start": start, "end": end, "text": text})
+
+    for unit in split_python_units(code, budget):
+        unit_size = estimate_tokens("".join(lines[unit[0] - 1:unit[1]]))
+        if current and size + unit_size > budget:
+            flush()
+            current, size = [], 0
+        current.append(unit)
+        size += unit_size
+    flush()
+    return chunks
+
+
+async def review_source(
+        session,
+        code: str,
+        file_path: str,
+        rules: str = "",
+        context: str = "",
+        api_key: str = "",
+        budget: int = CHUNK_TOKEN_BUDGET,
+        lookup: bool = True
+) -> Tuple[str, bool]:
+    """
+    Ревью файла целиком. Маленький файл уходит одним запросом; большой режется
+    по функциям/классам, фрагменты ревьюятся параллельно и сливаются в один отчет
+    с указанием диапазонов строк. Возвращает (текст, всё_из_кэша).
+    lookup=False — кэш файла целиком уже проверен вызывающим (у фрагментов свои ключи, они проверяются).
+    """
+    if estimate_tokens(code) <= budget:
+        return await review_with_cache(
+            session, code, rules=rules, context=f"{context}File: {file_path}", api_key=api_key, lookup=lookup
+        )
+
+    with span("chunk.plan", file=file_path) as trace_span:
+        chunks = chunk_python_source(code, budget)
+        trace_span.set(chunks=len(chunks))
+    total_lines = len(code.splitlines())
+
+    async def review_chunk(chunk: dict):
+        chunk_context = f"{context}File: {file_path} (строки {chunk['start']}-{chunk['end']} из {total_lines})"
+        return await review_with_cache(session, chunk["text"], rules=rules, context=chunk_context, api_key=api_key)
+
+    outcomes = await run_bounded(chunks, review_chunk)
+    failed = [outcome for outcome in outcomes if not outcome["ok"]]
+    if failed:
+        # Неполный отчет не выдаем за готовый; удачные фрагменты уже в кэше и при повторе не запрашиваются
+        raise RuntimeError(f"{len(failed)} of {len(chunks)} chunks failed: {failed[0]['error']}")
+
+    sections = []
+    all_cached = True
+    for chunk, outcome in zip(chunks, outcomes):
+        header = f"## Строки {chunk['start']}–{chunk['end']}"
+        review, cached = outcome["result"]
+        all_cached = all_cached and cached
+        sections.append(f"{header}\n\n{review}")
+
+    merged = f"# Ревью {os.path.basename(file_path)} ({len(chunks)} фрагментов)\n\n" + "\n\n---\n\n".join(sections)
+    return merged, all_cached
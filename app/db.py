@@ -1,15 +1,204 @@
 import os
+import re
+import asyncio
+from sqlalchemy import event
+from sqlalchemy.util import await_only
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # Файл БД будет лежать в корне проекта
 DATABASE_URL = "sqlite:///./database.db"
+# Та же БД через aiosqlite: эндпоинты и Агент работают с ней, не блокируя event loop
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./database.db"
+
+# --- Настройки SQLite (ту же БД читает Django-админка) ---
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # Сколько ждать чужую блокировку
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "20000"))  # Кэш страниц на соединение
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# Пакетная запись отчетов: коммит каждые N штук
+DB_COMMIT_EVERY = int(os.environ.get("DB_COMMIT_EVERY", "50"))
+# Файл-метка рядом с БД: его mtime меняется при любом изменении пользователей (в т.ч. из change_pass.py),
+# по нему процессы API сбрасывают кэш аутентификации (app/auth.py)
+AUTH_EPOCH_FILE = os.environ.get("AUTH_EPOCH_FILE", "./database.db.auth-epoch")
+
+
+def make_engine(url: str = DATABASE_URL):
+    """Движок с пулом соединений; PRAGMA применяются к каждому новому соединению."""
+    new_engine = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,  # Нужно для SQLite в многопотоке
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    event.listen(new_engine, "connect", _sqlite_pragmas)
+    return new_engine
+
+
+def make_async_engine(url: str = ASYNC_DATABASE_URL):
+    """Асинхронный движок (aiosqlite) с теми же PRAGMA и настройками пула."""
+    new_engine = create_async_engine(
+        url,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    event.listen(new_engine.sync_engine, "connect", _sqlite_pragmas)
+    _serialize_writes(new_engine.sync_engine)
+    return new_engine
+
+
+_WRITE_RE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def _serialize_writes(sync_engine):
+    """
+    Запись в SQLite — одна транзакция за раз. Без очереди конкурирующие соединения получают
+    SQLITE_BUSY и ждут в busy_timeout (sleep с растущим шагом). Здесь транзакция записи
+    (от первого INSERT/UPDATE/DELETE до возврата соединения в пул) берет asyncio.Lock движка: ожидающие
+    просыпаются сразу после коммита, чтения (WAL) идут без очереди.
+    """
+    lock = asyncio.Lock()
+
+    def acquire(conn, cursor, statement, parameters, context, executemany):
+        if not conn.info.get("write_lock") and _WRITE_RE.match(statement):
+            await_only(lock.acquire())  # Выполняется внутри greenlet AsyncSession
+            conn.info["write_lock"] = True
+
+    def release(info):
+        if info.pop("write_lock", False):
+            lock.release()
+
+    event.listen(sync_engine, "before_cursor_execute", acquire)
+    # Отпускаем, когда соединение вернулось в пул: событие commit приходит до самого COMMIT
+    event.listen(sync_engine, "reset", lambda dbapi_conn, record, reset_state: release(record.info))
+    event.listen(sync_engine, "invalidate", lambda dbapi_conn, record, exception: release(record.info))
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL: читатели (админка, /api/reports) не блокируются записью и наоборот.
+    synchronous=NORMAL в режиме WAL безопасен для целостности и не делает fsync на каждый коммит.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+engine = make_engine()
+async_engine = make_async_engine()
+
+
+def bump_auth_epoch():
+    """Сообщает всем процессам API, что пользователи изменились (сбросить кэш аутентификации)."""
+    with open(AUTH_EPOCH_FILE, "a"):
+        pass
+    os.utime(AUTH_EPOCH_FILE)
 
-connect_args = {"check_same_thread": False} # Нужно для SQLite в многопотоке
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
 
 def get_session():
     with Session(engine) as session:
         yield session
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+
+def new_async_session(db_engine=None) -> AsyncSession:
+    # expire_on_commit=False: после commit поля объектов читаются без неявного запроса (в async он невозможен)
+    return AsyncSession(db_engine or async_engine, expire_on_commit=False)
+
+
+async def get_async_session():
+    async with new_async_session() as session:
+        yield session
+
+
+async def run_db(session, fn, *args, **kwargs):
+    """
+    Вызывает синхронную функцию работы с БД fn(session, *args) для Session и AsyncSession.
+    Для AsyncSession — через run_sync: запросы идут через aiosqlite, event loop не блокируется.
+    Операции одной AsyncSession выполняются по очереди (конвейер ревью вызывает их из параллельных задач).
+    """
+    if not isinstance(session, AsyncSession):
+        return fn(session, *args, **kwargs)
+    lock = session.info.get("db_lock")
+    if lock is None:
+        lock = session.info["db_lock"] = asyncio.Lock()
+    async with lock:
+        return await session.run_sync(fn, *args, **kwargs)
+
+
+def init_db(db_engine=None):
+    db_engine = db_engine or engine
+    SQLModel.metadata.create_all(db_engine)
+    # create_all не трогает существующие таблицы: индексы, добавленные в модели позже, создаем отдельно
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db_engine, checkfirst=True)
+
+
+class BatchWriter:
+    """
+    Копит объекты и пишет их пачкой: add/merge + commit каждые `every` штук. До коммита
+    объекты в сессию не попадают, поэтому между пачками (пока идут запросы к Mistral)
+    сессия не держит открытую транзакцию записи. Остаток — в commit() / при выходе из with.
+    С AsyncSession — `async with`: пачки пишутся фоновыми задачами через run_db.
+    """
+
+    def __init__(self, session, every: int = DB_COMMIT_EVERY):
+        self.session = session
+        self.every = every
+        self.pending = []
+        self.written = 0
+        self.tasks = []
+
+    def add(self, obj):
+        self._queue("add", obj)
+
+    def merge(self, obj):
+        """Upsert (session.merge) в той же пачке."""
+        self._queue("merge", obj)
+
+    def _queue(self, method: str, obj):
+        self.pending.append((method, obj))
+        if len(self.pending) >= self.every:
+            self.commit()
+
+    def commit(self):
+        pending, self.pending = self.pending, []
+        if isinstance(self.session, AsyncSession):
+            # add/merge вызываются из синхронных колбэков: запись уходит в задачу
+            self.tasks.append(asyncio.ensure_future(run_db(self.session, self._write, pending)))
+        else:
+            self._write(self.session, pending)
+
+    def _write(self, session: Session, pending: list):
+        for method, obj in pending:
+            getattr(session, method)(obj)
+        session.commit()
+        self.written += len(pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Готовые результаты сохраняем и при ошибке/отмене посередине скана
+        self.commit()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.commit()
+        await asyncio.gather(*self.tasks)
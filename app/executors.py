@@ -0,0 +1,52 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+# Потоки для блокирующего файлового I/O (чтение/запись файлов, копирование загрузок)
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "16"))
+# Процессы для CPU-тяжелой работы (разбор PDF, bcrypt), чтобы не держать GIL и event loop
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", str(os.cpu_count() or 2)))
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    return _io_pool
+
+
+def _get_cpu_pool() -> ProcessPoolExecutor:
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS)
+    return _cpu_pool
+
+
+async def run_io(fn: Callable, *args, **kwargs) -> Any:
+    """Выполняет блокирующую I/O-функцию в пуле потоков."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_io_pool(), partial(fn, *args, **kwargs))
+
+
+async def run_cpu(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Выполняет CPU-тяжелую функцию в пуле процессов.
+    fn и аргументы должны сериализоваться через pickle (функция уровня модуля).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_cpu_pool(), partial(fn, *args, **kwargs))
+
+
+def shutdown_executors():
+    global _io_pool, _cpu_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
@@ -0,0 +1,306 @@
+import os
+import re
+import ast
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session, select
+
+from .ai_client import get_diff_review_async
+from .blobs import put_blob
+from .db import run_db
+from .executors import run_io
+from .models import ProjectGitState, ReviewReport, ReviewUpdate
+from .review_cache import make_cache_key, get_cached_review, store_review
+from .scan_engine import run_bounded
+from .tracing import span
+from .utils import read_project_file
+from .walker import ignored_reason, walk_project
+
+# Инкрементальное ревью проектов под git: в Mistral уходят только измененные фрагменты
+# (хунки git diff от последнего отревьюенного коммита) вместе с функцией, в которой они находятся.
+# Ревью фрагментов сохраняется как ReviewUpdate к уже существующему отчету файла.
+
+# Режим Агента для проектов под git: "files" (ревью измененных файлов целиком) или "git" (только хунки diff)
+AGENT_REVIEW_MODE = os.environ.get("AGENT_REVIEW_MODE", "files").lower()
+GIT_TIMEOUT = float(os.environ.get("GIT_TIMEOUT", "30"))
+# Строк контекста вокруг изменения вне функции (или в слишком длинной функции)
+GIT_DIFF_CONTEXT_LINES = int(os.environ.get("GIT_DIFF_CONTEXT_LINES", "3"))
+# Функция длиннее — вместо нее целиком берем изменение с контекстом
+GIT_DIFF_MAX_FUNCTION_LINES = int(os.environ.get("GIT_DIFF_MAX_FUNCTION_LINES", "120"))
+
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# Хунк: строки новой версии файла (с 1) и удаленные строки
+Hunk = dict
+
+
+def _git(project_path: str, *args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "-C", project_path, "-c", "core.quotepath=off", *args],
+            capture_output=True, text=True, encoding="utf-8", errors="replace", timeout=GIT_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def git_head(project_path: str) -> Optional[str]:
+    """SHA текущего коммита или None, если папка не git-репозиторий (или в нем нет коммитов)."""
+    if not os.path.isdir(project_path):
+        return None
+    head = _git(project_path, "rev-parse", "--verify", "-q", "HEAD")
+    return head.strip() if head else None
+
+
+def parse_diff(diff: str) -> Dict[str, List[Hunk]]:
+    """Вывод `git diff --unified=0` -> {путь от корня репозитория: [{"start", "end", "added", "removed"}]}."""
+    files: Dict[str, List[Hunk]] = {}
+    hunks: Optional[List[Hunk]] = None
+    hunk: Optional[Hunk] = None
+    in_header = False
+    for line in diff.splitlines():
+        if line.startswith("diff --git "):
+            in_header, hunks, hunk = True, None, None
+        elif in_header and line.startswith("+++ "):
+            # Удаленный файл (+++ /dev/null) не ревьюим
+            hunks = files.setdefault(line[6:], []) if line.startswith("+++ b/") else None
+        elif line.startswith("@@"):
+            in_header = False
+            match = _HUNK_RE.match(line)
+            if hunks is None or match is None:
+                hunk = None
+                continue
+            start, count = int(match.group(1)), int(match.group(2) or "1")
+            # count == 0 — только удаление: привязываем к строке перед ним
+            hunk = {"start": max(start, 1), "end": max(start + count - 1, start, 1), "added": count, "removed": []}
+            hunks.append(hunk)
+        elif hunk is not None and not in_header and line.startswith("-"):
+            hunk["removed"].append(line[1:])
+    return files
+
+
+def changed_files(project_path: str, base_commit: str) -> Optional[Tuple[Dict[str, List[Hunk]], List[str]]]:
+    """
+    Изменения .py файлов от base_commit до рабочей копии (включая незакоммиченные):
+    ({путь от корня проекта: хунки}, [новые неотслеживаемые файлы]). None — git не ответил.
+    Проект может лежать в подпапке репозитория: --relative дает пути от project_path (как ls-files)
+    и отбрасывает изменения вне проекта.
+    """
+    diff = _git(project_path, "diff", "--no-color", "--no-ext-diff", "--relative", "--unified=0", base_commit, "--", "*.py")
+    untracked = _git(project_path, "ls-files", "--others", "--exclude-standard", "--", "*.py")
+    if diff is None or untracked is None:
+        return None
+    return parse_diff(diff), [path for path in untracked.splitlines() if path]
+
+
+def _function_scopes(code: str) -> List[Tuple[int, int, str]]:
+    """(первая строка с декораторами, последняя строка, имя) для всех функций и методов."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+    scopes = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            scopes.append((start, node.end_lineno, node.name))
+    return scopes
+
+
+def build_regions(code: str, hunks: List[Hunk]) -> List[dict]:
+    """
+    Фрагменты для промпта: для каждого хунка — самая вложенная функция, в которой он лежит,
+    иначе хунк ± GIT_DIFF_CONTEXT_LINES. Пересекающиеся фрагменты сливаются.
+    """
+    lines = code.splitlines()
+    scopes = _function_scopes(code)
+    regions = []
+    for hunk in hunks:
+        enclosing = [
+            scope for scope in scopes
+            if scope[0] <= hunk["start"] and hunk["end"] <= scope[1] and scope[1] - scope[0] < GIT_DIFF_MAX_FUNCTION_LINES
+        ]
+        if enclosing:
+            start, end, name = max(enclosing, key=lambda scope: scope[0])
+        else:
+            start, end, name = hunk["start"] - GIT_DIFF_CONTEXT_LINES, hunk["end"] + GIT_DIFF_CONTEXT_LINES, None
+        changed = set(range(hunk["start"], hunk["end"] + 1)) if hunk["added"] else set()
+        regions.append({
+            "start": max(start, 1), "end": min(end, len(lines)), "scopes": [name] if name else [],
+            "changed": changed, "removed": list(hunk["removed"]),
+        })
+
+    merged: List[dict] = []
+    for region in sorted(regions, key=lambda item: item["start"]):
+        if merged and region["start"] <= merged[-1]["end"] + 1:
+            last = merged[-1]
+            last["end"] = max(last["end"], region["end"])
+            last["scopes"] += [name for name in region["scopes"] if name not in last["scopes"]]
+            last["changed"] |= region["changed"]
+            last["removed"] += region["removed"]
+        else:
+            merged.append(region)
+    return merged
+
+
+def render_regions(code: str, regions: List[dict]) -> str:
+    lines = code.splitlines()
+    blocks = []
+    for region in regions:
+        title = f"Строки {region['start']}-{region['end']}"
+        if region["scopes"]:
+            title += f" (функция {', '.join(region['scopes'])})"
+        body = "\n".join(
+            f"{'>' if line_no in region['changed'] else ' '} {line_no:>5} | {lines[line_no - 1]}"
+            for line_no in range(region["start"], region["end"] + 1)
+        )
+        block = f"### {title}\n```python\n{body}\n```"
+        if region["removed"]:
+            block += "\nУдаленные строки:\n```python\n" + "\n".join(region["removed"]) + "\n```"
+        blocks.append(block)
+    return "\n\n".join(blocks)
+
+
+def _latest_reports(session: Session, project_name: str, file_paths: List[str]) -> Dict[str, int]:
+    """{путь: id последнего успешного отчета} для файлов, у которых он есть."""
+    found = {}
+    for start in range(0, len(file_paths), 500):  # Лимит параметров SQLite
+        rows = session.exec(
+            select(ReviewReport.file_path, ReviewReport.id).where(
+                ReviewReport.project_name == project_name,
+                ReviewReport.file_path.in_(file_paths[start:start + 500]),
+                ReviewReport.status == "completed",
+            ).order_by(ReviewReport.id)
+        )
+        found.update({file_path: report_id for file_path, report_id in rows})
+    return found
+
+
+def _prepare_diffs(project_path: str, base_commit: str) -> Optional[Tuple[Dict[str, str], Dict[str, List[Hunk]], List[str]]]:
+    """
+    Файловая часть плана (выполняется в пуле потоков): ({путь: код}, {путь: хунки}, новые файлы).
+    None — diff не получен или его пути не нашлись в проекте: такой проход нельзя засчитывать.
+    """
+    changes = changed_files(project_path, base_commit)
+    if changes is None:
+        return None
+    hunks_by_file, untracked = changes
+    codes, hunks, new_files = {}, {}, []
+    for rel_path, file_hunks in hunks_by_file.items():
+        path = os.path.join(project_path, *rel_path.split("/"))
+        if not file_hunks or ignored_reason(project_path, path):
+            continue
+        if not os.path.isfile(path):
+            return None
+        codes[path] = read_project_file(path)
+        hunks[path] = file_hunks
+    for rel_path in untracked:
+        path = os.path.join(project_path, *rel_path.split("/"))
+        if ignored_reason(project_path, path) is None:
+            new_files.append(path)
+    return codes, hunks, new_files
+
+
+async def plan_changes(session, project_name: str, project_path: str) -> Optional[dict]:
+    """
+    План инкрементального ревью. None — проект не под git (нужен обычный скан).
+    {"head", "base", "full": [пути для полного ревью], "diffs": {путь: {"report_id", "text", "hunks"}},
+     "diff_chars", "full_chars", "complete"}. Без сохраненного коммита (первый проход) — все файлы в "full".
+    complete=False — diff не сопоставился с файлами: все файлы в "full", коммит после прохода не запоминается.
+    """
+    head = await run_io(git_head, project_path)
+    if head is None:
+        return None
+    state = await run_db(session, lambda s: s.get(ProjectGitState, project_name))
+    plan = {
+        "head": head, "base": state.last_commit if state else None, "full": [], "diffs": {},
+        "diff_chars": 0, "full_chars": 0, "complete": True,
+    }
+    if state is None:
+        plan["full"] = await run_io(lambda: list(walk_project(project_path)))
+        return plan
+
+    with span("git.diff", base=state.last_commit[:12], head=head[:12]) as trace_span:
+        prepared = await run_io(_prepare_diffs, project_path, state.last_commit)
+        if prepared is None:
+            # Изменения не удалось сопоставить с файлами: ревьюим проект целиком, коммит не сдвигаем
+            plan["full"] = await run_io(lambda: list(walk_project(project_path)))
+            plan["complete"] = False
+            trace_span.set(unmapped=True)
+            return plan
+        codes, hunks, new_files = prepared
+        reports = await run_db(session, _latest_reports, project_name, list(codes))
+        plan["full"] = new_files
+        for path, code in codes.items():
+            if path not in reports:
+                # Отчета еще нет — ревьюим файл целиком
+                plan["full"].append(path)
+                continue
+            text = render_regions(code, build_regions(code, hunks[path]))
+            plan["diffs"][path] = {"report_id": reports[path], "text": text, "hunks": len(hunks[path])}
+            plan["diff_chars"] += len(text)
+            plan["full_chars"] += len(code)
+        trace_span.set(files=len(codes), diffs=len(plan["diffs"]), full=len(plan["full"]))
+    return plan
+
+
+def _save_updates(session: Session, plan: dict, reviews: Dict[str, str]):
+    for path, review in reviews.items():
+        session.add(ReviewUpdate(
+            report_id=plan["diffs"][path]["report_id"],
+            base_commit=plan["base"],
+            head_commit=plan["head"],
+            hunks=plan["diffs"][path]["hunks"],
+            review_hash=put_blob(session, review),
+        ))
+    session.commit()
+
+
+async def review_changes(session, plan: dict, rules: str = "", context: str = "", api_key: str = "") -> List[dict]:
+    """
+    Ревью фрагментов из plan["diffs"] (через кэш ревью) и запись ReviewUpdate к отчетам файлов.
+    Возвращает [{"file", "status": "updated"/"cached"/"failed", ...}]; для "cached" (те же фрагменты,
+    например незакоммиченная правка с прошлого прохода) ReviewUpdate повторно не пишется.
+    """
+    async def review_one(item):
+        path, change = item
+        key = make_cache_key(f"diff:{os.path.basename(path)}\n{change['text']}", rules)
+        review = await run_db(session, get_cached_review, key)
+        if review is not None:
+            return review, True
+        review = await get_diff_review_async(os.path.basename(path), change["text"], context=context, api_key=api_key)
+        await run_db(session, store_review, key, review)
+        return review, False
+
+    outcomes = await run_bounded(list(plan["diffs"].items()), review_one)
+    reviews, results = {}, []
+    for outcome in outcomes:
+        path, change = outcome["item"]
+        if outcome["ok"]:
+            review, cached = outcome["result"]
+            if not cached:
+                reviews[path] = review
+            results.append({
+                "file": path, "status": "cached" if cached else "updated",
+                "report_id": change["report_id"], "hunks": change["hunks"],
+            })
+        else:
+            results.append({"file": path, "status": "failed", "msg": outcome["error"]})
+    if reviews:
+        await run_db(session, _save_updates, plan, reviews)
+    return results
+
+
+def _mark_reviewed(session: Session, project_name: str, head: str):
+    state = session.get(ProjectGitState, project_name) or ProjectGitState(project_name=project_name, last_commit=head)
+    state.last_commit = head
+    state.reviewed_at = datetime.utcnow()
+    session.add(state)
+    session.commit()
+
+
+async def mark_reviewed(session, project_name: str, head: str):
+    """Запоминает коммит: следующий проход начнется с него. Вызывать, только если все файлы отревьюены."""
+    await run_db(session, _mark_reviewed, project_name, head)
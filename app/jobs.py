@@ -0,0 +1,217 @@
+import os
+import json
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlmodel import Session, select, update, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .db import new_async_session, run_db
+from .models import ReviewJob, JobItem
+
+# Очередь и обработчики пишут через AsyncSession (aiosqlite): все записи процесса проходят через
+# одну очередь записи async-движка (db._serialize_writes), и синхронный коммит не ждет busy_timeout
+# в потоке event loop. Функции ниже — синхронные fn(session, ...), вызываются через run_db.
+
+# Сколько задач выполняется одновременно в процессе FastAPI
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Как часто воркер проверяет очередь, если его не разбудили явно (сек)
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "5"))
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# Обработчик задачи: async (session, job, params) -> dict (итог, сохраняется в job.result)
+JobHandler = Callable[[AsyncSession, ReviewJob, dict], Awaitable[dict]]
+_handlers: Dict[str, JobHandler] = {}
+_running: Dict[int, asyncio.Task] = {}
+_workers: List[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+
+
+def register_job_handler(kind: str, handler: JobHandler):
+    _handlers[kind] = handler
+
+
+def job_kinds() -> List[str]:
+    return list(_handlers)
+
+
+def submit_job(session: Session, kind: str, params: dict, owner: str) -> ReviewJob:
+    """Ставит задачу в очередь и сразу возвращает ее (с id)."""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = ReviewJob(kind=kind, params=json.dumps(params, ensure_ascii=False), owner=owner)
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    if _wakeup is not None:
+        _wakeup.set()
+    return job
+
+
+def cancel_job(session: Session, job: ReviewJob) -> bool:
+    """Отменяет задачу в очереди или прерывает выполняющуюся. Уже готовые результаты сохраняются."""
+    cancelled = session.exec(
+        update(ReviewJob)
+        .where(ReviewJob.id == job.id, ReviewJob.status == "queued")
+        .values(status="cancelled", finished_at=datetime.utcnow())
+    ).rowcount
+    session.commit()
+    if cancelled:
+        return True
+    task = _running.get(job.id)
+    if task is not None:
+        task.cancel()  # Статус выставит воркер
+        return True
+    return False
+
+
+def add_job_items(session: Session, job: ReviewJob, file_paths: List[str]) -> List[JobItem]:
+    """
+    Создает строки прогресса по файлам и выставляет job.total.
+    Если задача перезапущена после рестарта, возвращает только еще не обработанные файлы.
+    """
+    existing = session.exec(select(JobItem).where(JobItem.job_id == job.id)).all()
+    if existing:
+        pending = [item for item in existing if item.status == "pending"]
+        job.total = len(existing)
+        job.done = len(existing) - len(pending)
+        session.add(job)
+        session.commit()
+        return pending
+
+    items = [JobItem(job_id=job.id, file_path=file_path) for file_path in file_paths]
+    session.add_all(items)
+    job.total = len(items)
+    session.add(job)
+    session.commit()
+    return items
+
+
+def finish_job_item(session: Session, job: ReviewJob, item: JobItem, report_id: Optional[int] = None,
+                    cached: bool = False, error: Optional[str] = None, skipped: bool = False):
+    """Отмечает файл обработанным и сразу коммитит, чтобы прогресс был виден через API."""
+    item.status = "error" if error else "skipped" if skipped else "ok"
+    item.report_id = report_id
+    item.cached = cached
+    item.error = error
+    job.done += 1
+    session.add(item)
+    session.add(job)
+    session.commit()
+
+
+def job_queue_depth(session: Session) -> Dict[str, int]:
+    """Сколько задач ждет в очереди и выполняется (по всем процессам) — для /metrics."""
+    depth = {"queued": 0, "running": 0}
+    rows = session.exec(
+        select(ReviewJob.status, func.count()).where(ReviewJob.status.in_(list(depth))).group_by(ReviewJob.status)
+    )
+    depth.update({job_status: count for job_status, count in rows})
+    return depth
+
+
+def _claim_next_job(session: Session) -> Optional[ReviewJob]:
+    """Атомарно забирает самую старую задачу из очереди (UPDATE ... WHERE status='queued')."""
+    while True:
+        job_id = session.exec(
+            select(ReviewJob.id).where(ReviewJob.status == "queued").order_by(ReviewJob.id).limit(1)
+        ).first()
+        if job_id is None:
+            return None
+        claimed = session.exec(
+            update(ReviewJob)
+            .where(ReviewJob.id == job_id, ReviewJob.status == "queued")
+            .values(status="running", started_at=datetime.utcnow())
+        ).rowcount
+        session.commit()
+        if claimed:
+            return session.get(ReviewJob, job_id)
+
+
+def _finish_job(session: Session, job: ReviewJob, task: asyncio.Task):
+    session.rollback()  # Сбрасываем незакоммиченное от прерванного обработчика
+    session.refresh(job)
+    if task.cancelled():
+        job.status = "cancelled"
+    elif task.exception() is not None:
+        exc = task.exception()
+        job.status = "failed"
+        job.error = str(getattr(exc, "detail", None) or exc)
+    else:
+        job.status = "completed"
+        job.result = json.dumps(task.result(), ensure_ascii=False, default=str)
+    job.finished_at = datetime.utcnow()
+    session.add(job)
+    session.commit()
+
+
+def _fail_unknown_kind(session: Session, job: ReviewJob):
+    job.status, job.error, job.finished_at = "failed", f"Unknown job kind: {job.kind}", datetime.utcnow()
+    session.add(job)
+    session.commit()
+
+
+async def _run_job(job_id: int):
+    async with new_async_session() as session:
+        job = await run_db(session, lambda s: s.get(ReviewJob, job_id))
+        handler = _handlers.get(job.kind)
+        if handler is None:
+            await run_db(session, _fail_unknown_kind, job)
+            return
+        task = asyncio.create_task(handler(session, job, json.loads(job.params)))
+        _running[job.id] = task
+        try:
+            await asyncio.wait({task})
+        finally:
+            _running.pop(job.id, None)
+
+        await run_db(session, _finish_job, job, task)
+        print(f"📦 [JOBS]: Задача #{job.id} ({job.kind}) -> {job.status}")
+
+
+async def _worker(worker_id: int):
+    while True:
+        try:
+            async with new_async_session() as session:
+                job = await run_db(session, _claim_next_job)
+            if job is not None:
+                await _run_job(job.id)
+                continue
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ [JOBS]: Ошибка воркера {worker_id}: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+def _requeue_interrupted(session: Session):
+    session.exec(update(ReviewJob).where(ReviewJob.status == "running").values(status="queued"))
+    session.commit()
+
+
+async def _start_workers():
+    async with new_async_session() as session:
+        await run_db(session, _requeue_interrupted)
+    for worker_id in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker(worker_id)))
+
+
+def start_job_workers():
+    """Возвращает в очередь задачи, прерванные рестартом, и запускает воркеры (из работающего event loop)."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    _workers.append(asyncio.create_task(_start_workers()))
+
+
+async def stop_job_workers():
+    """Останавливает воркеры. Прерванные задачи остаются в статусе running и вернутся в очередь при старте."""
+    for task in _workers + list(_running.values()):
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -1,33 +1,59 @@
 import os
-import shutil
+import json
+import time
+import base64
 from typing import List, Optional
 from datetime import datetime
 from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from sqlmodel import Session, select, or_, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
 import asyncio
 from dotenv import load_dotenv # 1. Импортируем
 
 # 2. Загружаем переменные
 load_dotenv()
 
-from .db import init_db, get_session
-from .models import User, ReviewReport
-from .auth import get_current_user, get_password_hash, create_access_token, verify_password
+from .db import engine, async_engine, init_db, get_session, get_async_session, new_async_session, run_db, BatchWriter
+from .models import User, ReviewReport, ReviewReportListItem, ReviewJob, JobItem
+from .auth import get_current_user, get_admin_user, get_password_hash, create_access_token, verify_password, auth_cache_stats
 from .ai_client import (
-    get_code_review_async,
-    generate_clinerules_async,
     migrate_code_async,
     generate_tests_async,
-    scaffold_app_async
+    scaffold_app_async,
+    close_http_session,
+    stream_code_review_async,
+    ttft_summary,
+    mistral_client_stats,
+    MistralError
 )
-from .utils import scan_local_project, extract_text_from_pdf, read_project_file, write_project_file
+from .utils import scan_local_project, read_project_file, write_project_file
+from .walker import new_walk_stats
+from .pipeline import review_files
+from .batching import batch_stats
+from .triage import triage_stats
+from .executors import run_io, run_cpu, shutdown_executors
+from .pdf_engine import PdfLimitError, slowest_documents
+from .uploads import read_upload, remove_upload_dir, UploadTooLargeError, UploadSizeLimitMiddleware
+from .search import ensure_search_index, search_reports
+from .blobs import new_report, report_detail, storage_stats, migrate_inline_reviews
+from .review_cache import REVIEW_CACHE_EVICT_INTERVAL, review_with_cache, evict_review_cache, cache_stats, make_cache_key, get_cached_review, store_review
+from .jobs import register_job_handler, submit_job, cancel_job, add_job_items, finish_job_item, start_job_workers, stop_job_workers, job_queue_depth
+from .metrics import Counter, Gauge, Histogram, SLOW_BUCKETS, METRICS_TOKEN, render_metrics
+from .tracing import TracedRoute, start_trace, span, profiler, list_profiles, PROFILE_DIR
+from .project_context import load_project_context, record_prompt_savings, context_stats
+from .incremental import AGENT_REVIEW_MODE, plan_changes, review_changes, mark_reviewed
+from .manifest import AGENT_WATCH_MODE, detect_changes, manifest_entry, watch_for_changes, drain_changes
 
 app = FastAPI(title="AI Agent Engineer API")
+# Все маршруты ниже меряются для /metrics (задержка, статусы, запросы в работе) и трассируются (X-Trace-Id)
+app.router.route_class = TracedRoute
+# Слишком большие загрузки отклоняются до разбора multipart (внутри CORS, чтобы 413 дошел до браузера)
+app.add_middleware(UploadSizeLimitMiddleware, paths=("/api/upload-and-review", "/api/upload-and-review/stream"))
 
 # --- НАСТРОЙКИ CORS ---
 app.add_middleware(
@@ -46,18 +72,39 @@ if not MISTRAL_API_KEY:
 
 BASE_PROJECT_DIR = os.path.expanduser("~/PycharmProjects")
 
+
+@app.exception_handler(MistralError)
+async def mistral_error_handler(request: Request, exc: MistralError):
+    """Mistral недоступен или отказал после всех ретраев: 502 вместо подделанного ответа."""
+    return JSONResponse(status_code=502, content={"detail": f"Mistral API: {exc}"})
+
 # --- Startup ---
 @app.on_event("startup")
 def on_startup():
+    # БД старого формата (текст ревью в каждой строке reviewreport) переводится на reviewblob до создания индексов
+    migrate_inline_reviews(engine)
     init_db()
+    ensure_search_index(engine)
     session = next(get_session())
     # Создаем админа, если нет
     if not session.exec(select(User).where(User.username == "admin")).first():
         session.add(User(username="admin", hashed_password=get_password_hash("admin")))
         session.commit()
     session.close()
-    # Запускаем Агента
-    asyncio.create_task(autonomous_agent_loop())
+    # Запускаем воркеры фоновых задач, очистку кэша ревью и Агента
+    start_job_workers()
+    asyncio.create_task(review_cache_maintenance())
+    if AGENT_ENABLED:
+        asyncio.create_task(autonomous_agent_loop())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Закрываем общий HTTP-клиент Mistral (пул keep-alive соединений)
+    await stop_job_workers()
+    await close_http_session()
+    await async_engine.dispose()
+    shutdown_executors()
+    remove_upload_dir()
 
 # --- Pages ---
 templates = Jinja2Templates(directory="templates")
@@ -68,117 +115,354 @@ async def read_root(request: Request):
 
 # --- Auth Endpoints ---
 @app.post("/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.username == form_data.username)).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_async_session)):
+    user = (await session.exec(select(User).where(User.username == form_data.username))).first()
+    # bcrypt специально медленный: считаем его в пуле процессов, а не в event loop
+    if not user or not await run_cpu(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect credentials")
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- NEW: Admin / History Endpoint ---
+REPORTS_PAGE_MAX = 100
+
+
+def _encode_cursor(report: ReviewReportListItem) -> str:
+    raw = f"{report.created_at.isoformat()}|{report.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, report_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(report_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.get("/api/reports")
 async def get_reports(
-        skip: int = 0,
         limit: int = 20,
+        cursor: Optional[str] = None,
+        project: Optional[str] = None,
+        status: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Список отчетов (Админ-панель), новые сверху. Keyset-пагинация: next_cursor из ответа
+    передается в следующий запрос. Текст ревью не отдается — он в /api/reports/{id}.
+    """
+    limit = max(1, min(limit, REPORTS_PAGE_MAX))
+    columns = [getattr(ReviewReport, name) for name in ReviewReportListItem.model_fields]
+    statement = select(*columns)
+    if project:
+        statement = statement.where(ReviewReport.project_name == project)
+    if status:
+        statement = statement.where(ReviewReport.status == status)
+    if created_from:
+        statement = statement.where(ReviewReport.created_at >= created_from)
+    if created_to:
+        statement = statement.where(ReviewReport.created_at < created_to)
+    if cursor:
+        created_at, report_id = _decode_cursor(cursor)
+        statement = statement.where(or_(
+            ReviewReport.created_at < created_at,
+            and_(ReviewReport.created_at == created_at, ReviewReport.id < report_id)
+        ))
+    statement = statement.order_by(ReviewReport.created_at.desc(), ReviewReport.id.desc()).limit(limit + 1)
+
+    rows = [ReviewReportListItem.model_validate(row._mapping) for row in (await session.exec(statement)).all()]
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
+
+@app.get("/api/reports/search")
+async def search_reports_endpoint(
+        q: str,
+        limit: int = 20,
+        project: Optional[str] = None,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    """Полнотекстовый поиск по отчетам (FTS5): лучшие совпадения и фрагмент с <mark>"""
+    return await run_db(session, search_reports, q, limit=limit, project=project)
+
+@app.get("/api/reports/{report_id}")
+async def get_report(
+        report_id: int,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    """Полный отчет с текстом ревью"""
+    report = await session.get(ReviewReport, report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return await run_db(session, report_detail, report)
+
+@app.get("/api/blobs/stats")
+async def blob_storage_stats(
         current_user: User = Depends(get_current_user),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_async_session)
 ):
-    """Возвращает список всех отчетов (Админ-панель)"""
-    statements = select(ReviewReport).order_by(ReviewReport.id.desc()).offset(skip).limit(limit)
-    reports = session.exec(statements).all()
-    return reports
+    """Хранилище текстов ревью: число блобов, исходный и сжатый объем, дедупликация"""
+    return await run_db(session, storage_stats)
+
+@app.get("/api/review-cache/stats")
+async def review_cache_stats(current_user: User = Depends(get_current_user)):
+    """Счетчики кэша ревью (попадания/промахи/вытеснения)"""
+    total = cache_stats["hits"] + cache_stats["misses"]
+    return {
+        **cache_stats,
+        "hit_rate": round(cache_stats["hits"] / total, 3) if total else 0.0,
+        "batching": batch_stats,
+        "triage": triage_stats,
+        "rules_context": context_stats,
+    }
 
 # --- Работа с файлами (Загрузка и Скан) ---
 
+async def _read_upload(file: UploadFile):
+    """Текст загрузки и ее тип (code/pdf), см. uploads.read_upload; слишком большой файл — 413."""
+    try:
+        return await read_upload(file)
+    except (UploadTooLargeError, PdfLimitError) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def _upload_report(session: Session, filename: str, content: str, content_type: str, review_text: str,
+                   status: str = "completed") -> ReviewReport:
+    return new_report(
+        session,
+        review_text,
+        project_name="Uploaded File",
+        file_path=filename,
+        content_type=content_type,
+        summary=content[:200] + "...",
+        status=status
+    )
+
+
 @app.post("/api/upload-and-review")
 async def upload_and_review(
         file: UploadFile = File(...),
         current_user: User = Depends(get_current_user),
-        session: Session = Depends(get_session)
+        session: AsyncSession = Depends(get_async_session)
 ):
-    temp_path = f"temp_{file.filename}"
+    content, content_type = await _read_upload(file)
+
     try:
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        content = ""
-        content_type = "code"
-
-        if file.filename.endswith(".pdf"):
-            content = extract_text_from_pdf(temp_path)
-            content_type = "pdf"
-        else:
-            with open(temp_path, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-
-        review_text = await get_code_review_async(content, context=f"File: {file.filename}", api_key=MISTRAL_API_KEY)
-
-        report = ReviewReport(
-            project_name="Uploaded File",
-            file_path=file.filename,
-            content_type=content_type,
-            summary=content[:200] + "...",
-            review_result=review_text,
-            status="completed"
+        review_text, cached = await review_with_cache(
+            session, content, context=f"File: {file.filename}", api_key=MISTRAL_API_KEY
         )
-        session.add(report)
-        session.commit()
-        session.refresh(report)
+    except MistralError as e:
+        # Отчет остается в истории со статусом failed, клиент получает 502
+        session.add(_upload_report(session, file.filename, content, content_type, str(e), status="failed"))
+        await session.commit()
+        raise
 
-        return {"status": "success", "report_id": report.id, "review": review_text}
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    report = _upload_report(session, file.filename, content, content_type, review_text)
+    session.add(report)
+    await session.commit()
 
-@app.post("/api/scan-local-project")
-async def scan_project(
-        project_name: str = Form(...),
-        current_user: User = Depends(get_current_user),
-        session: Session = Depends(get_session)
+    return {"status": "success", "report_id": report.id, "review": review_text, "cached": cached}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/upload-and-review/stream")
+async def upload_and_review_stream(
+        file: UploadFile = File(...),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    То же, что /api/upload-and-review, но ответ Mistral приходит токенами (Server-Sent Events):
+    event: token {"text": ...}, в конце event: done {"report_id": ..., "ttft_ms": ...}
+    или event: error {"report_id": ..., "detail": ...}, если Mistral отказал.
+    """
+    content, content_type = await _read_upload(file)
+    filename = file.filename
+
+    async def events():
+        started = time.perf_counter()
+        ttft_ms = None
+        async with new_async_session() as session:
+            key = make_cache_key(content)
+            review_text = await run_db(session, get_cached_review, key)
+            cached = review_text is not None
+            if cached:
+                ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                yield _sse("token", {"text": review_text})
+            else:
+                parts = []
+                try:
+                    async for delta in stream_code_review_async(content, context=f"File: {filename}", api_key=MISTRAL_API_KEY):
+                        if ttft_ms is None:
+                            ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                        parts.append(delta)
+                        yield _sse("token", {"text": delta})
+                except MistralError as e:
+                    report = _upload_report(session, filename, content, content_type, str(e), status="failed")
+                    session.add(report)
+                    await session.commit()
+                    yield _sse("error", {"report_id": report.id, "detail": f"Mistral API: {e}"})
+                    return
+                review_text = "".join(parts)
+                await run_db(session, store_review, key, review_text)
+
+            # Полный текст сохраняем, когда поток закончился
+            report = _upload_report(session, filename, content, content_type, review_text)
+            session.add(report)
+            await session.commit()
+            yield _sse("done", {"report_id": report.id, "cached": cached, "ttft_ms": ttft_ms})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/pdf/stats")
+async def pdf_stats(limit: int = 10, current_user: User = Depends(get_current_user)):
+    """Самые медленные из последних PDF (время разбора и самая тяжелая страница)"""
+    return slowest_documents(limit)
+
+
+@app.get("/api/stream/stats")
+async def stream_stats(current_user: User = Depends(get_current_user)):
+    """Время до первого токена потоковых ответов Mistral"""
+    return {"time_to_first_token": ttft_summary()}
+
+
+@app.get("/api/auth/stats")
+async def auth_stats_endpoint(current_user: User = Depends(get_current_user)):
+    """Попадания кэша аутентификации (токены и пользователи) и сбросы"""
+    return auth_cache_stats()
+
+job_queue = Gauge("review_jobs", "Background jobs waiting in the queue or running", ("status",))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request, session: AsyncSession = Depends(get_async_session)):
+    """Метрики в формате Prometheus. С METRICS_TOKEN — только с заголовком Authorization: Bearer <токен>."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    for job_status, count in (await run_db(session, job_queue_depth)).items():
+        job_queue.set(job_status, value=count)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/api/profiling/capture")
+async def capture_profile(
+        requests: int = Form(0),
+        agent_cycle: bool = Form(False),
+        current_user: User = Depends(get_admin_user)
 ):
+    """Включает cProfile для следующих `requests` запросов API и/или следующего цикла Агента."""
+    return profiler.arm(requests=requests, agent_cycle=agent_cycle)
+
+
+@app.get("/api/profiling")
+async def profiling_status(current_user: User = Depends(get_admin_user)):
+    return {**profiler.status(), "profiles": await run_io(list_profiles)}
+
+
+@app.get("/api/profiling/{name}")
+async def download_profile(name: str, current_user: User = Depends(get_admin_user)):
+    """Файл .prof для pstats / snakeviz."""
+    if name not in {profile["name"] for profile in await run_io(list_profiles)}:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(os.path.join(PROFILE_DIR, name), media_type="application/octet-stream", filename=name)
+
+
+@app.get("/api/mistral/stats")
+async def mistral_stats_endpoint(current_user: User = Depends(get_current_user)):
+    """Ретраи, 429, отказы и текущее состояние лимитеров клиента Mistral"""
+    return mistral_client_stats()
+
+def _project_path(project_name: str) -> str:
     project_path = os.path.join(BASE_PROJECT_DIR, project_name)
     if not os.path.exists(project_path):
         raise HTTPException(status_code=404, detail=f"Project {project_name} not found")
+    return project_path
 
-    py_files = scan_local_project(project_path)
-    results = []
 
-    for file_path in py_files:
-        try:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                code = f.read()
-            if len(code) > 4000: code = code[:4000] + "\n... (truncated)"
+def _scan_report(session: Session, project_name: str, file_path: str, review_text: str,
+                 status: str = "completed") -> ReviewReport:
+    return new_report(
+        session,
+        review_text,
+        project_name=project_name,
+        file_path=file_path,
+        content_type="code",
+        summary="Local scan",
+        status=status
+    )
 
-            review_text = await get_code_review_async(code, context=f"File: {file_path}", api_key=MISTRAL_API_KEY)
 
-            report = ReviewReport(
-                project_name=project_name,
-                file_path=file_path,
-                content_type="code",
-                summary="Local scan",
-                review_result=review_text,
-                status="completed"
-            )
-            session.add(report)
-            results.append({"file": file_path, "status": "ok"})
-        except Exception as e:
-            results.append({"file": file_path, "status": "error", "msg": str(e)})
+@app.post("/api/scan-local-project")
+async def scan_project(
+        project_name: str = Form(...),
+        mode: str = Form("files"),
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    """
+    mode="files" — ревью всех файлов проекта; mode="git" — только изменений с прошлого скана в этом режиме
+    (хунки git diff с окружающей функцией, ревью добавляется к отчету файла). Без git — как "files".
+    """
+    project_path = _project_path(project_name)
+    plan = await plan_changes(session, project_name, project_path) if mode == "git" else None
+    walk_stats = new_walk_stats()
+    if plan is not None:
+        py_files = plan["full"]
+    else:
+        with span("project.walk") as trace_span:
+            py_files = await run_io(scan_local_project, project_path, walk_stats)
+            trace_span.set(**walk_stats)
 
-    session.commit()
-    return {"scanned_count": len(results), "details": results}
+    # Файлы ревьюятся параллельно (мелкие — пакетами, большие — по фрагментам), порядок сохраняется
+    results = []
+    async with BatchWriter(session) as writer:
+        for outcome in await review_files(session, py_files, api_key=MISTRAL_API_KEY):
+            file_path = outcome["item"]
+            if not outcome["ok"]:
+                writer.add(_scan_report(session, project_name, file_path, outcome["error"], status="failed"))
+                results.append({"file": file_path, "status": "failed", "msg": outcome["error"]})
+                continue
+            if outcome.get("skipped"):
+                results.append({"file": file_path, "status": "skipped", "reason": outcome["skipped"]})
+                continue
+            review_text, cached = outcome["result"]
+            writer.add(_scan_report(session, project_name, file_path, review_text))
+            results.append({"file": file_path, "status": "ok", "cached": cached, "risk": outcome.get("risk")})
+
+    if plan is None:
+        return {"scanned_count": len(results), "details": results, "walk": walk_stats}
+
+    diff_results = await review_changes(session, plan, api_key=MISTRAL_API_KEY)
+    results.extend(diff_results)
+    if plan["complete"] and not any(result["status"] == "failed" for result in results):
+        await mark_reviewed(session, project_name, plan["head"])
+    return {
+        "scanned_count": len(results),
+        "details": results,
+        "git": {"base": plan["base"], "head": plan["head"], "diff_chars": plan["diff_chars"], "full_chars": plan["full_chars"]},
+    }
 
 # --- NEW: Endpoints for Extended Features (Migrate, Tests, Scaffold) ---
 
-@app.post("/api/migrate-code")
-async def migrate_code(
-        file_path: str = Form(...),
-        stack: str = Form("Python 3.11"),
-        current_user: User = Depends(get_current_user)
-):
+async def _migrate_file(file_path: str, stack: str) -> dict:
     if os.path.commonpath([os.path.abspath(file_path), os.path.abspath(BASE_PROJECT_DIR)]) != os.path.abspath(BASE_PROJECT_DIR):
         raise HTTPException(status_code=403, detail="Доступ разрешен только к PycharmProjects")
 
-    code = read_project_file(file_path)
+    with span("file.read"):
+        code = await run_io(read_project_file, file_path)
     if not code: raise HTTPException(status_code=404, detail="Файл не найден")
 
     migrated = await migrate_code_async(code, stack, MISTRAL_API_KEY)
@@ -186,31 +470,62 @@ async def migrate_code(
     file_name = os.path.basename(file_path)
     new_path = os.path.join(dir_name, f"{os.path.splitext(file_name)[0]}_migrated.py")
 
-    if write_project_file(new_path, migrated):
+    with span("file.write"):
+        written = await run_io(write_project_file, new_path, migrated)
+    if written:
         return {"status": "success", "new_file": new_path}
     else:
         raise HTTPException(status_code=500, detail="Ошибка записи")
 
-@app.post("/api/generate-tests")
-async def generate_tests(
-        file_path: str = Form(...),
-        current_user: User = Depends(get_current_user)
-):
-    code = read_project_file(file_path)
+
+async def _generate_tests_for(file_path: str) -> dict:
+    with span("file.read"):
+        code = await run_io(read_project_file, file_path)
     if not code: raise HTTPException(status_code=404, detail="Файл не найден")
 
     project_dir = os.path.dirname(file_path)
     clinerules_path = os.path.join(project_dir, ".clinerules")
-    context = read_project_file(clinerules_path)
+    with span("rules.load"):
+        context = await run_io(read_project_file, clinerules_path)
 
     tests = await generate_tests_async(code, MISTRAL_API_KEY, context)
     test_path = os.path.join(project_dir, f"test_{os.path.basename(file_path)}")
 
-    if write_project_file(test_path, tests):
+    with span("file.write"):
+        written = await run_io(write_project_file, test_path, tests)
+    if written:
         return {"status": "success", "test_file": test_path}
     else:
         raise HTTPException(status_code=500, detail="Ошибка записи")
 
+
+async def _scaffold(description: str, stack: str, project_name: str) -> dict:
+    scaffold = await scaffold_app_async(description, MISTRAL_API_KEY, stack)
+
+    target_dir = os.path.join(BASE_PROJECT_DIR, project_name)
+    os.makedirs(target_dir, exist_ok=True)
+
+    guide_path = os.path.join(target_dir, "scaffold_code.md")
+    await run_io(write_project_file, guide_path, scaffold)
+
+    return {"status": "success", "guide_path": guide_path}
+
+
+@app.post("/api/migrate-code")
+async def migrate_code(
+        file_path: str = Form(...),
+        stack: str = Form("Python 3.11"),
+        current_user: User = Depends(get_current_user)
+):
+    return await _migrate_file(file_path, stack)
+
+@app.post("/api/generate-tests")
+async def generate_tests(
+        file_path: str = Form(...),
+        current_user: User = Depends(get_current_user)
+):
+    return await _generate_tests_for(file_path)
+
 @app.post("/api/scaffold-app")
 async def scaffold_app(
         description: str = Form(...),
@@ -218,23 +533,341 @@ async def scaffold_app(
         project_name: str = Form("my_new_api"),
         current_user: User = Depends(get_current_user)
 ):
-    scaffold = await scaffold_app_async(description, MISTRAL_API_KEY, stack)
+    return await _scaffold(description, stack, project_name)
 
-    target_dir = os.path.join(BASE_PROJECT_DIR, project_name)
-    os.makedirs(target_dir, exist_ok=True)
+# --- Фоновые задачи (очередь в SQLite, ответ сразу с job_id) ---
 
-    guide_path = os.path.join(target_dir, "scaffold_code.md")
-    write_project_file(guide_path, scaffold)
+def _record_scan_item(session: Session, project_name: str, job: ReviewJob, item: JobItem, outcome: dict):
+    if not outcome["ok"]:
+        report = _scan_report(session, project_name, item.file_path, outcome["error"], status="failed")
+        session.add(report)
+        session.flush()
+        finish_job_item(session, job, item, report_id=report.id, error=outcome["error"])
+        return
+    if outcome.get("skipped"):
+        finish_job_item(session, job, item, skipped=True)
+        return
+    review_text, cached = outcome["result"]
+    report = _scan_report(session, project_name, item.file_path, review_text)
+    session.add(report)
+    session.flush()
+    finish_job_item(session, job, item, report_id=report.id, cached=cached)
+
+
+async def _scan_job(session: AsyncSession, job: ReviewJob, params: dict) -> dict:
+    project_name = params["project_name"]
+    py_files = await run_io(scan_local_project, _project_path(project_name))
+    items = {item.file_path: item for item in await run_db(session, add_job_items, job, py_files)}
+    # Каждый готовый файл коммитится сразу (прогресс виден через API); записи идут по очереди через run_db
+    pending = []
+
+    def on_result(outcome: dict):
+        pending.append(asyncio.ensure_future(
+            run_db(session, _record_scan_item, project_name, job, items[outcome["item"]], outcome)
+        ))
 
-    return {"status": "success", "guide_path": guide_path}
+    try:
+        await review_files(session, list(items), api_key=MISTRAL_API_KEY, on_result=on_result)
+    finally:
+        await asyncio.gather(*pending, return_exceptions=True)
+    for future in pending:
+        future.result()
+    return {"project_name": project_name, "scanned_count": job.total}
+
+
+async def _migrate_job(session: AsyncSession, job: ReviewJob, params: dict) -> dict:
+    return await _migrate_file(params["file_path"], params["stack"])
+
+
+async def _generate_tests_job(session: AsyncSession, job: ReviewJob, params: dict) -> dict:
+    return await _generate_tests_for(params["file_path"])
+
+
+async def _scaffold_job(session: AsyncSession, job: ReviewJob, params: dict) -> dict:
+    return await _scaffold(params["description"], params["stack"], params["project_name"])
+
+
+register_job_handler("scan", _scan_job)
+register_job_handler("migrate", _migrate_job)
+register_job_handler("generate_tests", _generate_tests_job)
+register_job_handler("scaffold", _scaffold_job)
+
+
+def _job_view(job: ReviewJob) -> dict:
+    data = job.model_dump()
+    data["params"] = json.loads(job.params)
+    data["result"] = json.loads(job.result) if job.result else None
+    data["progress"] = round(job.done / job.total, 3) if job.total else None
+    return data
+
+
+async def _get_own_job(session: AsyncSession, job_id: int, user: User) -> ReviewJob:
+    job = await session.get(ReviewJob, job_id)
+    if job is None or job.owner != user.username:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def _submit(session: AsyncSession, user: User, kind: str, params: dict):
+    job = await run_db(session, submit_job, kind, params, user.username)
+    return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+
+@app.post("/api/jobs/scan-local-project")
+async def submit_scan_job(
+        project_name: str = Form(...),
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    _project_path(project_name)
+    return await _submit(session, current_user, "scan", {"project_name": project_name})
+
+@app.post("/api/jobs/migrate-code")
+async def submit_migrate_job(
+        file_path: str = Form(...),
+        stack: str = Form("Python 3.11"),
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    return await _submit(session, current_user, "migrate", {"file_path": file_path, "stack": stack})
+
+@app.post("/api/jobs/generate-tests")
+async def submit_generate_tests_job(
+        file_path: str = Form(...),
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    return await _submit(session, current_user, "generate_tests", {"file_path": file_path})
+
+@app.post("/api/jobs/scaffold-app")
+async def submit_scaffold_job(
+        description: str = Form(...),
+        stack: str = Form("FastAPI"),
+        project_name: str = Form("my_new_api"),
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    params = {"description": description, "stack": stack, "project_name": project_name}
+    return await _submit(session, current_user, "scaffold", params)
+
+@app.get("/api/jobs")
+async def list_jobs(
+        limit: int = 20,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    statement = select(ReviewJob).where(ReviewJob.owner == current_user.username).order_by(ReviewJob.id.desc()).limit(limit)
+    return [_job_view(job) for job in (await session.exec(statement)).all()]
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(
+        job_id: int,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    """Статус и прогресс задачи"""
+    return _job_view(await _get_own_job(session, job_id, current_user))
+
+@app.get("/api/jobs/{job_id}/items")
+async def get_job_items(
+        job_id: int,
+        status: Optional[str] = None,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    """Прогресс по файлам и частичные результаты (report_id готовых файлов)"""
+    await _get_own_job(session, job_id, current_user)
+    statement = select(JobItem).where(JobItem.job_id == job_id)
+    if status:
+        statement = statement.where(JobItem.status == status)
+    return (await session.exec(statement.order_by(JobItem.id))).all()
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job_endpoint(
+        job_id: int,
+        current_user: User = Depends(get_current_user),
+        session: AsyncSession = Depends(get_async_session)
+):
+    job = await _get_own_job(session, job_id, current_user)
+    if not await run_db(session, cancel_job, job):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return {"job_id": job_id, "status": "cancelling"}
 
 # --- Улучшенный Агент (Clinerules + Context + Strict Schedule) ---
 
 AGENT_SCAN_INTERVAL = 3600
+async def review_cache_maintenance():
+    """Чистит кэш ревью при старте и раз в REVIEW_CACHE_EVICT_INTERVAL сек (кэш пополняют и API, и Агент)."""
+    while True:
+        try:
+            async with new_async_session() as session:
+                removed = await run_db(session, evict_review_cache)
+            if removed:
+                print(f"🧹 [КЭШ]: Удалено записей кэша ревью: {removed}")
+        except Exception as e:
+            print(f"❌ [КЭШ]: Ошибка очистки кэша ревью: {e}")
+        await asyncio.sleep(REVIEW_CACHE_EVICT_INTERVAL)
+
+
+# AGENT_ENABLED=0 отключает Агента (например, на время нагрузочного теста)
+AGENT_ENABLED = os.environ.get("AGENT_ENABLED", "1") != "0"
+
+async def _agent_load_context(session: AsyncSession, project_name: str, project_path: str) -> dict:
+    """Долгосрочная память: .clinerules проекта и его сжатый дайджест для промптов (см. project_context)."""
+    context = await load_project_context(session, project_name, project_path, MISTRAL_API_KEY)
+    action = context["action"]
+    if action == "generated":
+        print(f"🧠 [АГЕНТ]: {project_name}: .clinerules нет или проект изменился (зависимости/структура). Создал знания заново")
+    elif action == "failed":
+        print(f"⚠️ [АГЕНТ]: Не удалось создать .clinerules для {project_name}, использую прежние правила")
+    elif action == "kept_edited":
+        print(f"✋ [АГЕНТ]: {project_name}: проект изменился, но .clinerules правили вручную — не перезаписываю")
+    elif action != "memory":
+        print(f"📖 [АГЕНТ]: Использую существующие .clinerules для {project_name}")
+    return context
+
+
+def _rules_prompt(context: dict) -> str:
+    return f"Rules: {context['digest']}\n" if context["digest"] else ""
+
+
+def _report_rules_savings(project_name: str, context: dict, sent: int):
+    saved = record_prompt_savings(context, sent)
+    if sent:
+        print(f"🧾 [АГЕНТ]: {project_name}: правила {context['rules_tokens']} → {context['digest_tokens']} ток. на запрос, "
+              f"сэкономлено ~{saved} ток. на {sent} файлах")
+
+
+# Для /metrics
+agent_cycle_latency = Histogram("agent_cycle_duration_seconds", "Full agent pass over all projects", (), SLOW_BUCKETS)
+agent_cycle_files = Gauge("agent_last_cycle_files", "Files in the last full agent cycle by result", ("result",))
+agent_files = Counter("agent_files_total", "Files seen by the agent by result (skipped = unchanged, triaged_out = not worth a review)", ("result",))
+agent_errors = Counter("agent_cycle_errors_total", "Agent cycles aborted by an error")
+agent_watch_queue = Gauge("agent_watch_queue_depth", "File system events waiting for the agent (watch mode)")
+
+
+async def _agent_review_project(session: AsyncSession, project_name: str, project_path: str, py_files: List[str], prune: bool = True) -> dict:
+    """
+    Ревьюит только новые/измененные файлы проекта (по манифесту). Отчеты пишутся
+    по мере готовности и коммитятся пачками по DB_COMMIT_EVERY.
+    Возвращает счетчики файлов: scanned, skipped (не менялись), triaged_out (отсеяны triage), reviewed, failed.
+    """
+    with span("manifest.detect", files=len(py_files)):
+        changed = await detect_changes(session, project_name, py_files, prune=prune)
+        # Обновления манифеста коммитим до запросов к Mistral, чтобы не держать блокировку записи
+        await session.commit()
+    counts = {"scanned": len(py_files), "skipped": len(py_files) - len(changed), "triaged_out": 0, "reviewed": 0, "failed": 0}
+    agent_files.inc("skipped", amount=counts["skipped"])
+    if not changed:
+        print(f"⏭️ [АГЕНТ]: {project_name}: изменений нет")
+        return counts
+    print(f"🔍 [АГЕНТ]: {project_name}: изменено {len(changed)} из {len(py_files)} файлов")
+
+    with span("rules.load") as rules_span:
+        context = await _agent_load_context(session, project_name, project_path)
+        rules_span.set(action=context["action"], rules_tokens=context["rules_tokens"], digest_tokens=context["digest_tokens"])
+
+    sent = 0
+    async with BatchWriter(session) as writer:
+        def on_result(outcome: dict):
+            file_path = outcome["item"]
+            if not outcome["ok"]:
+                # В манифест не пишем: файл попадет в следующий цикл
+                print(f"Error analyzing {file_path}: {outcome['error']}")
+                counts["failed"] += 1
+                agent_files.inc("failed")
+                return
+            writer.merge(manifest_entry(project_name, file_path, changed[file_path]))
+            if outcome.get("skipped"):
+                # Пустой/сгенерированный файл: в Mistral не отправлялся, отчета нет
+                counts["triaged_out"] += 1
+                agent_files.inc("triaged_out")
+                return
+            counts["reviewed"] += 1
+            agent_files.inc("reviewed")
+            review, cached = outcome["result"]
+            if cached:
+                # Файл не менялся с прошлого ревью: отчет уже есть, дубликат не пишем
+                return
+            nonlocal sent
+            sent += 1
+            writer.add(new_report(
+                session,
+                review,
+                project_name=project_name,
+                file_path=file_path,
+                content_type="code",
+                summary="Agent Scan (Context Aware)",
+                status="completed"
+            ))
+
+        await review_files(
+            session,
+            list(changed),
+            rules=context["digest"],
+            context=_rules_prompt(context),
+            api_key=MISTRAL_API_KEY,
+            on_result=on_result
+        )
+    _report_rules_savings(project_name, context, sent)
+    return counts
+
+
+async def _agent_review_git(session: AsyncSession, project_name: str, project_path: str, plan: dict) -> dict:
+    """
+    Режим AGENT_REVIEW_MODE=git: новые файлы и файлы без отчета ревьюятся целиком (по манифесту),
+    остальные измененные — только хунки git diff с окружающей функцией (ReviewUpdate к отчету файла).
+    Коммит запоминается, только если все отревьюено: иначе те же изменения попадут в следующий цикл.
+    """
+    counts = await _agent_review_project(session, project_name, project_path, plan["full"],
+                                          prune=plan["base"] is None or not plan["complete"])
+    if plan["diffs"]:
+        counts["scanned"] += len(plan["diffs"])
+        with span("rules.load"):
+            context = await _agent_load_context(session, project_name, project_path)
+        with span("review.diff", files=len(plan["diffs"]), diff_chars=plan["diff_chars"], full_chars=plan["full_chars"]):
+            results = await review_changes(session, plan, rules=context["digest"], context=_rules_prompt(context), api_key=MISTRAL_API_KEY)
+        _report_rules_savings(project_name, context, sum(result["status"] == "updated" for result in results))
+        for result in results:
+            outcome = {"updated": "reviewed", "cached": "skipped", "failed": "failed"}[result["status"]]
+            counts[outcome] += 1
+            agent_files.inc(outcome)
+            if result["status"] == "failed":
+                print(f"Error analyzing {result['file']}: {result['msg']}")
+        print(f"✂️ [АГЕНТ]: {project_name}: {len(plan['diffs'])} файлов по diff, "
+              f"{plan['diff_chars']} символов кода в промптах вместо {plan['full_chars']}")
+    if plan["complete"] and not counts["failed"]:
+        await mark_reviewed(session, project_name, plan["head"])
+    return counts
+
+
+async def _agent_watch(queue: asyncio.Queue):
+    """Режим watch: обрабатывает события ФС до следующего полного обхода (страховка от пропущенных событий)."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + AGENT_SCAN_INTERVAL
+    while (remaining := deadline - loop.time()) > 0:
+        try:
+            by_project = await asyncio.wait_for(drain_changes(queue, BASE_PROJECT_DIR), timeout=remaining)
+        except asyncio.TimeoutError:
+            return
+        with start_trace("agent.watch", projects=len(by_project)):
+            async with new_async_session() as session:
+                for project_name, paths in by_project.items():
+                    project_path = os.path.join(BASE_PROJECT_DIR, project_name)
+                    with span("agent.project", project=project_name) as trace_span:
+                        trace_span.set(**await _agent_review_project(session, project_name, project_path, paths, prune=False))
+
 
 async def autonomous_agent_loop():
     print(f"🤖 [АГЕНТ]: Запущен. Строго контролирую {BASE_PROJECT_DIR}")
 
+    watch_queue = None
+    if AGENT_WATCH_MODE:
+        watch_queue = asyncio.Queue()
+        agent_watch_queue.set_function(lambda: {(): watch_queue.qsize()})
+        asyncio.create_task(watch_for_changes(BASE_PROJECT_DIR, watch_queue))
+        print("👀 [АГЕНТ]: Режим watch: реагирую на изменения файлов, полный обход раз в интервал")
+
     while True:
         try:
             if not os.path.exists(BASE_PROJECT_DIR):
@@ -242,62 +875,42 @@ async def autonomous_agent_loop():
                 continue
 
             projects = [d for d in os.listdir(BASE_PROJECT_DIR) if os.path.isdir(os.path.join(BASE_PROJECT_DIR, d))]
-            session = next(get_session())
-
-            for project_name in projects:
-                project_path = os.path.join(BASE_PROJECT_DIR, project_name)
-                clinerules_path = os.path.join(project_path, ".clinerules")
-
-                # 1. Долгосрочная память: Проверка .clinerules
-                context = ""
-                if not os.path.exists(clinerules_path):
-                    print(f"🧠 [АГЕНТ]: .clinerules не найден в {project_name}. Создаю знания...")
-
-                    all_files = []
-                    for root, dirs, files in os.walk(project_path):
-                        for f in files:
-                            all_files.append(os.path.join(root, f))
-
-                    req_path = os.path.join(project_path, "requirements.txt")
-                    requirements = read_project_file(req_path)
-
-                    rules_content = await generate_clinerules_async(all_files, requirements, MISTRAL_API_KEY)
-                    write_project_file(clinerules_path, rules_content)
-                    context = rules_content
-                else:
-                    print(f"📖 [АГЕНТ]: Использую существующие .clinerules для {project_name}")
-                    context = read_project_file(clinerules_path)
-
-                # 2. Сканирование с учетом контекста
-                py_files = scan_local_project(project_path)
-                for file_path in py_files:
-                    try:
-                        code = read_project_file(file_path)
-                        if len(code) > 4000: code = code[:4000]
-
-                        review = await get_code_review_async(
-                            code,
-                            context=f"Rules: {context}\nFile: {file_path}",
-                            api_key=MISTRAL_API_KEY
-                        )
-
-                        report = ReviewReport(
-                            project_name=project_name,
-                            file_path=file_path,
-                            content_type="code",
-                            summary="Agent Scan (Context Aware)",
-                            review_result=review,
-                            status="completed"
-                        )
-                        session.add(report)
-                    except Exception as e:
-                        print(f"Error analyzing {file_path}: {e}")
-
-            session.commit()
-            session.close()
-            print(f"🤖 [АГЕНТ]: Цикл завершен. Пауза {AGENT_SCAN_INTERVAL} сек.")
-            await asyncio.sleep(AGENT_SCAN_INTERVAL)
+            started = time.perf_counter()
+            cycle = {"scanned": 0, "skipped": 0, "triaged_out": 0, "reviewed": 0, "failed": 0}
+            with start_trace("agent.cycle", projects=len(projects)) as root, profiler.agent():
+                async with new_async_session() as session:
+                    for project_name in projects:
+                        project_path = os.path.join(BASE_PROJECT_DIR, project_name)
+                        with span("agent.project", project=project_name) as trace_span:
+                            plan = None
+                            if AGENT_REVIEW_MODE == "git":
+                                plan = await plan_changes(session, project_name, project_path)
+                            if plan is not None:
+                                counts = await _agent_review_git(session, project_name, project_path, plan)
+                            else:
+                                walk_stats = new_walk_stats()
+                                with span("project.walk") as walk_span:
+                                    py_files = await run_io(scan_local_project, project_path, walk_stats)
+                                    walk_span.set(**walk_stats)
+                                if walk_stats["pruned_dirs"] or walk_stats["skipped"]:
+                                    print(f"🙈 [АГЕНТ]: {project_name}: пропущено папок {walk_stats['pruned_dirs']}, файлов {walk_stats['skipped']}")
+                                counts = await _agent_review_project(session, project_name, project_path, py_files)
+                            trace_span.set(**counts)
+                        for result, count in counts.items():
+                            cycle[result] += count
+                root.set(**cycle)
+            agent_cycle_latency.observe(time.perf_counter() - started)
+            for result, count in cycle.items():
+                agent_cycle_files.set(result, value=count)
+
+            if watch_queue is None:
+                print(f"🤖 [АГЕНТ]: Цикл завершен. Пауза {AGENT_SCAN_INTERVAL} сек.")
+                await asyncio.sleep(AGENT_SCAN_INTERVAL)
+            else:
+                print("🤖 [АГЕНТ]: Цикл завершен. Жду изменений файлов...")
+                await _agent_watch(watch_queue)
 
         except Exception as e:
             print(f"CRITICAL ERROR: {e}")
-            await asyncio.sleep(60)
\ No newline at end of file
+            agent_errors.inc()
+            await asyncio.sleep(60)
@@ -0,0 +1,141 @@
+import os
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session, select, delete
+
+from .db import run_db
+from .executors import run_io
+from .models import FileManifest
+from .walker import ignored_reason
+
+# Режим Агента: "poll" (обход по расписанию) или "watch" (события файловой системы через watchfiles)
+AGENT_WATCH_MODE = os.environ.get("AGENT_WATCH_MODE", "poll").lower() == "watch"
+# Сколько секунд копим события перед обработкой пачки (редактор часто пишет файл несколько раз)
+AGENT_WATCH_DEBOUNCE = float(os.environ.get("AGENT_WATCH_DEBOUNCE", "2"))
+
+
+def _hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(session: Session, project_name: str) -> Dict[str, tuple]:
+    """{путь: (size, mtime_ns, inode, content_hash)} — простые значения, их читает поток пула."""
+    rows = session.exec(
+        select(FileManifest.file_path, FileManifest.size, FileManifest.mtime_ns, FileManifest.inode, FileManifest.content_hash)
+        .where(FileManifest.project_name == project_name)
+    )
+    return {file_path: (size, mtime_ns, inode, content_hash) for file_path, size, mtime_ns, inode, content_hash in rows}
+
+
+def _fingerprint_files(file_paths: List[str], known: Dict[str, tuple]) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """
+    Файловая часть сравнения (stat и sha256, выполняется в пуле потоков):
+    (новые/измененные {путь: отпечаток}, "потроганные" с тем же содержимым {путь: отпечаток}).
+    """
+    changed, touched = {}, {}
+    for file_path in file_paths:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        entry = known.get(file_path)
+        if entry and entry[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            continue
+
+        fingerprint = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "inode": st.st_ino,
+            "content_hash": _hash_file(file_path),
+        }
+        if entry and entry[3] == fingerprint["content_hash"]:
+            # Файл "потрогали" (touch, checkout), но содержимое то же: обновляем метаданные и пропускаем
+            touched[file_path] = fingerprint
+            continue
+        changed[file_path] = fingerprint
+    return changed, touched
+
+
+def _apply_manifest(session: Session, project_name: str, removed: List[str], touched: Dict[str, dict]):
+    for file_path, fingerprint in touched.items():
+        record_file(session, project_name, file_path, fingerprint)
+    for start in range(0, len(removed), 500):  # Лимит параметров SQLite
+        session.exec(delete(FileManifest).where(
+            FileManifest.project_name == project_name, FileManifest.file_path.in_(removed[start:start + 500])
+        ))
+
+
+async def detect_changes(session, project_name: str, file_paths: List[str], prune: bool = True) -> Dict[str, dict]:
+    """
+    Сравнивает файлы с манифестом проекта и возвращает только новые/измененные:
+    {путь: отпечаток}. Файл читается (для хеша), только если изменились size/mtime/inode.
+    Если prune=True, записи удаленных файлов убираются из манифеста. Коммит делает вызывающий код.
+    stat и хеширование идут в пуле потоков, в run_db — только чтение и запись манифеста.
+    """
+    known = await run_db(session, _load_manifest, project_name)
+    changed, touched = await run_io(_fingerprint_files, file_paths, known)
+    removed = sorted(set(known) - set(file_paths)) if prune else []
+    if touched or removed:
+        await run_db(session, _apply_manifest, project_name, removed, touched)
+    return changed
+
+
+def manifest_entry(project_name: str, file_path: str, fingerprint: dict) -> FileManifest:
+    return FileManifest(
+        file_path=file_path,
+        project_name=project_name,
+        reviewed_at=datetime.utcnow(),
+        **fingerprint
+    )
+
+
+def record_file(session: Session, project_name: str, file_path: str, fingerprint: dict):
+    """Запоминает отпечаток файла после успешного ревью. Коммит делает вызывающий код."""
+    session.merge(manifest_entry(project_name, file_path, fingerprint))
+
+
+def project_of(path: str, base_dir: str) -> Optional[str]:
+    """Имя проекта (первая папка под base_dir) для пути к файлу."""
+    rel = os.path.relpath(path, base_dir)
+    if rel.startswith(".."):
+        return None
+    parts = rel.split(os.sep)
+    return parts[0] if len(parts) > 1 else None
+
+
+async def watch_for_changes(base_dir: str, queue: asyncio.Queue):
+    """
+    Следит за base_dir через watchfiles и кладет в очередь пути измененных .py файлов.
+    Требует `pip install watchfiles`; без него возвращает управление сразу.
+    """
+    try:
+        from watchfiles import awatch, Change, PythonFilter
+    except ImportError:
+        print("⚠️ [АГЕНТ]: watchfiles не установлен, режим watch недоступен")
+        return
+
+    async for changes in awatch(base_dir, watch_filter=PythonFilter()):
+        for change, path in changes:
+            if change != Change.deleted:
+                queue.put_nowait(path)
+
+
+async def drain_changes(queue: asyncio.Queue, base_dir: str) -> Dict[str, List[str]]:
+    """Ждет первое событие, затем собирает пачку за AGENT_WATCH_DEBOUNCE сек. Возвращает {проект: [пути]}."""
+    paths = {await queue.get()}
+    await asyncio.sleep(AGENT_WATCH_DEBOUNCE)
+    while not queue.empty():
+        paths.add(queue.get_nowait())
+
+    by_project: Dict[str, List[str]] = {}
+    for path in sorted(paths):
+        project_name = project_of(path, base_dir)
+        if project_name and os.path.isfile(path) and ignored_reason(os.path.join(base_dir, project_name), path) is None:
+            by_project.setdefault(project_name, []).append(path)
+    return by_project
@@ -0,0 +1,177 @@
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlmodel import Session
+
+# Метрики процесса в текстовом формате Prometheus (GET /metrics).
+# Без prometheus_client: запись — операция со словарем (без блокировок: все пишется из event loop),
+# текст собирается только при запросе /metrics.
+
+# Если задан — /metrics требует заголовок Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Границы корзин гистограмм (сек)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Текущее значение. set_function — значение считается при каждом запросе /metrics."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.function: Optional[Callable[[], Dict[tuple, float]]] = None
+
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set_function(self, function: Callable[[], Dict[tuple, float]]):
+        """function() -> {кортеж меток: значение}"""
+        self.function = function
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            self.values = dict(self.function())
+        return super().samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики по корзинам (+Inf последней), сумма]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {repr(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- HTTP ---
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Time until the response is ready (streams: until headers)", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "Requests being handled right now", ("method", "route"))
+
+
+class MetricsRoute(APIRoute):
+    """
+    Класс маршрутов FastAPI, который меряет каждый запрос. Шаблон пути маршрута известен
+    заранее — поиск маршрута по URL на каждый запрос (как в middleware) не нужен.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def measured_handler(request):
+            labels = (request.method, route)
+            http_in_flight.inc(*labels)
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            finally:
+                http_in_flight.dec(*labels)
+                http_latency.observe(time.perf_counter() - started, *labels)
+                http_requests.inc(request.method, route, status)
+
+        return measured_handler
+
+
+# --- БД ---
+db_commit_latency = Histogram("db_commit_duration_seconds", "Session commit time: flush + COMMIT (async: including the write queue)", ("driver",))
+
+
+@event.listens_for(Session, "before_commit")
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None and session.bind is not None:
+        db_commit_latency.observe(time.perf_counter() - started, session.bind.dialect.driver)
@@ -0,0 +1,53 @@
+"""
+Перевод существующей БД на хранение текстов ревью в reviewblob (сжатие + дедупликация).
+
+    python -m app.migrate_blobs --db ./database.db [--batch 1000] [--gc] [--vacuum]
+
+То же самое выполняется автоматически при старте приложения; отдельный запуск удобен для
+больших БД (прогресс, VACUUM для возврата места на диске) и для сборки мусора после удаления
+отчетов в админке (--gc).
+"""
+import argparse
+import os
+
+from sqlmodel import Session
+
+from .db import make_engine, init_db
+from .blobs import migrate_inline_reviews, gc_blobs, storage_stats
+from .search import ensure_search_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate review texts to the compressed reviewblob table")
+    parser.add_argument("--db", default="./database.db", help="Путь к файлу SQLite")
+    parser.add_argument("--batch", type=int, default=1000, help="Отчетов на одну транзакцию")
+    parser.add_argument("--gc", action="store_true", help="Удалить блобы, на которые не ссылается ни один отчет")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM после переноса (вернуть место на диске)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} not found")
+    size_before = os.path.getsize(args.db)
+    engine = make_engine(f"sqlite:///{args.db}")
+
+    migrate_inline_reviews(engine, batch=args.batch)
+    init_db(engine)
+    ensure_search_index(engine)
+
+    with Session(engine) as session:
+        if args.gc:
+            print(f"🧹 Удалено блобов без ссылок: {gc_blobs(session)}")
+        stats = storage_stats(session)
+    if args.vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    engine.dispose()
+
+    ratio = stats["logical_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0
+    print(f"Отчетов: {stats['reports']}, уникальных текстов: {stats['blobs']} ({stats['codec']})")
+    print(f"Тексты ревью: {stats['logical_bytes'] / 1024:.0f} KB -> {stats['stored_bytes'] / 1024:.0f} KB (x{ratio:.1f})")
+    print(f"Файл БД: {size_before / 1024 ** 2:.1f} MB -> {os.path.getsize(args.db) / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from typing import Optional
+from typing import List, Optional
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 from datetime import datetime
 
@@ -8,11 +9,118 @@ class User(SQLModel, table=True):
     hashed_password: str
 
 class ReviewReport(SQLModel, table=True):
+    # Лента отчетов проекта: фильтр по проекту + сортировка по дате одним индексом
+    __table_args__ = (Index("ix_reviewreport_project_created", "project_name", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    project_name: str
-    file_path: str
+    project_name: str = Field(index=True)
+    file_path: str = Field(index=True)
     content_type: str # "code" или "pdf"
     summary: str # Краткое содержание (генерация)
-    review_result: str # Ответ от Mistral
-    status: str = "pending" # pending, completed, failed
-    created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    review_hash: str = Field(foreign_key="reviewblob.hash", index=True) # Ответ от Mistral (ReviewBlob)
+    status: str = Field(default="pending", index=True) # pending, completed, failed
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class ReviewBlob(SQLModel, table=True):
+    """Текст ревью: хранится один раз на уникальный текст, сжатым (см. app/blobs.py)."""
+    hash: str = Field(primary_key=True) # sha256 исходного текста
+    codec: str # "zstd", "zlib" или "none" (короткий текст без сжатия)
+    data: bytes
+    size: int # Длина исходного текста в байтах (UTF-8)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ReviewReportListItem(SQLModel):
+    """Строка списка отчетов: без текста ревью (он отдается только в /api/reports/{id})."""
+    id: int
+    project_name: str
+    file_path: str
+    content_type: str
+    summary: str
+    status: str
+    created_at: datetime
+
+class ReviewUpdateDetail(SQLModel):
+    """Ревью изменений файла по git diff (см. ReviewUpdate)."""
+    id: int
+    base_commit: str
+    head_commit: str
+    hunks: int
+    created_at: datetime
+    review_result: str
+
+class ReviewReportDetail(ReviewReportListItem):
+    review_result: str
+    updates: List[ReviewUpdateDetail] = []
+
+class ReviewCache(SQLModel, table=True):
+    """Кэш ревью: ключ = хеш (код, .clinerules, версия промпта, модель)."""
+    key: str = Field(primary_key=True)
+    review_result: str
+    model_name: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    hits: int = 0
+
+class FileManifest(SQLModel, table=True):
+    """Снимок файла на момент последнего ревью Агентом (для инкрементального скана)."""
+    file_path: str = Field(primary_key=True)
+    project_name: str = Field(index=True)
+    size: int
+    mtime_ns: int
+    inode: int
+    content_hash: str
+    reviewed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ProjectGitState(SQLModel, table=True):
+    """Последний отревьюенный коммит проекта (инкрементальное ревью по git diff, app/incremental.py)."""
+    project_name: str = Field(primary_key=True)
+    last_commit: str
+    reviewed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ProjectRules(SQLModel, table=True):
+    """Отпечаток проекта (requirements.txt + структура), для которого сгенерирован .clinerules (app/project_context.py)."""
+    project_name: str = Field(primary_key=True)
+    fingerprint: str
+    # sha256 текста .clinerules на момент генерации: отличается — файл правили руками, не перезаписываем
+    rules_hash: str
+    generated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ReviewUpdate(SQLModel, table=True):
+    """Ревью измененных фрагментов файла (base_commit -> head_commit), привязанное к его отчету."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    report_id: int = Field(foreign_key="reviewreport.id", index=True)
+    base_commit: str
+    head_commit: str
+    hunks: int
+    review_hash: str = Field(foreign_key="reviewblob.hash", index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ReviewJob(SQLModel, table=True):
+    """Фоновая задача (скан, миграция, тесты, скаффолдинг). Очередь хранится в той же SQLite."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(index=True)  # scan, migrate, generate_tests, scaffold
+    params: str  # JSON с аргументами задачи
+    owner: str
+    status: str = Field(default="queued", index=True)  # queued, running, completed, failed, cancelled
+    total: int = 0
+    done: int = 0
+    result: Optional[str] = None  # JSON с итогом задачи
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class JobItem(SQLModel, table=True):
+    """Прогресс задачи по отдельному файлу."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: int = Field(index=True, foreign_key="reviewjob.id")
+    file_path: str
+    status: str = "pending"  # pending, ok, error, skipped (отсеян triage)
+    report_id: Optional[int] = None
+    cached: bool = False
+    error: Optional[str] = None
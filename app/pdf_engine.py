@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple
+
+import pypdf
+
+from .executors import run_io, run_cpu, CPU_WORKERS
+
+# Лимиты: размер файла, число страниц и объем извлеченного текста
+PDF_MAX_BYTES = int(os.environ.get("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", "500"))
+PDF_MAX_CHARS = int(os.environ.get("PDF_MAX_CHARS", "2000000"))
+# Минимум страниц на один диапазон: каждый процесс заново открывает PDF, мелкие диапазоны невыгодны
+PDF_PAGES_PER_CHUNK = int(os.environ.get("PDF_PAGES_PER_CHUNK", "25"))
+
+# Последние обработанные документы с таймингами (для поиска самых тяжелых)
+pdf_timings = deque(maxlen=200)
+
+# (номер страницы с 1, текст, секунды на страницу)
+PageText = Tuple[int, str, float]
+
+
+class PdfLimitError(ValueError):
+    """PDF превышает допустимый размер."""
+
+
+def check_pdf_size(pdf_path: str):
+    size = os.path.getsize(pdf_path)
+    if size > PDF_MAX_BYTES:
+        raise PdfLimitError(f"PDF is too large: {size} bytes (limit {PDF_MAX_BYTES})")
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    with open(pdf_path, "rb") as f:
+        return len(pypdf.PdfReader(f).pages)
+
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> List[PageText]:
+    """Извлекает текст страниц [start, stop). Выполняется в отдельном процессе."""
+    pages = []
+    with open(pdf_path, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        for index in range(start, min(stop, len(reader.pages))):
+            t0 = time.perf_counter()
+            try:
+                text = reader.pages[index].extract_text() or ""
+            except Exception as e:
+                text = f"[Error reading page {index + 1}: {e}]"
+            pages.append((index + 1, text, time.perf_counter() - t0))
+    return pages
+
+
+async def stream_pdf_pages(pdf_path: str, total_pages: Optional[int] = None) -> AsyncIterator[PageText]:
+    """
+    Отдает страницы по порядку по мере готовности. Диапазоны страниц разбираются
+    параллельно в пуле процессов (в работе не больше 2 * CPU_WORKERS диапазонов).
+    """
+    check_pdf_size(pdf_path)
+    if total_pages is None:
+        total_pages = await run_io(pdf_page_count, pdf_path)
+    pages_to_read = min(total_pages, PDF_MAX_PAGES)
+    chunk = max(PDF_PAGES_PER_CHUNK, -(-pages_to_read // (2 * CPU_WORKERS)))
+    ranges = [(start, min(start + chunk, pages_to_read)) for start in range(0, pages_to_read, chunk)]
+
+    in_flight = deque()
+    pending = iter(ranges)
+    try:
+        for start, stop in pending:
+            in_flight.append(asyncio.ensure_future(run_cpu(extract_page_range, pdf_path, start, stop)))
+            if len(in_flight) >= 2 * CPU_WORKERS:
+                break
+        while in_flight:
+            for page in await in_flight.popleft():
+                yield page
+            next_range = next(pending, None)
+            if next_range is not None:
+                in_flight.append(asyncio.ensure_future(run_cpu(extract_page_range, pdf_path, *next_range)))
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+async def extract_pdf_text(pdf_path: str, label: Optional[str] = None) -> str:
+    """Текст всего PDF с учетом лимитов PDF_MAX_PAGES / PDF_MAX_CHARS."""
+    started = time.perf_counter()
+    total_pages = 0
+    parts = []
+    chars = 0
+    slowest = (0, 0.0)
+    truncated = False
+
+    check_pdf_size(pdf_path)
+    try:
+        document_pages = await run_io(pdf_page_count, pdf_path)
+        async with aclosing(stream_pdf_pages(pdf_path, document_pages)) as pages:
+            async for page_no, text, seconds in pages:
+                total_pages = page_no
+                if seconds > slowest[1]:
+                    slowest = (page_no, seconds)
+                if chars + len(text) > PDF_MAX_CHARS:
+                    parts.append(text[:PDF_MAX_CHARS - chars])
+                    truncated = True
+                    break
+                parts.append(text)
+                chars += len(text)
+    except Exception as e:
+        return f"Error reading PDF: {e}"
+
+    if truncated or document_pages > total_pages:
+        parts.append(f"... (truncated: {total_pages} of {document_pages} pages)")
+
+    elapsed = time.perf_counter() - started
+    pdf_timings.append({
+        "file": label or os.path.basename(pdf_path),
+        "pages": total_pages,
+        "total_ms": round(elapsed * 1000, 1),
+        "slowest_page": slowest[0],
+        "slowest_page_ms": round(slowest[1] * 1000, 1),
+    })
+    return "\n".join(parts)
+
+
+def slowest_documents(limit: int = 10) -> List[dict]:
+    return sorted(pdf_timings, key=lambda item: item["total_ms"], reverse=True)[:limit]
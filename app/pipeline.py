@@ -0,0 +1,91 @@
+import asyncio
+from typing import Callable, List, Optional
+
+from .batching import is_small_file, review_small_files
+from .chunker import review_source
+from .db import run_db
+from .review_cache import make_cache_key, get_cached_reviews
+from .executors import run_io, run_cpu
+from .scan_engine import run_bounded
+from .utils import read_project_file
+from .tracing import span
+from .triage import TRIAGE_ENABLED, triage_sources, record_triage, order_by_risk
+
+
+async def review_files(
+        session,
+        file_paths: List[str],
+        rules: str = "",
+        context: str = "",
+        api_key: str = "",
+        on_result: Optional[Callable[[dict], None]] = None,
+        triage: bool = TRIAGE_ENABLED
+) -> List[dict]:
+    """
+    Общий конвейер ревью файлов проекта (скан API, фоновые задачи, Агент):
+    локальный разбор (triage) отсеивает пустые/сгенерированные файлы и миграции и ставит
+    рискованные файлы первыми; мелкие файлы идут пакетами, крупные — по одному (большие режутся на фрагменты).
+    Возвращает outcome в порядке file_paths:
+    {"item": путь, "ok": True, "result": (ревью, из_кэша), "risk": оценка},
+    {"item": путь, "ok": True, "result": None, "skipped": причина} (в Mistral не отправлялся)
+    или {"item": путь, "ok": False, "error": "..."}.
+    session — Session (фоновые задачи) или AsyncSession (API, Агент).
+    """
+    outcomes = {}
+    triaged = {}
+
+    def done(outcome: dict):
+        if outcome["item"] in triaged:
+            outcome.setdefault("risk", triaged[outcome["item"]]["score"])
+        outcomes[outcome["item"]] = outcome
+        if on_result is not None:
+            on_result(outcome)
+
+    files = []
+    with span("files.read", files=len(file_paths)):
+        for outcome in await run_bounded(file_paths, lambda path: run_io(read_project_file, path)):
+            if not outcome["ok"]:
+                done(outcome)
+                continue
+            files.append((outcome["item"], outcome["result"]))
+
+    if triage and files:
+        with span("triage", files=len(files)) as trace_span:
+            # ast.parse всего проекта — CPU-работа: в пуле процессов, event loop не блокируется
+            results = await run_cpu(triage_sources, files)
+            record_triage(results)
+            for info in results:
+                if info["skip"]:
+                    done({"item": info["path"], "ok": True, "result": None, "skipped": info["skip"]})
+                else:
+                    triaged[info["path"]] = info
+            files = order_by_risk([item for item in files if item[0] in triaged], triaged)
+            trace_span.set(kept=len(files))
+
+    # Кэш ревью — одним запросом на весь список (повторный скан почти целиком из кэша)
+    with span("cache.lookup", files=len(files)) as trace_span:
+        keys = {path: make_cache_key(code, rules) for path, code in files}
+        cached = await run_db(session, get_cached_reviews, list(set(keys.values())))
+        trace_span.set(hits=len(cached))
+    small, large = [], []
+    for path, code in files:
+        if keys[path] in cached:
+            done({"item": path, "ok": True, "result": (cached[keys[path]], True)})
+        else:
+            (small if is_small_file(code) else large).append((path, code))
+
+    async def review_large(item):
+        path, code = item
+        try:
+            # Ключ файла уже проверен выше: review_source не читает его из кэша повторно
+            result = await review_source(session, code, path, rules=rules, context=context, api_key=api_key, lookup=False)
+            done({"item": path, "ok": True, "result": result})
+        except Exception as e:
+            done({"item": path, "ok": False, "error": str(e)})
+
+    with span("review.llm", small_files=len(small), large_files=len(large)):
+        await asyncio.gather(
+            review_small_files(session, small, rules=rules, context=context, api_key=api_key, on_result=done),
+            run_bounded(large, review_large)
+        )
+    return [outcomes[path] for path in file_paths]
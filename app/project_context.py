@@ -0,0 +1,180 @@
+import os
+import re
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session
+
+from .ai_client import generate_clinerules_async, MistralError
+from .chunker import estimate_tokens, CHARS_PER_TOKEN
+from .db import run_db
+from .executors import run_io
+from .metrics import Counter
+from .models import ProjectRules
+from .utils import read_project_file, write_project_file
+from .walker import walk_project
+
+# Контекст проекта для Агента: .clinerules генерируется заново, только когда меняется отпечаток проекта
+# (requirements.txt + структура папок), а в промпт каждого файла идет не весь текст правил,
+# а сжатый дайджест в пределах RULES_DIGEST_TOKENS. Дайджест живет в памяти между циклами Агента.
+
+RULES_FILE = ".clinerules"
+# Бюджет токенов правил в промпте одного файла
+RULES_DIGEST_TOKENS = int(os.environ.get("RULES_DIGEST_TOKENS", "300"))
+# До какой глубины папки входят в отпечаток структуры
+LAYOUT_DEPTH = 2
+# Столько файлов показываем модели при генерации .clinerules
+RULES_SAMPLE_FILES = 30
+
+_MARKUP_RE = re.compile(r"^\s*(?:#+|[-*+•>]|\d+[.)])\s+")
+_SPACES_RE = re.compile(r"\s+")
+
+# project_name -> контекст (см. load_project_context)
+_contexts: Dict[str, dict] = {}
+
+context_stats = {"generated": 0, "adopted": 0, "kept_edited": 0, "memory_hits": 0, "files": 0, "tokens_saved": 0}
+rules_tokens_saved = Counter(
+    "rules_context_tokens_saved_total",
+    "Estimated prompt tokens saved by sending the rules digest instead of the full .clinerules"
+)
+
+
+def project_fingerprint(project_path: str) -> Tuple[str, List[str]]:
+    """
+    (sha256 от requirements.txt и структуры проекта, первые RULES_SAMPLE_FILES файлов для генерации правил).
+    Структура — папки до LAYOUT_DEPTH и файлы в корне: правка кода отпечаток не меняет, новый пакет — меняет.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(os.path.join(project_path, "requirements.txt"), "rb") as f:
+            digest.update(f.read())
+    except OSError:
+        pass
+    layout = set()
+    sample = []
+    for path in walk_project(project_path, suffixes=None):
+        if len(sample) < RULES_SAMPLE_FILES:
+            sample.append(path)
+        parts = os.path.relpath(path, project_path).split(os.sep)
+        if len(parts) > 1:
+            layout.add("/".join(parts[:min(len(parts) - 1, LAYOUT_DEPTH)]) + "/")
+        elif parts[0] != RULES_FILE:
+            layout.add(parts[0])
+    digest.update(b"\0" + "\n".join(sorted(layout)).encode())
+    return digest.hexdigest(), sample
+
+
+def digest_rules(rules: str, budget: int = RULES_DIGEST_TOKENS) -> str:
+    """Правила без Markdown-разметки, пустых и повторяющихся строк, по порядку — пока помещаются в budget токенов."""
+    lines, seen = [], set()
+    for raw in rules.splitlines():
+        line = _MARKUP_RE.sub("", raw).replace("**", "").replace("`", "")
+        line = _SPACES_RE.sub(" ", line).strip()
+        if not line or line.lower() in seen or not any(char.isalnum() for char in line):
+            continue
+        seen.add(line.lower())
+        lines.append(line)
+
+    digest, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line + "\n")
+        if used + cost > budget:
+            room = (budget - used) * CHARS_PER_TOKEN
+            if room > 40:
+                digest.append(line[:room - 1].rstrip() + "…")
+            break
+        digest.append(line)
+        used += cost
+    return "\n".join(digest)
+
+
+def _rules_stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _save_state(session: Session, project_name: str, fingerprint: str, rules_hash: str):
+    session.merge(ProjectRules(
+        project_name=project_name, fingerprint=fingerprint, rules_hash=rules_hash, generated_at=datetime.utcnow()
+    ))
+    session.commit()
+
+
+def _context(rules: str, fingerprint: str, rules_stat, action: str) -> dict:
+    digest = digest_rules(rules)
+    return {
+        "rules": rules,
+        "digest": digest,
+        "rules_tokens": estimate_tokens(rules) if rules else 0,
+        "digest_tokens": estimate_tokens(digest) if digest else 0,
+        "fingerprint": fingerprint,
+        "rules_stat": rules_stat,
+        "action": action,
+    }
+
+
+async def load_project_context(session, project_name: str, project_path: str, api_key: str = "") -> dict:
+    """
+    {"rules": полный .clinerules, "digest": сжатые правила для промптов, "rules_tokens", "digest_tokens",
+     "action": generated / adopted / kept_edited / loaded / memory / failed}.
+    Правила генерируются, если .clinerules нет или изменился отпечаток проекта (и файл не правили руками).
+    Пока отпечаток и .clinerules не меняются, контекст берется из памяти без чтения файла.
+    """
+    rules_path = os.path.join(project_path, RULES_FILE)
+    fingerprint, sample = await run_io(project_fingerprint, project_path)
+    rules_stat = await run_io(_rules_stat, rules_path)
+    cached = _contexts.get(project_name)
+    if cached and rules_stat is not None and (cached["fingerprint"], cached["rules_stat"]) == (fingerprint, rules_stat):
+        context_stats["memory_hits"] += 1
+        return {**cached, "action": "memory"}
+
+    state = await run_db(session, lambda s: s.get(ProjectRules, project_name))
+    rules = await run_io(read_project_file, rules_path) if rules_stat is not None else ""
+    action = "loaded"
+    if rules_stat is None or (state is not None and state.fingerprint != fingerprint):
+        rules_hash = _text_hash(rules)
+        if rules_stat is not None and state.rules_hash != rules_hash:
+            # Правила правили руками: не перезаписываем, только запоминаем новый отпечаток.
+            # Хэш остается от сгенерированных правил — иначе правка стала бы "своей" и следующая
+            # смена отпечатка перезаписала бы файл
+            action = "kept_edited"
+            context_stats["kept_edited"] += 1
+            rules_hash = state.rules_hash
+        else:
+            requirements = await run_io(read_project_file, os.path.join(project_path, "requirements.txt"))
+            try:
+                rules = await generate_clinerules_async(sample, requirements, api_key)
+            except MistralError:
+                # Отпечаток не сохраняем и в памяти не держим: попробуем в следующем цикле со старыми правилами
+                return _context(rules, fingerprint, rules_stat, "failed")
+            await run_io(write_project_file, rules_path, rules)
+            rules_stat = await run_io(_rules_stat, rules_path)
+            action = "generated"
+            context_stats["generated"] += 1
+            rules_hash = _text_hash(rules)
+        await run_db(session, _save_state, project_name, fingerprint, rules_hash)
+    elif state is None:
+        # .clinerules уже был (создан раньше или вручную): берем как есть
+        action = "adopted"
+        context_stats["adopted"] += 1
+        await run_db(session, _save_state, project_name, fingerprint, _text_hash(rules))
+
+    context = _context(rules, fingerprint, rules_stat, action)
+    _contexts[project_name] = context
+    return context
+
+
+def record_prompt_savings(context: dict, files: int) -> int:
+    """Учитывает files запросов к Mistral с дайджестом вместо полных правил. Возвращает сэкономленные токены."""
+    saved = max(context["rules_tokens"] - context["digest_tokens"], 0) * files
+    context_stats["files"] += files
+    context_stats["tokens_saved"] += saved
+    rules_tokens_saved.inc(amount=saved)
+    return saved
@@ -0,0 +1,134 @@
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class TokenBucket:
+    """Лимит "N единиц в минуту" (запросы или токены). Пополняется непрерывно."""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        # Запрос больше всей емкости все равно пропускаем, когда корзина полная
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float):
+        """Корректировка после ответа (реальный расход токенов отличается от оценки)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD-лимит одновременных запросов: +1 за каждые `limit` успешных ответов,
+    деление пополам на каждый 429.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class CircuitBreaker:
+    """
+    После `threshold` сбоев подряд (5xx, сеть) размыкается на `cooldown` секунд:
+    запросы сразу получают ошибку. Затем пропускает один пробный запрос.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Пробный запрос завершился без вердикта (429, отмена): следующий запрос снова станет пробным."""
+        self.probing = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с полным джиттером (0 .. base * 2^attempt)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After бывает числом секунд или HTTP-датой."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,131 @@
+import os
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, delete, update
+
+from .db import run_db
+from .models import ReviewCache
+from .ai_client import get_code_review_async, MODEL_NAME, REVIEW_PROMPT_VERSION
+from .tracing import span
+
+# Сколько живет запись кэша и сколько записей храним максимум
+REVIEW_CACHE_TTL = int(os.environ.get("REVIEW_CACHE_TTL", str(7 * 24 * 3600)))
+REVIEW_CACHE_MAX_ENTRIES = int(os.environ.get("REVIEW_CACHE_MAX_ENTRIES", "50000"))
+# Как часто API чистит кэш (сек), независимо от того, включен ли Агент
+REVIEW_CACHE_EVICT_INTERVAL = int(os.environ.get("REVIEW_CACHE_EVICT_INTERVAL", "3600"))
+
+# Счетчики за время жизни процесса
+cache_stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def make_cache_key(code: str, rules: str = "") -> str:
+    """Ключ кэша: хеш кода + хеш .clinerules + версия промпта + модель."""
+    parts = [_sha256(code), _sha256(rules or ""), REVIEW_PROMPT_VERSION, MODEL_NAME]
+    return _sha256("|".join(parts))
+
+
+# Запись в кэш коммитится сразу: вызывающий код потом ждет Mistral, и незакоммиченная
+# транзакция держала бы блокировку записи SQLite все это время. При промахе транзакция чтения
+# тоже закрывается: иначе соединение не вернется в пул, пока ждем Mistral
+
+def get_cached_review(session: Session, key: str) -> Optional[str]:
+    entry = session.get(ReviewCache, key)
+    if entry is None or entry.created_at < datetime.utcnow() - timedelta(seconds=REVIEW_CACHE_TTL):
+        session.commit()
+        cache_stats["misses"] += 1
+        return None
+    review = entry.review_result
+    entry.hits += 1
+    entry.last_used_at = datetime.utcnow()
+    session.add(entry)
+    session.commit()
+    cache_stats["hits"] += 1
+    return review
+
+
+def get_cached_reviews(session: Session, keys: List[str]) -> Dict[str, str]:
+    """Как get_cached_review для многих ключей: один SELECT и один UPDATE вместо запросов на каждый файл."""
+    fresh_after = datetime.utcnow() - timedelta(seconds=REVIEW_CACHE_TTL)
+    found = {}
+    for start in range(0, len(keys), 500):  # Лимит параметров SQLite
+        rows = session.exec(select(ReviewCache.key, ReviewCache.review_result).where(
+            ReviewCache.key.in_(keys[start:start + 500]), ReviewCache.created_at >= fresh_after
+        ))
+        found.update({key: review for key, review in rows})
+    if found:
+        session.exec(update(ReviewCache).where(ReviewCache.key.in_(list(found))).values(
+            hits=ReviewCache.hits + 1, last_used_at=datetime.utcnow()
+        ))
+    session.commit()
+    cache_stats["hits"] += len(found)
+    cache_stats["misses"] += len(keys) - len(found)
+    return found
+
+
+def store_reviews(session: Session, reviews: Dict[str, str]):
+    """Кладет ревью в кэш (upsert одним запросом) и коммитит (вместе с остальными изменениями сессии)."""
+    if reviews:
+        now = datetime.utcnow()
+        statement = sqlite_insert(ReviewCache).values([
+            {"key": key, "review_result": review, "model_name": MODEL_NAME, "created_at": now, "last_used_at": now, "hits": 0}
+            for key, review in reviews.items()
+        ])
+        session.exec(statement.on_conflict_do_update(index_elements=["key"], set_={
+            "review_result": statement.excluded.review_result,
+            "model_name": statement.excluded.model_name,
+            "created_at": statement.excluded.created_at,
+            "last_used_at": statement.excluded.last_used_at,
+            "hits": 0,
+        }))
+    session.commit()
+    cache_stats["stored"] += len(reviews)
+
+
+def store_review(session: Session, key: str, review: str):
+    store_reviews(session, {key: review})
+
+
+async def review_with_cache(
+        session,
+        code: str,
+        rules: str = "",
+        context: str = "",
+        api_key: str = "",
+        lookup: bool = True
+) -> Tuple[str, bool]:
+    """
+    Возвращает (текст ревью, взят_из_кэша). При промахе вызывает Mistral и сохраняет ответ.
+    lookup=False — промах уже известен (ключ проверил get_cached_reviews): кэш не читается
+    повторно, и промах не считается дважды.
+    session — Session или AsyncSession (см. run_db).
+    """
+    key = make_cache_key(code, rules)
+    if lookup:
+        with span("cache.lookup") as trace_span:
+            cached = await run_db(session, get_cached_review, key)
+            trace_span.set(hit=cached is not None)
+        if cached is not None:
+            return cached, True
+    review = await get_code_review_async(code, context=context, api_key=api_key)
+    with span("cache.store"):
+        await run_db(session, store_review, key, review)
+    return review, False
+
+
+def evict_review_cache(session: Session) -> int:
+    """Удаляет просроченные записи и самые давно не используемые сверх REVIEW_CACHE_MAX_ENTRIES."""
+    expired_before = datetime.utcnow() - timedelta(seconds=REVIEW_CACHE_TTL)
+    removed = session.exec(delete(ReviewCache).where(ReviewCache.created_at < expired_before)).rowcount or 0
+
+    keep_keys = select(ReviewCache.key).order_by(ReviewCache.last_used_at.desc()).limit(REVIEW_CACHE_MAX_ENTRIES)
+    removed += session.exec(delete(ReviewCache).where(ReviewCache.key.not_in(keep_keys))).rowcount or 0
+
+    session.commit()
+    cache_stats["evicted"] += removed
+    return removed
@@ -0,0 +1,32 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+# Сколько файлов отправляем в LLM одновременно (общий лимит для API и Агента)
+SCAN_CONCURRENCY = int(os.environ.get("SCAN_CONCURRENCY", "8"))
+
+
+async def run_bounded(
+        items: Iterable[Any],
+        worker: Callable[[Any], Awaitable[Any]],
+        concurrency: Optional[int] = None
+) -> List[dict]:
+    """
+    Запускает worker(item) для каждого элемента параллельно, но не больше concurrency одновременно.
+    Возвращает результаты в порядке входных элементов:
+    {"item": ..., "ok": True, "result": ...} или {"item": ..., "ok": False, "error": "..."}.
+    Ошибка одного файла не прерывает остальные.
+    """
+    limit = concurrency or SCAN_CONCURRENCY
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def _run(item):
+        async with semaphore:
+            try:
+                return {"item": item, "ok": True, "result": await worker(item)}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return {"item": item, "ok": False, "error": str(e)}
+
+    return await asyncio.gather(*(_run(item) for item in items))
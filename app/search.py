@@ -0,0 +1,297 @@
+import os
+import re
+import html
+from typing import Dict, List, Optional
+from sqlalchemy import event, text
+from sqlmodel import Session
+
+from .models import ReviewReport
+from .blobs import decompress_blob, load_text
+
+# Полнотекстовый индекс отчетов (SQLite FTS5, contentless: текст ревью хранится только сжатым в reviewblob).
+# Индекс пополняется приложением при flush новых ReviewReport (см. _index_new_reports).
+# Тот же индекс использует поиск Django-админки (admin_panel/core/search.py).
+# Contentless-таблица удаляет строку только по исходным значениям колонок ('delete'), а
+# contentless_delete=1 есть лишь с SQLite 3.43. Поэтому триггеры на reviewreport (срабатывают и
+# для удалений из админки) складывают старые значения в FTS_DELETED_TABLE, а приложение снимает
+# их из индекса (текст — из reviewblob по review_hash) перед индексацией и поиском: удаленный
+# отчет не находится, а переиспользованный rowid не отдает чужие совпадения.
+FTS_TABLE = "reviewreport_fts"
+FTS_DELETED_TABLE = "reviewreport_fts_deleted"
+SEARCH_MAX_LIMIT = 50
+# Частое слово совпадает почти со всеми отчетами, и bm25 пришлось бы считать для каждого.
+# Ранжируем только последние SEARCH_MAX_CANDIDATES совпадений (самые новые отчеты)
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", "5000"))
+SEARCH_REINDEX_BATCH = int(os.environ.get("SEARCH_REINDEX_BATCH", "2000"))
+SNIPPET_TOKENS = 24
+
+# Веса колонок для bm25 (в порядке объявления): совпадение в пути/проекте важнее, чем в тексте ревью.
+# Задаются как ранжирование таблицы по умолчанию, чтобы ORDER BY rank обрабатывался внутри FTS5
+_BM25_WEIGHTS = "1.0, 2.0, 5.0, 3.0"
+_COLUMNS = "review_result, summary, file_path, project_name"
+
+_DDL = f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    {_COLUMNS}, content='', tokenize='unicode61 remove_diacritics 2'
+)"""
+_INSERT = text(f"""INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS})
+    VALUES (:id, :review_result, :summary, :file_path, :project_name)""")
+_LEGACY_TRIGGERS = ("reviewreport_fts_ai", "reviewreport_fts_ad", "reviewreport_fts_au")
+_DELETE = text(f"""INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMNS})
+    VALUES ('delete', :id, :review_result, :summary, :file_path, :project_name)""")
+
+_OLD_VALUES = f"""INSERT INTO {FTS_DELETED_TABLE}(report_id, review_hash, summary, file_path, project_name)
+        VALUES (old.id, old.review_hash, old.summary, old.file_path, old.project_name)"""
+_SYNC_DDL = (
+    f"""CREATE TABLE IF NOT EXISTS {FTS_DELETED_TABLE} (
+        seq INTEGER PRIMARY KEY, report_id INTEGER NOT NULL, review_hash VARCHAR,
+        summary VARCHAR, file_path VARCHAR, project_name VARCHAR
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS reviewreport_fts_sync_ad AFTER DELETE ON reviewreport BEGIN
+        {_OLD_VALUES};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reviewreport_fts_sync_au
+        AFTER UPDATE OF review_hash, summary, file_path, project_name ON reviewreport BEGIN
+        {_OLD_VALUES};
+    END""",
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Файлы БД, для которых создан индекс: сессии других БД (тесты, бенчмарки без FTS) не индексируются.
+# По пути, а не по движку: синхронный и aiosqlite-движок работают с одним файлом
+_indexed_databases = set()
+
+
+def ensure_search_index(engine):
+    """
+    Создает FTS-таблицу и включает индексацию новых отчетов. Индекс старого формата
+    (external content + триггеры, до reviewblob) пересоздается; новый индекс заполняется один раз.
+    """
+    with engine.begin() as conn:
+        for trigger in _LEGACY_TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        existing = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).scalar()
+        if existing is not None and "content=''" not in existing:
+            conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+            existing = None
+        conn.execute(text(_DDL))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25({_BM25_WEIGHTS})')"))
+        for statement in _SYNC_DDL:
+            conn.execute(text(statement))
+        if existing is None:
+            conn.execute(text(f"DELETE FROM {FTS_DELETED_TABLE}"))
+        else:
+            sync_deleted(conn)
+    if existing is None:
+        reindex(engine)
+    _indexed_databases.add(engine.url.database)
+
+
+def reindex(engine) -> int:
+    """Заполняет индекс по всем отчетам (тексты распаковываются пачками)."""
+    indexed = 0
+    last_id = 0
+    with engine.connect() as conn:
+        while True:
+            rows = conn.execute(text("""
+                SELECT r.id, r.summary, r.file_path, r.project_name, b.codec, b.data
+                FROM reviewreport r LEFT JOIN reviewblob b ON b.hash = r.review_hash
+                WHERE r.id > :last_id ORDER BY r.id LIMIT :batch
+            """), {"last_id": last_id, "batch": SEARCH_REINDEX_BATCH}).fetchall()
+            if not rows:
+                break
+            conn.execute(_INSERT, [
+                {
+                    "id": row.id,
+                    "review_result": decompress_blob(row.codec, row.data) if row.data is not None else "",
+                    "summary": row.summary,
+                    "file_path": row.file_path,
+                    "project_name": row.project_name,
+                }
+                for row in rows
+            ])
+            conn.commit()
+            indexed += len(rows)
+            last_id = rows[-1].id
+    if indexed:
+        print(f"🔎 [Search]: Проиндексировано отчетов: {indexed}")
+    return indexed
+
+
+def sync_deleted(conn, skip_ids=()) -> int:
+    """
+    Снимает из индекса удаленные и измененные отчеты (очередь FTS_DELETED_TABLE от триггеров).
+    Измененный отчет индексируется заново, кроме skip_ids (их индексирует вызывающий).
+    """
+    rows = conn.execute(text(f"""
+        SELECT d.report_id, d.summary, d.file_path, d.project_name, b.codec, b.data
+        FROM {FTS_DELETED_TABLE} d LEFT JOIN reviewblob b ON b.hash = d.review_hash
+        WHERE d.seq IN (SELECT MIN(seq) FROM {FTS_DELETED_TABLE} GROUP BY report_id)
+          AND EXISTS (SELECT 1 FROM {FTS_TABLE} WHERE rowid = d.report_id)
+    """)).fetchall()
+    # В индексе лежат значения из самой ранней записи очереди: более поздние не индексировались
+    if rows:
+        conn.execute(_DELETE, [
+            {
+                "id": row.report_id,
+                "review_result": decompress_blob(row.codec, row.data) if row.data is not None else "",
+                "summary": row.summary,
+                "file_path": row.file_path,
+                "project_name": row.project_name,
+            }
+            for row in rows
+        ])
+    changed = conn.execute(text(f"""
+        SELECT r.id, r.summary, r.file_path, r.project_name, b.codec, b.data
+        FROM reviewreport r LEFT JOIN reviewblob b ON b.hash = r.review_hash
+        WHERE r.id IN (SELECT report_id FROM {FTS_DELETED_TABLE})
+    """)).fetchall()
+    changed = [row for row in changed if row.id not in skip_ids]
+    if changed:
+        conn.execute(_INSERT, [
+            {
+                "id": row.id,
+                "review_result": decompress_blob(row.codec, row.data) if row.data is not None else "",
+                "summary": row.summary,
+                "file_path": row.file_path,
+                "project_name": row.project_name,
+            }
+            for row in changed
+        ])
+    conn.execute(text(f"DELETE FROM {FTS_DELETED_TABLE}"))
+    return len(rows)
+
+
+def _has_pending_deletes(conn) -> bool:
+    return conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {FTS_DELETED_TABLE})")).scalar() == 1
+
+
+@event.listens_for(Session, "after_flush")
+def _index_new_reports(session, flush_context):
+    reports = [obj for obj in session.new if isinstance(obj, ReviewReport)]
+    if not reports or session.get_bind().url.database not in _indexed_databases:
+        return
+    conn = session.connection()
+    if _has_pending_deletes(conn):
+        # Сначала снимаем старые записи: новый отчет мог получить rowid удаленного
+        sync_deleted(conn, skip_ids={report.id for report in reports})
+    conn.execute(_INSERT, [
+        {
+            "id": report.id,
+            "review_result": load_text(session, report.review_hash),
+            "summary": report.summary,
+            "file_path": report.file_path,
+            "project_name": report.project_name,
+        }
+        for report in reports
+    ])
+
+
+def to_fts_query(query: str, prefix: bool = True) -> Optional[str]:
+    """
+    Пользовательский ввод -> безопасный запрос FTS5: слова в кавычках (синтаксис FTS
+    не интерпретируется), все слова обязательны, последнее (при prefix) — по префиксу.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    quoted = [f'"{token}"' for token in tokens]
+    if prefix:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def make_snippet(review_text: str, query: str, prefix: bool = True, size: int = SNIPPET_TOKENS) -> str:
+    """
+    Фрагмент текста вокруг первого совпадения, совпавшие слова — в <mark>, остальное экранировано.
+    Contentless-индекс не хранит текст, поэтому snippet() FTS5 недоступен: фрагмент строится здесь.
+    """
+    terms = [token.casefold() for token in _TOKEN_RE.findall(query)]
+    last = terms[-1] if prefix and terms else None
+
+    def matches(word: str) -> bool:
+        word = word.casefold()
+        return word in terms or (last is not None and word.startswith(last))
+
+    tokens = list(_TOKEN_RE.finditer(review_text))
+    first = next((i for i, token in enumerate(tokens) if matches(token.group())), 0)
+    start = max(0, first - size // 4)
+    window = tokens[start:start + size]
+    if not window:
+        return ""
+
+    parts = ["…" if start > 0 else ""]
+    position = window[0].start()
+    for token in window:
+        parts.append(html.escape(review_text[position:token.start()]))
+        word = html.escape(token.group())
+        parts.append(f"<mark>{word}</mark>" if matches(token.group()) else word)
+        position = token.end()
+    if start + size < len(tokens):
+        parts.append("…")
+    return "".join(parts)
+
+
+def _run_search(conn, fts_query: str, limit: int, project: Optional[str]) -> List[dict]:
+    # Граница по rowid: обход списка совпадений с конца без подсчета релевантности
+    lower_bound = conn.execute(
+        text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query ORDER BY rowid DESC LIMIT 1 OFFSET :cap"),
+        {"query": fts_query, "cap": SEARCH_MAX_CANDIDATES}
+    ).scalar()
+    rowid_filter = f"AND {FTS_TABLE}.rowid > :lower_bound" if lower_bound is not None else ""
+    project_filter = "AND r.project_name = :project" if project else ""
+    statement = text(f"""
+        SELECT r.id, r.project_name, r.file_path, r.status, r.created_at, r.review_hash,
+               {FTS_TABLE}.rank AS score
+        FROM {FTS_TABLE}
+        JOIN reviewreport r ON r.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :query {rowid_filter} {project_filter}
+        ORDER BY {FTS_TABLE}.rank
+        LIMIT :limit
+    """)
+    params = {"query": fts_query, "limit": limit, "project": project, "lower_bound": lower_bound}
+    results = []
+    for row in conn.execute(statement, params):
+        item = dict(row._mapping)
+        item["score"] = round(-item["score"], 4)  # bm25 в SQLite: чем меньше, тем лучше
+        results.append(item)
+    return results
+
+
+def _attach_snippets(conn, results: List[dict], query: str):
+    # Распаковываются только тексты найденных отчетов (не больше SEARCH_MAX_LIMIT)
+    hashes = list({item["review_hash"] for item in results})
+    texts: Dict[str, str] = {}
+    if hashes:
+        placeholders = ", ".join(f":h{i}" for i in range(len(hashes)))
+        rows = conn.execute(
+            text(f"SELECT hash, codec, data FROM reviewblob WHERE hash IN ({placeholders})"),
+            {f"h{i}": value for i, value in enumerate(hashes)}
+        )
+        texts = {row.hash: decompress_blob(row.codec, row.data) for row in rows}
+    for item in results:
+        item["snippet"] = make_snippet(texts.get(item.pop("review_hash"), ""), query)
+
+
+def search_reports(session: Session, query: str, limit: int = 20, project: Optional[str] = None) -> List[dict]:
+    """
+    Отчеты по релевантности (bm25) с подсвеченным фрагментом текста ревью (безопасный HTML).
+    Сначала точные слова; если совпадений меньше limit — последнее слово ищется по префиксу
+    (префиксный запрос по частому слову заметно дороже).
+    """
+    exact = to_fts_query(query, prefix=False)
+    if exact is None:
+        return []
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    conn = session.connection()
+    if _has_pending_deletes(conn):
+        sync_deleted(conn)
+        session.commit()
+        conn = session.connection()
+    results = _run_search(conn, exact, limit, project)
+    if len(results) < limit:
+        results = _run_search(conn, to_fts_query(query), limit, project)
+    _attach_snippets(conn, results, query)
+    return results
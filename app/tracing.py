@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import cProfile
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import event
+from sqlmodel import Session
+
+from .metrics import MetricsRoute
+
+# Трассировка запросов: каждый запрос API и цикл Агента — трасса (trace_id), фазы внутри — спаны.
+# Каждый завершенный спан — одна строка JSON в логгер "ai_reviewer.trace" (stdout).
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "1") != "0"
+# Куда сохраняются профили cProfile (снимаются по запросу администратора)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
+
+# Эти маршруты не трассируются и не профилируются (сбор метрик, сами профили)
+UNTRACED_PREFIXES = ("/metrics", "/api/profiling")
+
+trace_logger = logging.getLogger("ai_reviewer.trace")
+if not trace_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+_TRACE_ID_RE = re.compile(r"^[0-9A-Za-z-]{1,64}$")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs", "started")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attrs: dict):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NoopSpan:
+    """Вне трассы (или TRACE_ENABLED=0) спаны ничего не пишут и почти ничего не стоят."""
+    trace_id = None
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def _emit(item: Span, duration: float, error: Optional[BaseException] = None):
+    record = {
+        "ts": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+        "trace_id": item.trace_id,
+        "span_id": item.span_id,
+        "parent_id": item.parent_id,
+        "name": item.name,
+        "duration_ms": round(duration * 1000, 2),
+        "status": "ok" if error is None else "error",
+    }
+    if error is not None:
+        record["error"] = f"{type(error).__name__}: {error}"[:300]
+    record.update(item.attrs)
+    trace_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def _run_span(item: Span):
+    token = _current.set(item)
+    try:
+        yield item
+    except BaseException as e:
+        _emit(item, time.perf_counter() - item.started, e)
+        raise
+    else:
+        _emit(item, time.perf_counter() - item.started)
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, **attrs):
+    """Корневой спан новой трассы. trace_id можно передать снаружи (заголовок X-Trace-Id)."""
+    if not TRACE_ENABLED:
+        yield _NOOP
+        return
+    if not trace_id or not _TRACE_ID_RE.match(trace_id):
+        trace_id = uuid.uuid4().hex
+    with _run_span(Span(trace_id, None, name, attrs)) as root:
+        yield root
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Фаза внутри текущей трассы: `with span("pdf.parse", pages=3) as s: ...; s.set(chars=...)`."""
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+    with _run_span(Span(parent.trace_id, parent.span_id, name, attrs)) as item:
+        yield item
+
+
+# --- Коммиты БД — отдельный спан в текущей трассе ---
+@event.listens_for(Session, "before_commit")
+def _trace_commit_started(session):
+    if _current.get() is not None:
+        session.info["trace_commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _trace_commit_finished(session):
+    started = session.info.pop("trace_commit_started", None)
+    parent = _current.get()
+    if started is not None and parent is not None:
+        item = Span(parent.trace_id, parent.span_id, "db.commit", {})
+        _emit(item, time.perf_counter() - started)
+
+
+# --- Профилирование по запросу администратора ---
+class _ProfileCapture:
+    """
+    Снимает cProfile следующих N запросов API или одного цикла Агента и сохраняет .prof
+    (открывается snakeviz / pstats). cProfile работает на весь поток: пока запрос
+    профилируется, в профиль попадают и параллельные корутины event loop. Запросы, начатые
+    во время чужого замера, не профилируются (в потоке может работать только один профилировщик).
+    """
+
+    def __init__(self):
+        self.remaining_requests = 0
+        self.agent_cycle = False
+        self.active = False
+        self.profile: Optional[cProfile.Profile] = None
+        self.captured = 0
+        self.last_file: Optional[str] = None
+
+    def arm(self, requests: int = 0, agent_cycle: bool = False) -> dict:
+        self.remaining_requests = max(0, requests)
+        self.agent_cycle = agent_cycle
+        self.profile, self.captured = None, 0
+        return self.status()
+
+    def status(self) -> dict:
+        return {
+            "remaining_requests": self.remaining_requests,
+            "agent_cycle": self.agent_cycle,
+            "active": self.active,
+            "captured_requests": self.captured,
+            "last_file": self.last_file,
+        }
+
+    def _save(self, profile: cProfile.Profile, label: str) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{label}.prof")
+        profile.dump_stats(path)
+        self.last_file = path
+        print(f"🔬 [PROFILE]: Профиль сохранен: {path}")
+        return path
+
+    @contextmanager
+    def request(self):
+        """Профилирует запрос, если профилирование запросов включено. Несколько запросов — один файл."""
+        if self.remaining_requests <= 0 or self.active:
+            yield
+            return
+        self.active = True
+        profile = self.profile = self.profile or cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.active = False
+            if profile is self.profile:  # Иначе замер перезапущен через arm() — этот профиль не нужен
+                self.captured += 1
+                self.remaining_requests -= 1
+                if self.remaining_requests <= 0:
+                    self._save(profile, f"requests-{self.captured}")
+                    self.profile = None
+
+    @contextmanager
+    def agent(self):
+        if not self.agent_cycle or self.active:
+            yield
+            return
+        self.active, self.agent_cycle = True, False
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.active = False
+            self._save(profile, "agent-cycle")
+
+
+profiler = _ProfileCapture()
+
+
+def list_profiles() -> List[dict]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return [
+        {"name": entry.name, "size": entry.stat().st_size}
+        for entry in sorted(os.scandir(PROFILE_DIR), key=lambda e: e.name, reverse=True)
+        if entry.name.endswith(".prof")
+    ]
+
+
+class TracedRoute(MetricsRoute):
+    """Маршрут с метриками (MetricsRoute) и трассой на каждый запрос; trace_id возвращается в X-Trace-Id."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if self.path_format.startswith(UNTRACED_PREFIXES):
+            return handler
+        name = f"{','.join(sorted(self.methods))} {self.path_format}"
+
+        async def traced_handler(request):
+            with start_trace(name, trace_id=request.headers.get("X-Trace-Id")) as root, profiler.request():
+                response = await handler(request)
+            if root.trace_id:
+                response.headers["X-Trace-Id"] = root.trace_id
+            return response
+
+        return traced_handler
@@ -0,0 +1,191 @@
+import os
+import re
+import ast
+from typing import Dict, List, Tuple
+
+# Локальный разбор перед ревью: ast + простые сигналы риска, без обращения к Mistral.
+# Пустые/сгенерированные файлы и миграции не отправляются вовсе, остальные идут в ревью
+# по убыванию риска (сначала eval, subprocess, SQL из строк, bare except и сложный код).
+
+# TRIAGE_ENABLED=0 — ревьюить все файлы в исходном порядке
+TRIAGE_ENABLED = os.environ.get("TRIAGE_ENABLED", "1") != "0"
+# Файл без функций/классов и сигналов риска короче этого (строк кода) не ревьюится
+TRIAGE_MIN_LINES = int(os.environ.get("TRIAGE_MIN_LINES", "5"))
+
+# Вес сигнала в оценке риска
+RISK_WEIGHTS = {
+    "eval_exec": 10,
+    "shell": 10,
+    "subprocess": 6,
+    "sql_string": 8,
+    "unsafe_deserialization": 8,
+    "bare_except": 4,
+    "swallowed_exception": 3,
+    "hardcoded_secret": 6,
+    "tls_verify_off": 6,
+    "syntax_error": 5,
+}
+# Множитель оценки для кода, где ошибки обходятся дешевле (тесты, настройки)
+DOWNGRADE_FACTOR = 0.3
+
+_GENERATED_RE = re.compile(r"generated by|do not edit|autogenerated|auto-generated", re.IGNORECASE)
+_MIGRATION_RE = re.compile(r"(^|/)migrations/\d{4}_\w+\.py$")
+_SQL_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\s", re.IGNORECASE)
+_SECRET_NAME_RE = re.compile(r"(password|passwd|secret|api_key|token)", re.IGNORECASE)
+
+_SUBPROCESS_CALLS = {"subprocess.run", "subprocess.call", "subprocess.Popen", "subprocess.check_output",
+                     "subprocess.check_call", "os.system", "os.popen"}
+_DESERIALIZE_CALLS = {"pickle.loads", "pickle.load", "marshal.loads", "yaml.load", "dill.loads"}
+_BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.With, ast.AsyncWith,
+                 ast.ExceptHandler, ast.IfExp, ast.comprehension, ast.Assert, ast.Match)
+
+triage_stats = {"files": 0, "skipped": {}, "downgraded": 0}
+
+
+def _dotted(node: ast.AST) -> str:
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def _is_sql_text(node: ast.AST) -> bool:
+    """Строка SQL, собранная из кусков (f-string, %, .format, +) — кандидат в SQL-инъекцию."""
+    if isinstance(node, ast.JoinedStr):
+        head = node.values[0] if node.values else None
+        return isinstance(head, ast.Constant) and isinstance(head.value, str) and bool(_SQL_RE.match(head.value))
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mod, ast.Add)):
+        left = node.left
+        return isinstance(left, ast.Constant) and isinstance(left.value, str) and bool(_SQL_RE.match(left.value))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "format":
+        base = node.func.value
+        return isinstance(base, ast.Constant) and isinstance(base.value, str) and bool(_SQL_RE.match(base.value))
+    return False
+
+
+def _complexity(function: ast.AST) -> int:
+    """Цикломатическая сложность: 1 + ветвления + дополнительные операнды and/or."""
+    complexity = 1
+    for child in ast.walk(function):
+        if isinstance(child, _BRANCH_NODES):
+            complexity += 1
+        elif isinstance(child, ast.BoolOp):
+            complexity += len(child.values) - 1
+    return complexity
+
+
+def _signals(tree: ast.AST) -> Tuple[Dict[str, int], int, int]:
+    """(сигналы риска, максимальная цикломатическая сложность функции, число функций и классов)"""
+    signals: Dict[str, int] = {}
+
+    def hit(name: str):
+        signals[name] = signals.get(name, 0) + 1
+
+    definitions = 0
+    max_complexity = 0
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            definitions += 1
+            if not isinstance(node, ast.ClassDef):
+                max_complexity = max(max_complexity, _complexity(node))
+        elif isinstance(node, ast.Call):
+            name = _dotted(node.func)
+            if name in ("eval", "exec", "compile", "__import__"):
+                hit("eval_exec")
+            elif name in _SUBPROCESS_CALLS:
+                hit("subprocess")
+            elif name in _DESERIALIZE_CALLS:
+                hit("unsafe_deserialization")
+            for keyword in node.keywords:
+                if keyword.arg == "shell" and isinstance(keyword.value, ast.Constant) and keyword.value.value is True:
+                    hit("shell")
+                elif keyword.arg == "verify" and isinstance(keyword.value, ast.Constant) and keyword.value.value is False:
+                    hit("tls_verify_off")
+            if node.args and _is_sql_text(node.args[0]):
+                hit("sql_string")
+        elif isinstance(node, ast.ExceptHandler):
+            if node.type is None:
+                hit("bare_except")
+            elif len(node.body) == 1 and isinstance(node.body[0], ast.Pass):
+                hit("swallowed_exception")
+        elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            if node.value.value and any(isinstance(t, ast.Name) and _SECRET_NAME_RE.search(t.id) for t in node.targets):
+                hit("hardcoded_secret")
+    return signals, max_complexity, definitions
+
+
+def _code_lines(code: str) -> int:
+    return sum(1 for line in code.splitlines() if line.strip() and not line.lstrip().startswith("#"))
+
+
+def _is_docstring_or_import(node: ast.stmt) -> bool:
+    return isinstance(node, (ast.Import, ast.ImportFrom)) or (
+        isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+    )
+
+
+def triage_source(path: str, code: str) -> dict:
+    """
+    {"path", "skip": причина или None, "score": риск (больше — раньше в ревью), "signals": {...},
+    "complexity", "lines", "downgraded"}.
+    """
+    normalized = path.replace(os.sep, "/")
+    name = os.path.basename(normalized)
+    lines = _code_lines(code)
+    info = {"path": path, "skip": None, "score": 0.0, "signals": {}, "complexity": 0, "lines": lines, "downgraded": False}
+
+    if lines == 0:
+        info["skip"] = "empty"
+        return info
+    if _GENERATED_RE.search("\n".join(code.splitlines()[:5])) or name.endswith(("_pb2.py", "_pb2_grpc.py")):
+        info["skip"] = "generated"
+        return info
+    if _MIGRATION_RE.search(normalized):
+        info["skip"] = "migration"
+        return info
+
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        # Не разобрался — пусть смотрит модель, но сложность не оцениваем
+        info["signals"] = {"syntax_error": 1}
+        info["score"] = float(RISK_WEIGHTS["syntax_error"] + lines / 50)
+        return info
+
+    signals, complexity, definitions = _signals(tree)
+    if not signals and all(_is_docstring_or_import(node) for node in tree.body):
+        info["skip"] = "imports_only"
+        return info
+    if not signals and definitions == 0 and lines < TRIAGE_MIN_LINES:
+        info["skip"] = "trivial"
+        return info
+
+    score = sum(RISK_WEIGHTS[signal] * count for signal, count in signals.items()) + complexity + lines / 50
+    downgraded = name.startswith("test_") or name.endswith("_test.py") or name in ("conftest.py", "settings.py") \
+        or "/tests/" in normalized
+    if downgraded:
+        score *= DOWNGRADE_FACTOR
+    info.update(signals=signals, complexity=complexity, score=round(score, 2), downgraded=downgraded)
+    return info
+
+
+def triage_sources(files: List[Tuple[str, str]]) -> List[dict]:
+    """triage_source для списка (путь, код). Уровень модуля — чтобы выполнять в пуле процессов (run_cpu)."""
+    return [triage_source(path, code) for path, code in files]
+
+
+def record_triage(results: List[dict]):
+    for info in results:
+        triage_stats["files"] += 1
+        if info["skip"]:
+            triage_stats["skipped"][info["skip"]] = triage_stats["skipped"].get(info["skip"], 0) + 1
+        elif info["downgraded"]:
+            triage_stats["downgraded"] += 1
+
+
+def order_by_risk(files: List[Tuple[str, str]], results: Dict[str, dict]) -> List[Tuple[str, str]]:
+    """Файлы по убыванию риска; при равной оценке — в исходном порядке."""
+    return sorted(files, key=lambda item: -results[item[0]]["score"])
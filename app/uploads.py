@@ -0,0 +1,164 @@
+import os
+import codecs
+import shutil
+import tempfile
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from .executors import run_io
+from .pdf_engine import PDF_MAX_BYTES, extract_pdf_text
+from .tracing import span
+
+# Загрузки для ревью читаются потоково, кусками по UPLOAD_CHUNK_BYTES, с лимитом размера.
+# Multipart-парсер Starlette уже держит файл в SpooledTemporaryFile (в памяти до 1 МБ, дальше на диске),
+# поэтому код декодируется прямо из него, без копии. PDF копируется один раз — в закрытую временную
+# папку: страницы разбираются в пуле процессов, и каждый процесс открывает файл по пути.
+
+# Загрузка больше этого размера отклоняется (413); для PDF действует и PDF_MAX_BYTES
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# Сколько символов текста загрузки идет в ревью (остальное отбрасывается, как у PDF_MAX_CHARS)
+UPLOAD_MAX_CHARS = int(os.environ.get("UPLOAD_MAX_CHARS", "2000000"))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Запас сверх UPLOAD_MAX_BYTES на multipart-обвязку тела запроса (границы, заголовки частей)
+UPLOAD_FORM_OVERHEAD_BYTES = int(os.environ.get("UPLOAD_FORM_OVERHEAD_BYTES", str(64 * 1024)))
+# Папка для копий PDF; пусто — своя папка (права 0700) в системной временной
+UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR", "")
+
+_upload_dir: Optional[str] = None
+
+
+class UploadTooLargeError(ValueError):
+    """Загрузка превышает допустимый размер."""
+
+
+def _too_large(size: int, limit: int) -> UploadTooLargeError:
+    return UploadTooLargeError(f"Upload is too large: {size} bytes (limit {limit})")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Отклоняет слишком большую загрузку (413) до разбора multipart: по Content-Length — сразу,
+    без него (chunked) — как только полученное тело превысит лимит. Иначе Starlette сначала
+    целиком записал бы файл во временный, и только потом read_upload увидел бы его размер.
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        limit = UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse(status_code=413, content={"detail": str(_too_large(int(content_length), limit))})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI пробрасывает HTTPException из чтения тела как есть
+                    raise HTTPException(status_code=413, detail=str(_too_large(received, limit)))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def upload_dir() -> str:
+    """Закрытая временная папка процесса (имена файлов уникальны — одинаковые загрузки не пересекаются)."""
+    global _upload_dir
+    if _upload_dir is None:
+        if UPLOAD_TMP_DIR:
+            os.makedirs(UPLOAD_TMP_DIR, mode=0o700, exist_ok=True)
+            _upload_dir = UPLOAD_TMP_DIR
+        else:
+            _upload_dir = tempfile.mkdtemp(prefix="ai_reviewer_uploads_")
+    return _upload_dir
+
+
+def remove_upload_dir():
+    """При остановке: удаляет свою временную папку (UPLOAD_TMP_DIR не трогаем)."""
+    global _upload_dir
+    if _upload_dir is not None and _upload_dir != UPLOAD_TMP_DIR:
+        shutil.rmtree(_upload_dir, ignore_errors=True)
+    _upload_dir = None
+
+
+def decode_text(source: BinaryIO, max_bytes: int = UPLOAD_MAX_BYTES, max_chars: int = UPLOAD_MAX_CHARS) -> str:
+    """
+    UTF-8 текст из потока по кускам (некорректные байты пропускаются). Читает не больше, чем нужно
+    для max_chars символов: в памяти — текст и один кусок, а не весь файл.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = []
+    chars = read = 0
+    while chunk := source.read(UPLOAD_CHUNK_BYTES):
+        read += len(chunk)
+        if read > max_bytes:
+            raise _too_large(read, max_bytes)
+        text = decoder.decode(chunk)
+        if chars + len(text) > max_chars:
+            parts.append(text[:max_chars - chars])
+            parts.append(f"\n... (truncated: first {max_chars} characters)")
+            return "".join(parts)
+        parts.append(text)
+        chars += len(text)
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def copy_upload(source: BinaryIO, path: str, max_bytes: int = UPLOAD_MAX_BYTES) -> int:
+    """Копирует поток в файл кусками; превышение лимита прерывает копирование. Возвращает размер."""
+    written = 0
+    with open(path, "wb") as target:
+        while chunk := source.read(UPLOAD_CHUNK_BYTES):
+            written += len(chunk)
+            if written > max_bytes:
+                raise _too_large(written, max_bytes)
+            target.write(chunk)
+    return written
+
+
+def _new_upload_path(suffix: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=upload_dir())
+    os.close(fd)
+    return path
+
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def read_upload(file: UploadFile) -> Tuple[str, str]:
+    """
+    (текст, тип: code/pdf) загрузки. UploadTooLargeError / PdfLimitError — слишком большой файл
+    (по размеру из multipart проверяется до чтения).
+    """
+    is_pdf = (file.filename or "").endswith(".pdf")
+    limit = min(UPLOAD_MAX_BYTES, PDF_MAX_BYTES) if is_pdf else UPLOAD_MAX_BYTES
+    if file.size is not None and file.size > limit:
+        raise _too_large(file.size, limit)
+
+    if not is_pdf:
+        with span("upload.decode", size=file.size):
+            return await run_io(decode_text, file.file, limit), "code"
+
+    path = await run_io(_new_upload_path, ".pdf")
+    try:
+        with span("upload.save", size=file.size):
+            await run_io(copy_upload, file.file, path, limit)
+        with span("pdf.parse"):
+            return await extract_pdf_text(path, label=file.filename), "pdf"
+    finally:
+        await run_io(_remove_file, path)
@@ -1,33 +1,30 @@
 import os
-from typing import List
+from typing import List, Optional
 import pypdf
 import shutil  # Для копирования/удаления если нужно
 
+from .walker import walk_project
 
-def scan_local_project(project_path: str) -> List[str]:
-    """Сканирует папку проекта и возвращает список .py файлов."""
-    py_files = []
-    if not os.path.exists(project_path):
-        return py_files
 
-    for root, dirs, files in os.walk(project_path):
-        for file in files:
-            if file.endswith(".py"):
-                full_path = os.path.join(root, file)
-                py_files.append(full_path)
-    return py_files
+def scan_local_project(project_path: str, stats: Optional[dict] = None) -> List[str]:
+    """
+    Сканирует папку проекта и возвращает список .py файлов. Окружения, зависимости, .git,
+    игнорируемое .gitignore/.reviewignore и слишком большие файлы пропускаются (причины — в stats, см. walker).
+    """
+    return list(walk_project(project_path, stats=stats))
 
 
 def extract_text_from_pdf(pdf_path: str) -> str:
-    text = ""
+    """Последовательное извлечение текста (без пула процессов). Для API см. pdf_engine.extract_pdf_text."""
+    pages = []
     try:
         with open(pdf_path, "rb") as f:
             reader = pypdf.PdfReader(f)
             for page in reader.pages:
-                text += page.extract_text() + "\n"
+                pages.append(page.extract_text())
     except Exception as e:
         return f"Error reading PDF: {e}"
-    return text
+    return "\n".join(pages) + "\n" if pages else ""
 
 
 def read_project_file(file_path: str) -> str:
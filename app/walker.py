@@ -0,0 +1,218 @@
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+
+# Обход проекта для скана и Агента: не заходит в окружения, зависимости и служебные папки,
+# учитывает .gitignore и свой ignore-файл, пропускает слишком большие файлы.
+
+# Дополнительный ignore-файл (синтаксис .gitignore), читается в каждой папке как .gitignore
+SCAN_IGNORE_FILE = os.environ.get("SCAN_IGNORE_FILE", ".reviewignore")
+# Файлы больше этого размера не ревьюятся (сгенерированный код, дампы данных)
+SCAN_MAX_FILE_BYTES = int(os.environ.get("SCAN_MAX_FILE_BYTES", str(1024 * 1024)))
+
+# В эти папки не заходим никогда
+PRUNED_DIRS = frozenset({
+    ".git", ".hg", ".svn", ".venv", "venv", "node_modules", "__pycache__", "site-packages", "dist-packages",
+    ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".ruff_cache", ".idea", ".eggs", "build", "dist",
+})
+# Папка с этим файлом — виртуальное окружение, как бы она ни называлась
+VENV_MARKER = "pyvenv.cfg"
+
+# Правило: (папка ignore-файла относительно корня, regex, исключение "!", только для папок)
+Rule = Tuple[str, "re.Pattern", bool, bool]
+
+
+def new_walk_stats() -> dict:
+    """files — найдено; skipped — пропущенные файлы по причинам; pruned_dirs — папки, в которые не заходили."""
+    return {"files": 0, "skipped": {}, "pruned_dirs": {}}
+
+
+def _count(stats: dict, group: str, reason: str):
+    stats[group][reason] = stats[group].get(reason, 0) + 1
+
+
+def _glob_to_regex(pattern: str) -> str:
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return "".join(out)
+
+
+def parse_ignore_lines(lines, base: str = "") -> List[Rule]:
+    """Строки в формате .gitignore -> правила. base — папка файла относительно корня проекта ("" — корень)."""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # Шаблон со слешем (кроме последнего) привязан к папке ignore-файла, без него — совпадает на любой глубине
+        anchored = "/" in line
+        body = _glob_to_regex(line.lstrip("/"))
+        regex = re.compile(("" if anchored else "(?:.*/)?") + body + r"\Z")
+        rules.append((base, regex, negate, dir_only))
+    return rules
+
+
+def _read_rules(dir_path: str, base: str, names) -> List[Rule]:
+    rules = []
+    for ignore_name in (".gitignore", SCAN_IGNORE_FILE):
+        if ignore_name in names:
+            try:
+                with open(os.path.join(dir_path, ignore_name), encoding="utf-8", errors="ignore") as f:
+                    rules.extend(parse_ignore_lines(f, base))
+            except OSError:
+                pass
+    return rules
+
+
+def is_ignored(rules: List[Rule], rel_path: str, is_dir: bool) -> bool:
+    """rel_path — путь от корня проекта через "/". Как в git: решает последнее совпавшее правило."""
+    ignored = False
+    for base, regex, negate, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if base:
+            if not rel_path.startswith(base + "/"):
+                continue
+            candidate = rel_path[len(base) + 1:]
+        else:
+            candidate = rel_path
+        if regex.match(candidate):
+            ignored = not negate
+    return ignored
+
+
+def _root_rules(project_path: str) -> List[Rule]:
+    rules = []
+    exclude = os.path.join(project_path, ".git", "info", "exclude")
+    if os.path.isfile(exclude):
+        with open(exclude, encoding="utf-8", errors="ignore") as f:
+            rules.extend(parse_ignore_lines(f))
+    return rules
+
+
+def walk_project(
+        project_path: str,
+        suffixes: Optional[Tuple[str, ...]] = (".py",),
+        max_bytes: int = SCAN_MAX_FILE_BYTES,
+        stats: Optional[dict] = None
+) -> Iterator[str]:
+    """
+    Лениво отдает пути файлов проекта (os.path.join(папка, имя), как os.walk) с окончанием из suffixes
+    (None — все файлы). Игнорируемые папки отбрасываются до захода в них. Причины пропусков — в stats
+    (см. new_walk_stats).
+    """
+    stats = stats if stats is not None else new_walk_stats()
+    if not os.path.isdir(project_path):
+        return
+    stack = [(project_path, "", _root_rules(project_path))]
+    while stack:
+        dir_path, rel_dir, rules = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            _count(stats, "pruned_dirs", "unreadable")
+            continue
+        names = {entry.name for entry in entries}
+        if rel_dir and VENV_MARKER in names:
+            _count(stats, "pruned_dirs", "virtualenv")
+            continue
+        own_rules = _read_rules(dir_path, rel_dir, names)
+        if own_rules:
+            rules = rules + own_rules
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in PRUNED_DIRS or entry.name.endswith(".egg-info"):
+                        _count(stats, "pruned_dirs", "builtin")
+                    elif is_ignored(rules, rel_path, True):
+                        _count(stats, "pruned_dirs", "ignored")
+                    else:
+                        subdirs.append((entry.path, rel_path, rules))
+                    continue
+                if suffixes and not entry.name.endswith(suffixes):
+                    continue
+                if not entry.is_file():
+                    continue
+                if is_ignored(rules, rel_path, False):
+                    _count(stats, "skipped", "ignored")
+                elif entry.stat().st_size > max_bytes:
+                    _count(stats, "skipped", "too_large")
+                else:
+                    stats["files"] += 1
+                    yield entry.path
+            except OSError:
+                _count(stats, "skipped", "unreadable")
+        # Обход в глубину в алфавитном порядке
+        stack.extend(reversed(subdirs))
+
+
+def ignored_reason(project_path: str, file_path: str, max_bytes: int = SCAN_MAX_FILE_BYTES) -> Optional[str]:
+    """Почему walk_project пропустил бы этот файл (для событий режима watch); None — не пропустил бы."""
+    rel_path = os.path.relpath(file_path, project_path).replace(os.sep, "/")
+    parts = rel_path.split("/")
+    rules = _root_rules(project_path)
+    dir_path, rel_dir = project_path, ""
+    for index, part in enumerate(parts):
+        try:
+            names = os.listdir(dir_path)
+        except OSError:
+            return "unreadable"
+        if rel_dir and VENV_MARKER in names:
+            return "virtualenv"
+        rules = rules + _read_rules(dir_path, rel_dir, names)
+        rel_dir = f"{rel_dir}/{part}" if rel_dir else part
+        is_dir = index < len(parts) - 1
+        if is_dir and (part in PRUNED_DIRS or part.endswith(".egg-info")):
+            return "builtin"
+        if is_ignored(rules, rel_dir, is_dir):
+            return "ignored"
+        dir_path = os.path.join(dir_path, part)
+    try:
+        if os.path.getsize(file_path) > max_bytes:
+            return "too_large"
+    except OSError:
+        return "unreadable"
+    return None
@@ -0,0 +1,97 @@
+"""
+Накладные расходы аутентификации на запрос: get_current_user без кэша (jwt.decode + SELECT User)
+и с кэшем токенов/пользователей (app/auth.py).
+
+Запуск из корня проекта:
+    python benchmarks/bench_auth.py --requests 20000
+    python benchmarks/bench_auth.py --writer   # параллельно пишет "Агент" (пачки INSERT в reviewreport)
+
+Работает во временном каталоге со своей database.db.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="bench_auth_"))
+
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from app import auth  # noqa: E402
+from app.blobs import new_report  # noqa: E402
+from app.db import make_engine  # noqa: E402
+from app.models import User  # noqa: E402
+
+
+def agent_writer(engine, stop: threading.Event):
+    """Пишет отчеты пачками по 50, как BatchWriter Агента."""
+    while not stop.is_set():
+        with Session(engine) as session:
+            for i in range(50):
+                session.add(new_report(
+                    session, f"review {time.time()} {i}", project_name="bench", file_path=f"/src/m{i}.py",
+                    content_type="code", summary="Agent Scan", status="completed"
+                ))
+            session.commit()
+        time.sleep(0.005)
+
+
+async def measure(engine, token: str, requests: int, cached: bool) -> list:
+    ttl = auth.AUTH_CACHE_TTL if cached else 0
+    auth._token_cache.ttl = auth._user_cache.ttl = ttl
+    auth.invalidate_auth_cache()
+    timings = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        # Как FastAPI: своя сессия на запрос (get_session)
+        with Session(engine) as session:
+            await auth.get_current_user(token=token, session=session)
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+def report(label: str, timings: list):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{label:<14} mean {statistics.mean(timings) * 1e6:8.1f} us   p50 {timings[len(timings) // 2] * 1e6:8.1f} us   "
+          f"p99 {p99 * 1e6:8.1f} us")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--writer", action="store_true", help="Параллельная запись отчетов в ту же БД")
+    args = parser.parse_args()
+
+    engine = make_engine("sqlite:///./database.db")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="admin", hashed_password="x"))
+        session.commit()
+    token = auth.create_access_token({"sub": "admin"})
+
+    stop = threading.Event()
+    writer = threading.Thread(target=agent_writer, args=(engine, stop), daemon=True)
+    if args.writer:
+        writer.start()
+    try:
+        before = await measure(engine, token, args.requests, cached=False)
+        after = await measure(engine, token, args.requests, cached=True)
+    finally:
+        stop.set()
+        if args.writer:
+            writer.join()
+
+    report("no cache", before)
+    report("cache", after)
+    print(f"speedup x{statistics.mean(before) / statistics.mean(after):.1f}; stats: {auth.auth_cache_stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""
+Отзывчивость API, пока обрабатывается большой PDF.
+
+Запуск из корня проекта:
+    python benchmarks/bench_event_loop.py --pages 1500
+    python benchmarks/bench_event_loop.py --pages 1500 --inline   # старое поведение: всё в event loop
+
+Параллельно с загрузкой PDF на /api/upload-and-review шлет легкие запросы
+(/api/review-cache/stats) и печатает их задержку. Если разбор PDF идет в event loop,
+легкие запросы ждут его целиком; с пулом процессов они отвечают за миллисекунды.
+Mistral не вызывается: URL указывает на закрытый порт, ошибка соединения приходит сразу (без ретраев, upload отвечает 502).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import main, ai_client, pdf_engine  # noqa: E402
+
+
+def make_text_pdf(path: str, pages: int, lines_per_page: int = 40):
+    """Пишет простой PDF с текстом на каждой странице (без сторонних библиотек)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = b"".join(
+            b"(Page %d line %d: lorem ipsum dolor sit amet consectetur) Tj T* " % (page, line)
+            for line in range(lines_per_page)
+        )
+        stream = b"BT /F1 10 Tf 12 TL 40 800 Td " + lines + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+async def probe(client: httpx.AsyncClient, headers: dict, stop: asyncio.Event, latencies: list):
+    """Легкий запрос каждые 10 мс. Задержка считается от момента, когда запрос должен был уйти."""
+    interval = 0.01
+    while not stop.is_set():
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        await client.get("/api/review-cache/stats", headers=headers)
+        latencies.append((time.perf_counter() - due) * 1000)
+
+
+async def run(pages: int, inline: bool):
+    workdir = tempfile.mkdtemp(prefix="bench_loop_")
+    os.chdir(workdir)
+    pdf_path = os.path.join(workdir, "big.pdf")
+    make_text_pdf(pdf_path, pages)
+    print(f"PDF: {pages} pages, {os.path.getsize(pdf_path) / 1024 / 1024:.1f} MB")
+
+    ai_client.MISTRAL_API_URL = "http://127.0.0.1:9/v1/chat/completions"
+    ai_client.MISTRAL_MAX_RETRIES = 0
+    if inline:
+        async def run_inline(fn, *args, **kwargs):
+            return fn(*args, **kwargs)
+        main.run_cpu = main.run_io = run_inline
+        pdf_engine.run_cpu = pdf_engine.run_io = run_inline
+
+    main.init_db()
+    from sqlmodel import Session, select
+    with Session(main.engine) as session:
+        if not session.exec(select(main.User).where(main.User.username == "admin")).first():
+            session.add(main.User(username="admin", hashed_password=main.get_password_hash("admin")))
+            session.commit()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        token = (await client.post("/token", data={"username": "admin", "password": "admin"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        latencies = []
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, headers, stop, latencies))
+        await asyncio.sleep(0.2)
+
+        t0 = time.perf_counter()
+        with open(pdf_path, "rb") as f:
+            response = await client.post("/api/upload-and-review", files={"file": ("big.pdf", f)}, headers=headers)
+        upload_s = time.perf_counter() - t0
+        stop.set()
+        await probe_task
+
+    await ai_client.close_http_session()
+    main.shutdown_executors()
+    latencies.sort()
+    mode = "inline (event loop)" if inline else "executors"
+    print(f"mode={mode}  upload status={response.status_code}  upload time={upload_s:.2f}s")
+    print(f"pdf timings: {pdf_engine.slowest_documents(1)}")
+    print(
+        f"probe requests={len(latencies)}  p50={latencies[len(latencies) // 2]:.1f}ms  "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1]:.1f}ms  max={latencies[-1]:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=1500)
+    parser.add_argument("--inline", action="store_true", help="Выполнять блокирующую работу прямо в event loop")
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.inline))
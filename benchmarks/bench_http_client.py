@@ -0,0 +1,89 @@
+"""
+Бенчмарк HTTP-клиента Mistral: общий пул соединений против новой сессии на запрос.
+
+Запуск из корня проекта:
+    python benchmarks/bench_http_client.py --requests 300
+
+Поднимает локальный stub chat-completions сервер и считает, сколько TCP-соединений
+он принял. С общим клиентом соединения переиспользуются (keep-alive), поэтому
+рукопожатие оплачивается один раз, а не на каждый файл.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ai_client  # noqa: E402
+
+STUB_RESPONSE = {"choices": [{"message": {"content": "OK"}}]}
+
+
+async def start_stub_server(port: int):
+    """Минимальный сервер, который отвечает как /v1/chat/completions."""
+    connections = set()
+
+    async def handler(request: web.Request):
+        connections.add(id(request.transport))
+        return web.json_response(STUB_RESPONSE)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, connections
+
+
+async def call_with_fresh_session(url: str):
+    """Старое поведение: новый ClientSession (и новое соединение) на каждый вызов."""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json={"messages": []}) as response:
+            await response.json()
+
+
+async def measure(name: str, coro_factory, n: int, connections: set):
+    connections.clear()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await coro_factory()
+        latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - started
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{name:<22} total={total:.3f}s  p50={p50:.2f}ms  p95={p95:.2f}ms  connections={len(connections)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+    ai_client.MISTRAL_API_URL = url
+    runner, connections = await start_stub_server(args.port)
+    try:
+        await measure("fresh session / call", lambda: call_with_fresh_session(url), args.requests, connections)
+        await measure(
+            "shared pooled client",
+            lambda: ai_client._call_mistral([{"role": "user", "content": "ping"}], api_key="bench"),
+            args.requests,
+            connections,
+        )
+    finally:
+        await ai_client.close_http_session()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,253 @@
+"""
+Сквозной нагрузочный тест API с локальным Mistral (benchmarks/fake_mistral.py).
+
+Запуск из корня проекта:
+    python benchmarks/bench_load.py --concurrency 1,8,32 --requests 200
+    python benchmarks/bench_load.py --scenarios upload,reports --save bench.json
+    python benchmarks/bench_load.py --compare bench.json --max-regression 0.2   # код выхода 1 при регрессии
+
+Поднимает фейковый Mistral в этом процессе и приложение (uvicorn) отдельным процессом
+во временном каталоге: своя database.db и свой ~/PycharmProjects с синтетическим проектом,
+Агент отключен (AGENT_ENABLED=0). Для каждого сценария и уровня конкурентности печатает
+p50/p95/p99, запросов в секунду, долю ошибок и память сервера (RSS и пик, Linux /proc).
+
+Сценарии: token (/token), upload (/api/upload-and-review, каждый файл уникален — мимо кэша),
+scan (/api/scan-local-project; после первого скана файлы берутся из кэша ревью),
+reports (/api/reports).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_mistral import add_config_arguments, config_from_args, start_fake_mistral  # noqa: E402
+
+SCENARIOS = ("token", "upload", "scan", "reports")
+BENCH_PROJECT = "bench_project"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def sample_module(index: int, functions: int = 8) -> str:
+    body = "\n\n".join(
+        f"def handler_{index}_{n}(items, limit=10):\n"
+        f"    result = []\n"
+        f"    for item in items[:limit]:\n"
+        f"        if item is not None:\n"
+        f"            result.append(str(item).strip())\n"
+        f"    return result\n"
+        for n in range(functions)
+    )
+    return f'"""Module {index}"""\nimport os\n\n\n{body}'
+
+
+def make_project(home: str, files: int):
+    project = os.path.join(home, "PycharmProjects", BENCH_PROJECT)
+    os.makedirs(project, exist_ok=True)
+    with open(os.path.join(project, "requirements.txt"), "w") as f:
+        f.write("fastapi\nsqlmodel\n")
+    for i in range(files):
+        with open(os.path.join(project, f"module_{i}.py"), "w") as f:
+            f.write(sample_module(i, functions=4 + i % 20))
+
+
+def memory_kb(pid: int) -> dict:
+    """VmRSS/VmHWM процесса (только Linux)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if line.startswith(("VmRSS", "VmHWM")))
+    except OSError:
+        return {}
+    return {key: int(value.split()[0]) for key, value in fields.items()}
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+async def wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Сервер приложения завершился при старте")
+        try:
+            await client.post("/token", data={"username": "admin", "password": "admin"})
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Сервер приложения не поднялся")
+
+
+class Driver:
+    """Запросы сценариев. Каждый вызов возвращает HTTP-статус."""
+
+    def __init__(self, client: httpx.AsyncClient, headers: dict):
+        self.client = client
+        self.headers = headers
+        self.counter = 0
+
+    async def token(self) -> int:
+        response = await self.client.post("/token", data={"username": "admin", "password": "admin"})
+        return response.status_code
+
+    async def upload(self) -> int:
+        self.counter += 1
+        code = f"# request {self.counter} {time.time_ns()}\n" + sample_module(self.counter)
+        files = {"file": (f"upload_{self.counter}.py", code.encode(), "text/x-python")}
+        response = await self.client.post("/api/upload-and-review", files=files, headers=self.headers)
+        return response.status_code
+
+    async def scan(self) -> int:
+        response = await self.client.post("/api/scan-local-project", data={"project_name": BENCH_PROJECT}, headers=self.headers)
+        return response.status_code
+
+    async def reports(self) -> int:
+        response = await self.client.get("/api/reports", params={"limit": 20}, headers=self.headers)
+        return response.status_code
+
+
+async def run_level(driver: Driver, scenario: str, concurrency: int, total: int, pid: int) -> dict:
+    call = getattr(driver, scenario)
+    latencies, statuses = [], {}
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            t0 = time.perf_counter()
+            try:
+                code = await call()
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            latencies.append(time.perf_counter() - t0)
+            statuses[str(code)] = statuses.get(str(code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    ok = sum(count for code, count in statuses.items() if code.startswith("2"))
+    memory = memory_kb(pid)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "error_rate": round(1 - ok / total, 4) if total else 0.0,
+        "statuses": statuses,
+        "rss_mb": round(memory.get("VmRSS", 0) / 1024, 1),
+        "peak_rss_mb": round(memory.get("VmHWM", 0) / 1024, 1),
+    }
+
+
+def print_row(row: dict):
+    print(
+        f"{row['scenario']:<8} c={row['concurrency']:<4} n={row['requests']:<5} "
+        f"rps={row['rps']:<8} p50={row['p50_ms']:<8} p95={row['p95_ms']:<8} p99={row['p99_ms']:<8} "
+        f"err={row['error_rate']:<6} rss={row['rss_mb']}MB peak={row['peak_rss_mb']}MB {row['statuses']}"
+    )
+
+
+def compare(rows: list, baseline_path: str, max_regression: float) -> bool:
+    """Сравнивает p95 и rps с прошлым прогоном. True, если регрессий нет."""
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    ok = True
+    for row in rows:
+        base = baseline.get((row["scenario"], row["concurrency"]))
+        if base is None:
+            continue
+        p95_growth = row["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps_drop = 1 - row["rps"] / base["rps"] if base["rps"] else 0.0
+        regressed = p95_growth > max_regression or rps_drop > max_regression
+        ok = ok and not regressed
+        mark = "REGRESSION" if regressed else "ok"
+        print(f"{mark:<10} {row['scenario']:<8} c={row['concurrency']:<4} p95 {p95_growth:+.0%}  rps {-rps_drop:+.0%}")
+    return ok
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    make_project(workdir, args.project_files)
+
+    mistral_port = free_port()
+    fake = await start_fake_mistral(mistral_port, config_from_args(args))
+
+    app_port = free_port()
+    env = {
+        **os.environ,
+        "HOME": workdir,
+        "PYTHONPATH": ROOT,
+        "MISTRAL_API_URL": f"http://127.0.0.1:{mistral_port}/v1/chat/completions",
+        "MISTRAL_API_KEY": os.environ.get("MISTRAL_API_KEY", "bench"),
+        "AGENT_ENABLED": "0",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    rows = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", timeout=args.timeout, limits=limits) as client:
+            await wait_until_ready(client, process)
+            token = (await client.post("/token", data={"username": "admin", "password": "admin"})).json()["access_token"]
+            driver = Driver(client, {"Authorization": f"Bearer {token}"})
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    total = args.scan_requests if scenario == "scan" else args.requests
+                    row = await run_level(driver, scenario, concurrency, max(total, concurrency), process.pid)
+                    rows.append(row)
+                    print_row(row)
+        mistral_stats = fake.app["stats"]
+        print(f"fake mistral: {mistral_stats}")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        await fake.cleanup()
+
+    result = {"results": rows, "fake_mistral": vars(config_from_args(args)), "mistral_stats": mistral_stats}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"saved: {args.save}")
+    if args.compare and not compare(rows, args.compare, args.max_regression):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=lambda v: v.split(","), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Запросов на уровень (token/upload/reports)")
+    parser.add_argument("--scan-requests", type=int, default=10, help="Запросов на уровень для scan")
+    parser.add_argument("--project-files", type=int, default=40, help="Файлов в синтетическом проекте")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--save", default="", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", default="", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Допустимый рост p95 / падение rps")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,97 @@
+"""
+Поиск по отчетам: FTS5 (/api/reports/search) против LIKE '%...%' (старый поиск админки).
+
+Запуск из корня проекта:
+    python benchmarks/bench_search.py --rows 1000000
+
+Заполняет временную БД синтетическими отчетами (тексты — в reviewblob, индекс строится
+после заполнения, как при миграции) и печатает время запросов для редкого, частого и
+префиксного слова. LIKE — по несжатой копии текстов (так искала админка до reviewblob).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlmodel import Session, SQLModel
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import make_engine  # noqa: E402
+from app.blobs import make_blob_row  # noqa: E402
+from app.search import ensure_search_index, search_reports  # noqa: E402
+
+WORDS = (
+    "функция класс исключение запрос база данные тип аннотация тест рефакторинг безопасность "
+    "производительность цикл память строка список словарь импорт модуль пакет логирование"
+).split()
+RARE = "десериализация"
+
+
+def fill(engine, rows: int, batch: int = 10000):
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("CREATE TABLE legacy_text (id INTEGER PRIMARY KEY, review_result TEXT)")
+        for start in range(0, rows, batch):
+            reports, blobs, legacy = [], [], []
+            for i in range(start, min(start + batch, rows)):
+                text = " ".join(random.choices(WORDS, k=150))
+                if i % 10000 == 0:
+                    text += f" {RARE}"
+                blob = make_blob_row(text)
+                blobs.append((blob["hash"], blob["codec"], blob["data"], blob["size"], "2026-01-01 00:00:00"))
+                reports.append((
+                    i + 1, f"project_{i % 50}", f"/src/module_{i}.py", "code", "Local scan", blob["hash"], "completed",
+                    "2026-01-01 00:00:00"
+                ))
+                legacy.append((i + 1, text))
+            cursor.executemany("INSERT OR IGNORE INTO reviewblob (hash, codec, data, size, created_at) VALUES (?, ?, ?, ?, ?)", blobs)
+            cursor.executemany(
+                "INSERT INTO reviewreport (id, project_name, file_path, content_type, summary, review_hash, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", reports
+            )
+            cursor.executemany("INSERT INTO legacy_text (id, review_result) VALUES (?, ?)", legacy)
+            raw.commit()
+    finally:
+        raw.close()
+
+
+def timed(label: str, fn, repeat: int = 5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<40} {best * 1000:9.1f} ms  ({len(result)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_search_"), "database.db")
+    engine = make_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+
+    t0 = time.perf_counter()
+    fill(engine, args.rows)
+    print(f"filled {args.rows} rows in {time.perf_counter() - t0:.1f}s")
+    t0 = time.perf_counter()
+    ensure_search_index(engine)
+    print(f"indexed in {time.perf_counter() - t0:.1f}s, db size {os.path.getsize(path) / 1024 ** 2:.0f} MB")
+
+    with Session(engine) as session:
+        for query in (RARE, "исключение", "рефактор", "module_4242"):
+            timed(f"fts  {query!r}", lambda: search_reports(session, query, limit=20))
+        timed(f"like {RARE!r}", lambda: session.connection().exec_driver_sql(
+            "SELECT id FROM legacy_text WHERE review_result LIKE ? LIMIT 20", (f"%{RARE}%",)
+        ).fetchall(), repeat=1)
+
+
+if __name__ == "__main__":
+    main()
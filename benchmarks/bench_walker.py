@@ -0,0 +1,96 @@
+"""
+Обход проекта с большим виртуальным окружением: старый scan_local_project (os.walk по всему дереву)
+против app/walker.py (отбрасывает .venv, node_modules, .git, игнорируемое .gitignore).
+
+Запуск из корня проекта:
+    python benchmarks/bench_walker.py --venv-files 30000 --project-files 300
+
+Дерево создается во временном каталоге и удаляется после замера.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.walker import new_walk_stats, walk_project  # noqa: E402
+
+
+def old_scan(project_path: str):
+    """scan_local_project до walker.py."""
+    py_files = []
+    for root, dirs, files in os.walk(project_path):
+        for file in files:
+            if file.endswith(".py"):
+                py_files.append(os.path.join(root, file))
+    return py_files
+
+
+def _write(path: str, size: int = 200):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("#" * size)
+
+
+def build_tree(root: str, project_files: int, venv_files: int):
+    for i in range(project_files):
+        _write(os.path.join(root, "src", f"pkg{i % 20}", f"module{i}.py"))
+    site = os.path.join(root, ".venv", "lib", "python3.11", "site-packages")
+    _write(os.path.join(root, ".venv", "pyvenv.cfg"), 10)
+    for i in range(venv_files):
+        _write(os.path.join(site, f"lib{i % 300}", f"sub{i % 7}", f"m{i}.py"))
+    for i in range(venv_files // 5):
+        _write(os.path.join(root, "node_modules", f"npm{i % 200}", f"x{i}.py"))
+    for i in range(venv_files // 10):
+        _write(os.path.join(root, ".git", "objects", f"{i % 256:02x}", f"obj{i}"))
+    for i in range(project_files // 3):
+        _write(os.path.join(root, "src", "__pycache__", f"module{i}.cpython-311.py"))
+    for i in range(project_files // 10):
+        _write(os.path.join(root, "build", "lib", f"module{i}.py"))
+    _write(os.path.join(root, "src", "fixtures", "huge_dump.py"), 3 * 1024 * 1024)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("/build/\n*.log\n")
+
+
+def measure(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--project-files", type=int, default=300)
+    parser.add_argument("--venv-files", type=int, default=30000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_walker_")
+    try:
+        print(f"Строю дерево: {args.project_files} файлов проекта, {args.venv_files} в .venv ...")
+        build_tree(root, args.project_files, args.venv_files)
+
+        old_time, old_files = measure(lambda: old_scan(root), args.repeat)
+        stats = new_walk_stats()
+        new_time, new_files = measure(lambda: list(walk_project(root, stats=new_walk_stats())), args.repeat)
+        list(walk_project(root, stats=stats))
+
+        print(f"{'':<12}{'время, мс':>12}{'файлов':>10}")
+        print(f"{'os.walk':<12}{old_time * 1000:>12.1f}{len(old_files):>10}")
+        print(f"{'walker':<12}{new_time * 1000:>12.1f}{len(new_files):>10}")
+        print(f"Ускорение: x{old_time / new_time:.1f}; в ревью не уходит {len(old_files) - len(new_files)} файлов")
+        print(f"Пропущено: {stats['skipped']}, папок не обходили: {stats['pruned_dirs']}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Локальная замена Mistral chat-completions для нагрузочных тестов (квота API не тратится).
+
+Запуск из корня проекта:
+    python benchmarks/fake_mistral.py --port 8089 --latency-ms 400 --jitter-ms 150 --error-rate 0.02
+    MISTRAL_API_URL=http://127.0.0.1:8089/v1/chat/completions uvicorn app.main:app
+
+Умеет:
+  * задержку ответа (среднее + разброс) и потоковую выдачу токенов с заданной скоростью (stream: true);
+  * доли ответов 5xx и 429 (с Retry-After) — проверка ретраев и circuit breaker;
+  * запись настоящих ответов (--record DIR --upstream URL) и их воспроизведение (--replay DIR);
+  * пакетные промпты: маркеры "=== FILE N: ... ===" из запроса повторяются в ответе.
+Счетчики: GET /stats.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+
+import aiohttp
+from aiohttp import web
+
+UPSTREAM_URL = "https://api.mistral.ai/v1/chat/completions"
+
+_MARKER_RE = re.compile(r"^\s*(=== FILE (\d+):.*?===)\s*$", re.MULTILINE)
+
+SAMPLE_REVIEW = (
+    "1. **Общая оценка.** Код читается, структура понятная.\n"
+    "2. **Найденные баги/риски.** Нет проверки входных данных; исключения перехватываются слишком широко.\n"
+    "3. **Рекомендации по рефакторингу.** Добавить type hints, вынести константы, покрыть тестами крайние случаи."
+)
+
+
+class FakeConfig:
+    def __init__(
+            self,
+            latency_ms: float = 300,
+            jitter_ms: float = 100,
+            error_rate: float = 0.0,
+            throttle_rate: float = 0.0,
+            retry_after: float = 1.0,
+            tokens_per_sec: float = 100,
+            response_words: int = 120,
+            record_dir: str = "",
+            replay_dir: str = "",
+            upstream: str = UPSTREAM_URL,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.tokens_per_sec = tokens_per_sec
+        self.response_words = response_words
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.upstream = upstream
+
+
+def request_key(messages: list) -> str:
+    """Ключ записи: хеш сообщений (модель и temperature не учитываются)."""
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def synthetic_response(prompt: str, words: int) -> str:
+    """Правдоподобный ответ: по разделу на каждый маркер файла, иначе одно ревью."""
+    filler = " ".join(["Подробности:"] + ["замечание"] * max(0, words - 40))
+    markers = {}
+    for match in _MARKER_RE.finditer(prompt):
+        markers.setdefault(int(match.group(2)), match.group(1))
+    if not markers:
+        return f"{SAMPLE_REVIEW}\n\n{filler}"
+    return "\n\n".join(f"{marker}\n{SAMPLE_REVIEW}" for _, marker in sorted(markers.items()))
+
+
+async def _load_recording(config: FakeConfig, key: str):
+    path = os.path.join(config.replay_dir, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def _record_upstream(request: web.Request, config: FakeConfig, payload: dict, key: str) -> dict:
+    """Проксирует запрос в настоящий API (без stream) и сохраняет ответ."""
+    upstream_payload = {**payload, "stream": False}
+    headers = {"Authorization": request.headers.get("Authorization", ""), "Content-Type": "application/json"}
+    async with request.app["upstream_session"].post(config.upstream, json=upstream_payload, headers=headers) as response:
+        data = await response.json()
+        if response.status != 200:
+            raise web.HTTPBadGateway(text=json.dumps(data))
+    recording = {
+        "content": data["choices"][0]["message"]["content"],
+        "usage": data.get("usage", {}),
+    }
+    os.makedirs(config.record_dir, exist_ok=True)
+    with open(os.path.join(config.record_dir, f"{key}.json"), "w", encoding="utf-8") as f:
+        json.dump(recording, f, ensure_ascii=False)
+    return recording
+
+
+async def _stream(request: web.Request, config: FakeConfig, content: str) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    pause = 1.0 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+    for token in re.findall(r"\S+\s*", content):
+        chunk = {"choices": [{"delta": {"content": token}}]}
+        await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        if pause:
+            await asyncio.sleep(pause)
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def chat_completions(request: web.Request):
+    config: FakeConfig = request.app["config"]
+    stats = request.app["stats"]
+    stats["requests"] += 1
+    payload = await request.json()
+    messages = payload.get("messages", [])
+
+    roll = random.random()
+    if roll < config.throttle_rate:
+        stats["throttled"] += 1
+        return web.json_response(
+            {"message": "Requests rate limit exceeded"}, status=429,
+            headers={"Retry-After": str(config.retry_after)}
+        )
+    if roll < config.throttle_rate + config.error_rate:
+        stats["errors"] += 1
+        return web.json_response({"message": "Service unavailable"}, status=503)
+
+    key = request_key(messages)
+    recording = None
+    if config.replay_dir:
+        recording = await _load_recording(config, key)
+        stats["replayed" if recording else "replay_misses"] += 1
+    if recording is None and config.record_dir:
+        recording = await _record_upstream(request, config, payload, key)
+        stats["recorded"] += 1
+
+    delay = max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) / 1000
+    await asyncio.sleep(delay)
+
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    content = recording["content"] if recording else synthetic_response(prompt, config.response_words)
+    if payload.get("stream"):
+        return await _stream(request, config, content)
+    usage = (recording or {}).get("usage") or {
+        "prompt_tokens": len(prompt) // 4,
+        "completion_tokens": len(content) // 4,
+        "total_tokens": (len(prompt) + len(content)) // 4,
+    }
+    return web.json_response({
+        "model": payload.get("model", "fake"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage,
+    })
+
+
+async def get_stats(request: web.Request):
+    return web.json_response(request.app["stats"])
+
+
+def create_app(config: FakeConfig) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["config"] = config
+    app["stats"] = {"requests": 0, "errors": 0, "throttled": 0, "recorded": 0, "replayed": 0, "replay_misses": 0}
+
+    async def upstream_session(app):
+        app["upstream_session"] = aiohttp.ClientSession() if config.record_dir else None
+        yield
+        if app["upstream_session"] is not None:
+            await app["upstream_session"].close()
+
+    app.cleanup_ctx.append(upstream_session)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+async def start_fake_mistral(port: int, config: FakeConfig, host: str = "127.0.0.1") -> web.AppRunner:
+    """Запуск внутри уже работающего event loop (для бенчмарков). Остановка: await runner.cleanup()."""
+    runner = web.AppRunner(create_app(config))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=300, help="Средняя задержка ответа")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="Стандартное отклонение задержки")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After для 429, сек")
+    parser.add_argument("--tokens-per-sec", type=float, default=100, help="Скорость потоковой выдачи")
+    parser.add_argument("--response-words", type=int, default=120, help="Длина синтетического ответа")
+    parser.add_argument("--record", dest="record_dir", default="", help="Писать настоящие ответы в каталог")
+    parser.add_argument("--replay", dest="replay_dir", default="", help="Отдавать записанные ответы из каталога")
+    parser.add_argument("--upstream", default=UPSTREAM_URL, help="Настоящий API для --record")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        tokens_per_sec=args.tokens_per_sec,
+        response_words=args.response_words,
+        record_dir=args.record_dir,
+        replay_dir=args.replay_dir,
+        upstream=args.upstream,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    print(f"Fake Mistral: http://{args.host}:{args.port}/v1/chat/completions")
+    web.run_app(create_app(config_from_args(args)), host=args.host, port=args.port, print=None)
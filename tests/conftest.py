@@ -0,0 +1,35 @@
+"""
+Общие фикстуры тестов.
+
+Запуск из корня проекта:
+    python -m pytest tests -q
+"""
+import asyncio
+
+import pytest
+
+from app import batching, review_cache
+from app.ai_client import batch_file_marker
+
+
+@pytest.fixture
+def fake_mistral(monkeypatch):
+    """
+    Подменяет запросы к Mistral (одиночное и пакетное ревью) быстрыми ответами.
+    Возвращает список запросов: context одиночного ревью или "batch".
+    """
+    requests = []
+
+    async def fake_review(code, context="", api_key=""):
+        requests.append(context)
+        await asyncio.sleep(0.005)
+        return f"review of {len(code)} chars"
+
+    async def fake_batch_review(files, context="", api_key=""):
+        requests.append("batch")
+        await asyncio.sleep(0.005)
+        return "\n".join(f"{batch_file_marker(i, path)}\nok" for i, (path, _) in enumerate(files, start=1))
+
+    monkeypatch.setattr(review_cache, "get_code_review_async", fake_review)
+    monkeypatch.setattr(batching, "get_batch_review_async", fake_batch_review)
+    return requests
@@ -0,0 +1,57 @@
+"""
+Кэш get_current_user: повторный запрос без обращения к БД, сброс при изменении пользователя.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_auth_cache.py -q
+"""
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, select
+
+from app import auth, db
+from app.db import make_engine
+from app.models import User
+
+
+def test_cached_user_and_invalidation(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "AUTH_EPOCH_FILE", str(tmp_path / "auth-epoch"))
+    monkeypatch.setattr(auth, "AUTH_EPOCH_FILE", str(tmp_path / "auth-epoch"))
+    engine = make_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(username="admin", hashed_password="old"))
+        session.commit()
+    token = auth.create_access_token({"sub": "admin"})
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def current_user():
+        with Session(engine) as session:
+            return asyncio.run(auth.get_current_user(token=token, session=session))
+
+    assert current_user().hashed_password == "old"
+    queries = len(statements)
+    assert current_user().hashed_password == "old"
+    assert len(statements) == queries  # второй запрос — из кэша
+
+    with Session(engine) as session:
+        user = session.exec(select(User)).one()
+        user.hashed_password = "new"
+        session.add(user)
+        session.commit()
+    assert current_user().hashed_password == "new"
+
+    # Изменение из другого процесса (change_pass.py) — через файл-метку
+    with Session(engine) as session:
+        session.connection().exec_driver_sql("DELETE FROM user")
+        session.commit()
+    db.bump_auth_epoch()
+    os.utime(db.AUTH_EPOCH_FILE, ns=(1, 1))  # mtime гарантированно другой
+    with pytest.raises(HTTPException):
+        current_user()
+    engine.dispose()
@@ -0,0 +1,76 @@
+"""
+Пакетное ревью мелких файлов: ответ делится по маркерам "=== FILE N ===", файлы без раздела ревьюятся по одному.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_batching.py -q
+"""
+import asyncio
+
+from sqlmodel import Session, create_engine
+
+from app import batching
+from app.ai_client import batch_file_marker
+from app.batching import pack_batches, review_small_files, split_batch_response
+from app.db import init_db
+from app.review_cache import get_cached_review, make_cache_key
+
+
+def test_split_batch_response():
+    text = (
+        "Вступление модели, которое не относится к файлам\n"
+        f"{batch_file_marker(1, 'a.py')}\nЗамечания к a.py\n\n"
+        "  === FILE 3: c.py ===  \nЗамечания к c.py\n"
+        "=== FILE 7: лишний.py ===\nфайла 7 в пакете нет\n"
+        f"{batch_file_marker(2, 'b.py')}\n\n"
+    )
+    assert split_batch_response(text, 3) == {1: "Замечания к a.py", 3: "Замечания к c.py"}
+    assert split_batch_response("Ответ без маркеров", 2) is None
+    assert split_batch_response(f"{batch_file_marker(1, 'a.py')}\n   \n", 1) is None
+
+
+def test_pack_batches_respects_budget(monkeypatch):
+    monkeypatch.setattr(batching, "BATCH_MAX_FILES", 3)
+    files = [(f"f{i}.py", "x" * 400 * (i % 3 + 1)) for i in range(10)]
+    batches = pack_batches(files, budget=500)
+    assert sorted(path for batch in batches for path, _ in batch) == sorted(path for path, _ in files)
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) == 1 or sum(len(code) // 4 + 1 for _, code in batch) <= 500
+
+
+def test_missing_section_falls_back_to_single_review(tmp_path, monkeypatch):
+    files = [(f"/src/m{i}.py", f"X_{i} = {i}\n") for i in range(4)]
+    single = []
+
+    async def fake_batch_review(batch, context="", api_key=""):
+        # Раздела для третьего файла в ответе нет
+        return "\n".join(
+            f"{batch_file_marker(i, path)}\nпакетное ревью {path}"
+            for i, (path, _) in enumerate(batch, start=1) if i != 3
+        )
+
+    async def fake_single_review(session, code, rules="", context="", api_key="", lookup=True):
+        single.append(context)
+        return f"отдельное ревью: {context}", False
+
+    monkeypatch.setattr(batching, "get_batch_review_async", fake_batch_review)
+    monkeypatch.setattr(batching, "review_with_cache", fake_single_review)
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    init_db(engine)
+    seen = []
+
+    with Session(engine) as session:
+        results = asyncio.run(review_small_files(session, files, on_result=lambda outcome: seen.append(outcome["item"])))
+        assert sorted(seen) == sorted(path for path, _ in files)
+        assert all(outcome["ok"] for outcome in results.values())
+
+        missing_path, missing_code = files[2]
+        assert single == [f"File: {missing_path}"]
+        assert results[missing_path]["result"] == (f"отдельное ревью: File: {missing_path}", False)
+        for path, code in files:
+            if path != missing_path:
+                assert results[path]["result"] == (f"пакетное ревью {path}", False)
+                # Разобранные разделы пакета сохранены в кэш ревью по коду файла
+                assert get_cached_review(session, make_cache_key(code)) == f"пакетное ревью {path}"
+        assert get_cached_review(session, make_cache_key(missing_code)) is None
+    engine.dispose()
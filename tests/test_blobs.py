@@ -0,0 +1,59 @@
+"""
+Перевод старой БД (текст ревью в каждой строке reviewreport) на reviewblob и чтение отчета обратно.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_blobs.py -q
+"""
+import sqlite3
+
+from sqlmodel import Session, select
+
+from app.blobs import migrate_inline_reviews, new_report, report_detail
+from app.db import make_engine, init_db
+from app.models import ReviewBlob, ReviewReport
+from app.search import ensure_search_index, search_reports
+
+LEGACY_SCHEMA = """
+CREATE TABLE reviewreport (
+    id INTEGER PRIMARY KEY, project_name VARCHAR NOT NULL, file_path VARCHAR NOT NULL,
+    content_type VARCHAR NOT NULL, summary VARCHAR NOT NULL, review_result VARCHAR NOT NULL,
+    status VARCHAR NOT NULL, created_at DATETIME NOT NULL
+)
+"""
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    db_path = str(tmp_path / "database.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany(
+        "INSERT INTO reviewreport (project_name, file_path, content_type, summary, review_result, status, created_at) "
+        "VALUES ('demo', ?, 'code', 'Local scan', ?, 'completed', '2026-01-01 00:00:00')",
+        [(f"/src/m{i}.py", "Нет замечаний" if i % 2 else f"SQL-инъекция в запросе {i}") for i in range(10)]
+    )
+    conn.commit()
+    conn.close()
+
+    engine = make_engine(f"sqlite:///{db_path}")
+    assert migrate_inline_reviews(engine, batch=3, log=lambda message: None) == 10
+    init_db(engine)
+    ensure_search_index(engine)
+
+    with Session(engine) as session:
+        # 5 одинаковых "Нет замечаний" хранятся одним блобом
+        assert len(session.exec(select(ReviewBlob)).all()) == 6
+        report = session.get(ReviewReport, 1)
+        assert report_detail(session, report).review_result == "SQL-инъекция в запросе 0"
+
+        session.add(new_report(
+            session, "Нет замечаний", project_name="demo", file_path="/src/new.py",
+            content_type="code", summary="Local scan", status="completed"
+        ))
+        session.commit()
+        assert len(session.exec(select(ReviewBlob)).all()) == 6
+
+        found = search_reports(session, "инъекция", limit=20)
+        assert len(found) == 5
+        assert "<mark>инъекция</mark>" in found[0]["snippet"]
+        assert len(search_reports(session, "замечаний", limit=20)) == 6
+    engine.dispose()
@@ -0,0 +1,100 @@
+"""
+Разбиение больших файлов по функциям/классам и сборка отчета с диапазонами строк.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_chunker.py -q
+"""
+import asyncio
+
+import pytest
+
+from app import chunker
+from app.chunker import chunk_python_source, review_source, split_python_units
+
+
+def _function(name, body_lines):
+    return f"def {name}():\n" + "".join(f"    x_{i} = {i}  # {name}\n" for i in range(body_lines)) + "\n\n"
+
+
+MODULE = (
+    "import os\n\n\n"
+    + _function("first", 30)
+    + "# Комментарий прикрепляется к следующему определению\n"
+    + _function("second", 30)
+    + "class Big:\n    \"\"\"Класс больше бюджета.\"\"\"\n\n"
+    + "".join(
+        f"    def method_{m}(self):\n" + "".join(f"        y_{i} = {i}\n" for i in range(25)) + "\n"
+        for m in range(3)
+    )
+    + "\nTAIL = 1\n"
+)
+BUDGET = 200
+
+
+def test_units_follow_definitions():
+    units = split_python_units(MODULE, budget=BUDGET)
+    lines = MODULE.splitlines()
+    # Единицы покрывают файл целиком, без пропусков и пересечений
+    assert units[0][0] == 1 and units[-1][1] == len(lines)
+    assert all(nxt[0] == prev[1] + 1 for prev, nxt in zip(units, units[1:]))
+
+    second = next(unit for unit in units if any("def second" in line for line in lines[unit[0] - 1:unit[1]]))
+    second_lines = lines[second[0] - 1:second[1]]
+    assert any(line.startswith("# Комментарий") for line in second_lines)
+    assert not any("def first" in line for line in second_lines)
+    methods = [unit for unit in units if unit[2] == "Big"]
+    assert len(methods) >= 3
+
+
+def test_chunks_merge_units_within_budget():
+    chunks = chunk_python_source(MODULE, budget=BUDGET)
+    lines = MODULE.splitlines(keepends=True)
+    assert len(chunks) > 1
+    assert chunks[0]["start"] == 1 and chunks[-1]["end"] == len(lines)
+    assert all(nxt["start"] == prev["end"] + 1 for prev, nxt in zip(chunks, chunks[1:]))
+    for chunk in chunks:
+        text = "".join(lines[chunk["start"] - 1:chunk["end"]])
+        if chunk["text"].startswith("# ... class Big:"):
+            assert chunk["text"].endswith(text)
+        else:
+            assert chunk["text"] == text
+    assert any(chunk["text"].startswith("# ... class Big: (продолжение)") for chunk in chunks)
+    # Соседние мелкие единицы (import и функция) упакованы вместе
+    assert "import os" in chunks[0]["text"] and "def first" in chunks[0]["text"]
+
+
+def test_review_source_reports_line_ranges(monkeypatch):
+    seen = []
+
+    async def fake_review(session, code, rules="", context="", api_key="", lookup=True):
+        seen.append(context)
+        return f"ok {len(seen)}", len(seen) % 2 == 0
+
+    monkeypatch.setattr(chunker, "review_with_cache", fake_review)
+    merged, all_cached = asyncio.run(review_source(None, MODULE, "/src/big.py", budget=BUDGET))
+    chunks = chunk_python_source(MODULE, budget=BUDGET)
+    total = len(MODULE.splitlines())
+
+    assert merged.startswith(f"# Ревью big.py ({len(chunks)} фрагментов)")
+    positions = [merged.index(f"## Строки {chunk['start']}–{chunk['end']}") for chunk in chunks]
+    assert positions == sorted(positions)
+    assert sorted(seen) == sorted(
+        f"File: /src/big.py (строки {chunk['start']}-{chunk['end']} из {total})" for chunk in chunks
+    )
+    assert all_cached is False
+
+    # Маленький файл — один запрос без заголовков фрагментов
+    seen.clear()
+    review, _ = asyncio.run(review_source(None, "X = 1\n", "/src/small.py", budget=BUDGET))
+    assert review == "ok 1" and seen == ["File: /src/small.py"]
+
+
+def test_review_source_fails_on_missing_chunk(monkeypatch):
+    async def flaky_review(session, code, rules="", context="", api_key="", lookup=True):
+        if "class Big" in code:
+            raise RuntimeError("Mistral unavailable")
+        return "ok", True
+
+    monkeypatch.setattr(chunker, "review_with_cache", flaky_review)
+    with pytest.raises(RuntimeError, match="chunks failed"):
+        asyncio.run(review_source(None, MODULE, "/src/big.py", budget=BUDGET))
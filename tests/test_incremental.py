@@ -0,0 +1,142 @@
+"""
+Инкрементальное ревью по git diff: в промпт идут только хунки с окружающей функцией.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_incremental.py -q
+"""
+import asyncio
+import os
+import subprocess
+
+import pytest
+from sqlmodel import Session, create_engine
+
+from app.blobs import new_report
+from app.db import init_db
+from app.incremental import build_regions, changed_files, git_head, mark_reviewed, plan_changes, render_regions
+
+SERVICE = '''import os
+
+
+def load(path):
+    with open(path) as f:
+        return f.read()
+
+
+class Store:
+    def __init__(self, root):
+        self.root = root
+
+    def save(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+'''
+
+pytestmark = pytest.mark.skipif(subprocess.run(["git", "--version"], capture_output=True).returncode != 0,
+                                reason="git не установлен")
+
+
+def _git(root, *args):
+    subprocess.run(["git", "-C", root, "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                   check=True, capture_output=True)
+
+
+def _write(root, rel_path, text):
+    with open(os.path.join(root, rel_path), "w") as f:
+        f.write(text)
+
+
+def _repo(tmp_path):
+    root = str(tmp_path / "project")
+    os.makedirs(root)
+    _git(root, "init", "-q")
+    _write(root, "service.py", SERVICE)
+    _write(root, "other.py", "X = 1\n")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "init")
+    return root
+
+
+def test_hunks_and_enclosing_function(tmp_path):
+    root = _repo(tmp_path)
+    base = git_head(root)
+    _write(root, "service.py", SERVICE.replace('open(path, "w")', 'open(path, "w", encoding="utf-8")'))
+    _write(root, "new_module.py", "def f():\n    return 1\n")
+
+    hunks, untracked = changed_files(root, base)
+    assert list(hunks) == ["service.py"]
+    assert [(hunk["start"], hunk["end"]) for hunk in hunks["service.py"]] == [(15, 15)]
+    assert hunks["service.py"][0]["removed"] == ['        with open(path, "w") as f:']
+    assert untracked == ["new_module.py"]
+
+    code = open(os.path.join(root, "service.py")).read()
+    regions = build_regions(code, hunks["service.py"])
+    assert [(region["start"], region["end"], region["scopes"]) for region in regions] == [(13, 17, ["save"])]
+    text = render_regions(code, regions)
+    assert "(функция save)" in text
+    assert '>    15 |         with open(path, "w", encoding="utf-8") as f:' in text
+    assert "def load" not in text
+
+
+def test_plan_uses_diff_only_for_files_with_report(tmp_path):
+    root = _repo(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    init_db(engine)
+    with Session(engine) as session:
+        # Первый проход: коммита еще нет — все файлы целиком
+        plan = asyncio.run(plan_changes(session, "project", root))
+        assert plan["base"] is None and len(plan["full"]) == 2
+        asyncio.run(mark_reviewed(session, "project", plan["head"]))
+        report = new_report(session, "Замечаний нет", project_name="project", file_path=os.path.join(root, "service.py"),
+                            content_type="code", summary="Local scan", status="completed")
+        session.add(report)
+        session.commit()
+
+        _write(root, "service.py", SERVICE.replace("return f.read()", "return f.read().strip()"))
+        _write(root, "other.py", "X = 2\n")
+        _git(root, "commit", "-q", "-am", "change")
+        plan = asyncio.run(plan_changes(session, "project", root))
+        assert plan["full"] == [os.path.join(root, "other.py")]
+        change = plan["diffs"][os.path.join(root, "service.py")]
+        assert change["report_id"] == report.id and "(функция load)" in change["text"]
+        assert plan["diff_chars"] < plan["full_chars"]
+
+    assert asyncio.run(plan_changes(None, "missing", str(tmp_path / "not_a_repo"))) is None
+
+
+def test_project_in_repo_subfolder(tmp_path):
+    repo = str(tmp_path / "monorepo")
+    root = os.path.join(repo, "services", "api")
+    os.makedirs(root)
+    _git(repo, "init", "-q")
+    _write(root, "service.py", SERVICE)
+    _write(repo, "tool.py", "Y = 1\n")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "init")
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    init_db(engine)
+    with Session(engine) as session:
+        plan = asyncio.run(plan_changes(session, "api", root))
+        asyncio.run(mark_reviewed(session, "api", plan["head"]))
+        report = new_report(session, "Замечаний нет", project_name="api", file_path=os.path.join(root, "service.py"),
+                            content_type="code", summary="Local scan", status="completed")
+        session.add(report)
+        session.commit()
+
+        # Пути diff — от project_path, изменения вне проекта не попадают
+        _write(root, "service.py", SERVICE.replace("return f.read()", "return f.read().strip()"))
+        _write(repo, "tool.py", "Y = 2\n")
+        _git(repo, "commit", "-q", "-am", "change")
+        hunks, untracked = changed_files(root, plan["head"])
+        assert list(hunks) == ["service.py"] and untracked == []
+        plan = asyncio.run(plan_changes(session, "api", root))
+        assert plan["complete"] and plan["full"] == []
+        assert list(plan["diffs"]) == [os.path.join(root, "service.py")]
+
+        # Diff не получен (коммит пропал из истории) — полный проход без сдвига коммита
+        asyncio.run(mark_reviewed(session, "api", "0" * 40))
+        plan = asyncio.run(plan_changes(session, "api", root))
+        assert not plan["complete"] and plan["full"] == [os.path.join(root, "service.py")]
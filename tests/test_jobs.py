@@ -0,0 +1,226 @@
+"""
+Очередь фоновых задач пишет через AsyncSession: скан-задача и параллельные записи API не ловят "database is locked".
+Отмена задачи в очереди и выполняющейся, возврат прерванных задач в очередь после рестарта,
+частичные результаты /api/jobs/{id}/items, пока задача идет.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_jobs.py -q
+"""
+import asyncio
+import json
+
+from sqlmodel import Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import db, jobs, main
+from app.db import make_engine, make_async_engine, new_async_session, run_db
+from app.models import JobItem, ReviewJob, ReviewReport, User
+
+
+def test_scan_job_alongside_api_writes(tmp_path, monkeypatch, fake_mistral):
+    db_path = str(tmp_path / "database.db")
+    engine = make_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+
+    project = tmp_path / "demo"
+    project.mkdir()
+    for i in range(60):
+        (project / f"module_{i}.py").write_text(f"def f{i}():\n    return {i}\n" * (1 if i % 3 else 200))
+
+    monkeypatch.setattr(main, "MISTRAL_API_KEY", "test")
+    monkeypatch.setattr(main, "BASE_PROJECT_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(jobs, "_workers", [])
+
+    async def scenario():
+        monkeypatch.setattr(db, "async_engine", make_async_engine(f"sqlite+aiosqlite:///{db_path}"))
+        jobs.start_job_workers()
+        async with new_async_session() as session:
+            job = await run_db(session, jobs.submit_job, "scan", {"project_name": "demo"}, "admin")
+            # Пока задача идет, API ставит в очередь другие задачи (вторая запись в ту же базу)
+            for _ in range(20):
+                await run_db(session, jobs.submit_job, "generate_tests", {"file_path": "missing.py"}, "admin")
+            while True:
+                await asyncio.sleep(0.05)
+                await session.refresh(job)
+                if job.status not in ("queued", "running"):
+                    break
+            items = (await session.exec(select(JobItem).where(JobItem.job_id == job.id))).all()
+            reports = (await session.exec(select(ReviewReport))).all()
+        await jobs.stop_job_workers()
+        await db.async_engine.dispose()
+        return job, items, reports
+
+    job, items, reports = asyncio.run(asyncio.wait_for(scenario(), timeout=60))
+
+    assert job.status == "completed", job.error
+    assert job.done == job.total == 60
+    assert {item.status for item in items} == {"ok"}
+    assert len(reports) == 60
+    engine.dispose()
+
+
+async def _wait_for(condition, timeout: float = 10):
+    """Ждет, пока async condition() не вернет истину."""
+    for _ in range(int(timeout / 0.01)):
+        if await condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+def _with_workers(tmp_path, monkeypatch, handler, scenario, before_start=None):
+    """Запускает scenario(session) при работающих воркерах; handler — обработчик задач вида "wait"."""
+    db_path = str(tmp_path / "database.db")
+    engine = make_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    if before_start is not None:
+        with Session(engine) as session:
+            before_start(session)
+    monkeypatch.setitem(jobs._handlers, "wait", handler)
+    monkeypatch.setattr(jobs, "JOB_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(jobs, "_workers", [])
+    monkeypatch.setattr(jobs, "_running", {})
+    monkeypatch.setattr(jobs, "_wakeup", None)
+
+    async def run():
+        monkeypatch.setattr(db, "async_engine", make_async_engine(f"sqlite+aiosqlite:///{db_path}"))
+        jobs.start_job_workers()
+        try:
+            async with new_async_session() as session:
+                return await scenario(session)
+        finally:
+            await jobs.stop_job_workers()
+            await db.async_engine.dispose()
+
+    try:
+        return asyncio.run(asyncio.wait_for(run(), timeout=30))
+    finally:
+        engine.dispose()
+
+
+async def _has_status(session: AsyncSession, job: ReviewJob, *statuses: str) -> bool:
+    await session.refresh(job)
+    return job.status in statuses
+
+
+def test_cancel_queued_job(tmp_path, monkeypatch):
+    engine = make_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    SQLModel.metadata.create_all(engine)
+
+    async def handler(session, job, params):
+        return {}
+
+    monkeypatch.setitem(jobs._handlers, "wait", handler)
+    monkeypatch.setattr(jobs, "_wakeup", None)
+
+    with Session(engine) as session:
+        job = jobs.submit_job(session, "wait", {}, "admin")
+        assert jobs.cancel_job(session, job)
+        session.refresh(job)
+        assert job.status == "cancelled" and job.finished_at is not None
+        # Отмененную задачу воркер уже не заберет, повторная отмена — отказ (409 в API)
+        assert jobs._claim_next_job(session) is None
+        assert not jobs.cancel_job(session, job)
+    engine.dispose()
+
+
+def test_cancel_running_job_keeps_finished_items(tmp_path, monkeypatch):
+    started = []
+
+    async def handler(session, job, params):
+        items = await run_db(session, jobs.add_job_items, job, ["a.py", "b.py", "c.py"])
+        await run_db(session, jobs.finish_job_item, job, items[0], report_id=1)
+        started.append(job.id)
+        await asyncio.Event().wait()
+
+    async def scenario(session):
+        job = await run_db(session, jobs.submit_job, "wait", {}, "admin")
+
+        async def running():
+            return job.id in started
+
+        await _wait_for(running)
+        assert await run_db(session, jobs.cancel_job, job)
+
+        await _wait_for(lambda: _has_status(session, job, "cancelled"))
+        items = (await session.exec(select(JobItem).where(JobItem.job_id == job.id).order_by(JobItem.id))).all()
+        return job, items
+
+    job, items = _with_workers(tmp_path, monkeypatch, handler, scenario)
+    assert job.status == "cancelled" and job.done == 1 and job.total == 3
+    assert [(item.file_path, item.status, item.report_id) for item in items] == [
+        ("a.py", "ok", 1), ("b.py", "pending", None), ("c.py", "pending", None)
+    ]
+
+
+def test_requeue_interrupted_after_restart(tmp_path, monkeypatch):
+    def interrupted(session):
+        # Процесс упал посреди задачи: статус running, один файл из трех уже готов
+        job = ReviewJob(kind="wait", params=json.dumps({"files": ["a.py", "b.py", "c.py"]}), owner="admin", status="running")
+        session.add(job)
+        session.commit()
+        session.add_all([
+            JobItem(job_id=job.id, file_path="a.py", status="ok"),
+            JobItem(job_id=job.id, file_path="b.py"),
+            JobItem(job_id=job.id, file_path="c.py"),
+        ])
+        session.commit()
+
+    async def handler(session, job, params):
+        pending = await run_db(session, jobs.add_job_items, job, params["files"])
+        for item in pending:
+            await run_db(session, jobs.finish_job_item, job, item)
+        return {"processed": [item.file_path for item in pending]}
+
+    async def scenario(session):
+        job = await session.get(ReviewJob, 1)
+
+        await _wait_for(lambda: _has_status(session, job, *jobs.FINISHED_STATUSES))
+        return job
+
+    job = _with_workers(tmp_path, monkeypatch, handler, scenario, before_start=interrupted)
+    assert job.status == "completed", job.error
+    assert json.loads(job.result) == {"processed": ["b.py", "c.py"]}
+    assert job.done == job.total == 3
+
+
+def test_items_endpoint_returns_partial_results(tmp_path, monkeypatch):
+    release = asyncio.Event()
+
+    async def handler(session, job, params):
+        items = await run_db(session, jobs.add_job_items, job, ["a.py", "b.py", "c.py"])
+        await run_db(session, jobs.finish_job_item, job, items[0], report_id=7)
+        await run_db(session, jobs.finish_job_item, job, items[1], error="Mistral API: 503")
+        await release.wait()
+        await run_db(session, jobs.finish_job_item, job, items[2], report_id=9)
+        return {}
+
+    async def scenario(session):
+        user = User(username="admin", hashed_password="")
+        job = await run_db(session, jobs.submit_job, "wait", {}, "admin")
+
+        async def two_done():
+            await session.refresh(job)
+            return job.done == 2
+
+        await _wait_for(two_done)
+        partial = await main.get_job_items(job.id, status=None, current_user=user, session=session)
+        only_ok = await main.get_job_items(job.id, status="ok", current_user=user, session=session)
+        view = await main.get_job(job.id, current_user=user, session=session)
+        release.set()
+
+        await _wait_for(lambda: _has_status(session, job, "completed"))
+        # У API своя сессия на запрос: строки перечитываются, а не берутся из identity map
+        async with new_async_session() as request_session:
+            final = await main.get_job_items(job.id, status=None, current_user=user, session=request_session)
+        return view, partial, only_ok, final
+
+    view, partial, only_ok, final = _with_workers(tmp_path, monkeypatch, handler, scenario)
+    assert view["status"] == "running"
+    assert [(item.file_path, item.status, item.report_id) for item in partial] == [
+        ("a.py", "ok", 7), ("b.py", "error", None), ("c.py", "pending", None)
+    ]
+    assert partial[1].error == "Mistral API: 503"
+    assert [item.file_path for item in only_ok] == ["a.py"]
+    assert [item.status for item in final] == ["ok", "error", "ok"]
@@ -0,0 +1,46 @@
+"""
+Манифест Агента: в ревью идут только новые и измененные файлы, "потроганные" и удаленные обновляют манифест.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_manifest.py -q
+"""
+import asyncio
+import os
+
+from sqlmodel import Session, create_engine, select
+
+from app.db import init_db
+from app.manifest import detect_changes, record_file
+from app.models import FileManifest
+
+
+def test_detect_changes(tmp_path):
+    paths = []
+    for name in ("a.py", "b.py", "c.py"):
+        path = tmp_path / name
+        path.write_text(f"NAME = {name!r}\n")
+        paths.append(str(path))
+    a, b, c = paths
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    init_db(engine)
+    with Session(engine) as session:
+        changed = asyncio.run(detect_changes(session, "demo", paths))
+        assert sorted(changed) == paths
+        for file_path, fingerprint in changed.items():
+            record_file(session, "demo", file_path, fingerprint)
+        session.commit()
+        assert asyncio.run(detect_changes(session, "demo", paths)) == {}
+
+        os.utime(a, ns=(0, 0))
+        with open(b, "a") as f:
+            f.write("EXTRA = 1\n")
+        os.remove(c)
+        changed = asyncio.run(detect_changes(session, "demo", [a, b]))
+        session.commit()
+        assert list(changed) == [b]
+
+        entries = {entry.file_path: entry for entry in session.exec(select(FileManifest))}
+        assert sorted(entries) == [a, b]
+        assert entries[a].mtime_ns == 0
+    engine.dispose()
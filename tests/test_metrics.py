@@ -0,0 +1,87 @@
+"""
+/metrics: формат Prometheus и замеры маршрутов по шаблону пути.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_metrics.py -q
+"""
+import asyncio
+import json
+
+from aiohttp import web
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app import ai_client
+from app.metrics import Histogram, MetricsRoute, http_in_flight, render_metrics
+
+
+def test_histogram_exposition():
+    latency = Histogram("test_latency_seconds", "Test histogram", ("kind",), buckets=(0.1, 1))
+    latency.observe(0.05, "a")
+    latency.observe(0.5, "a")
+    latency.observe(5, "a")
+    text = render_metrics()
+    assert "# TYPE test_latency_seconds histogram" in text
+    assert 'test_latency_seconds_bucket{kind="a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{kind="a",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{kind="a",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{kind="a"} 3' in text
+    assert 'test_latency_seconds_sum{kind="a"} 5.55' in text
+
+
+def test_route_metrics():
+    app = FastAPI()
+    app.router.route_class = MetricsRoute
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404)
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/items/0")
+    text = render_metrics()
+    # Метка — шаблон пути, а не URL: число рядов не растет с числом id
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2' in text
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}"} 3' in text
+    assert http_in_flight.values[("GET", "/items/{item_id}")] == 0
+
+
+def test_stream_ttft_histogram(monkeypatch):
+    async def handler(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(0.15)
+        for text in ("Замечаний ", "нет"):
+            chunk = {"choices": [{"delta": {"content": text}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(ai_client, "MISTRAL_API_URL", f"http://127.0.0.1:{port}/v1/chat/completions")
+        try:
+            return "".join([delta async for delta in ai_client.stream_code_review_async("x = 1", api_key="key")])
+        finally:
+            await ai_client.close_http_session()
+            await runner.cleanup()
+
+    before = ai_client.mistral_ttft.values.get((), [[0], 0.0])[0][:]
+    assert asyncio.run(scenario()) == "Замечаний нет"
+    counts, total = ai_client.mistral_ttft.values[()]
+    assert sum(counts) == sum(before) + 1 and total >= 0.15
+    text = render_metrics()
+    assert "# TYPE mistral_stream_ttft_seconds histogram" in text
+    assert 'mistral_stream_ttft_seconds_bucket{le="0.1"}' in text
+    assert ai_client.ttft_summary()["count"] >= 1
@@ -0,0 +1,76 @@
+"""
+Keyset-пагинация /api/reports: курсор кодируется и читается обратно, отчеты с одинаковым created_at
+не теряются и не повторяются между страницами (добивка по id).
+
+Запуск из корня проекта:
+    python -m pytest tests/test_pagination.py -q
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlmodel import SQLModel
+
+from app import main
+from app.blobs import new_report
+from app.db import make_async_engine, make_engine, new_async_session
+from app.models import ReviewReportListItem, User
+
+
+def _item(report_id, created_at):
+    return ReviewReportListItem(
+        id=report_id, project_name="demo", file_path="/src/a.py", content_type="code",
+        summary="Local scan", status="completed", created_at=created_at,
+    )
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 5, 17, 12, 30, 45, 123456)
+    cursor = main._encode_cursor(_item(42, created_at))
+    assert "=" not in cursor
+    assert main._decode_cursor(cursor) == (created_at, 42)
+
+    for broken in ("not-a-cursor", "", "MjAyNi0wNS0xNw"):
+        with pytest.raises(HTTPException) as error:
+            main._decode_cursor(broken)
+        assert error.value.status_code == 400
+
+
+def test_pages_with_equal_created_at(tmp_path):
+    db_path = str(tmp_path / "database.db")
+    engine = make_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    same_moment = datetime(2026, 1, 1)
+    moments = [datetime(2026, 1, 2), same_moment, same_moment, same_moment, same_moment, datetime(2025, 12, 31)]
+
+    async def scenario():
+        async_engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        async with new_async_session(async_engine) as session:
+            def add_reports(sync_session):
+                for i, created_at in enumerate(moments):
+                    sync_session.add(new_report(
+                        sync_session, f"ревью {i}", project_name="demo", file_path=f"/src/m{i}.py",
+                        content_type="code", summary="Local scan", status="completed", created_at=created_at,
+                    ))
+                sync_session.commit()
+
+            await session.run_sync(add_reports)
+            user = User(username="admin", hashed_password="")
+            pages, cursor = [], None
+            while True:
+                page = await main.get_reports(
+                    limit=2, cursor=cursor, project=None, status=None, created_from=None, created_to=None,
+                    current_user=user, session=session,
+                )
+                pages.append([item.id for item in page["items"]])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+        await async_engine.dispose()
+        return pages
+
+    pages = asyncio.run(scenario())
+    # Новые сверху; при равном created_at — по убыванию id
+    assert pages == [[1, 5], [4, 3], [2, 6]]
+    engine.dispose()
@@ -0,0 +1,118 @@
+"""
+Разбор PDF: страницы из параллельно разбираемых диапазонов идут по порядку, лимиты PDF_MAX_PAGES /
+PDF_MAX_CHARS обрезают текст с пометкой, слишком большой файл отклоняется, тайминги документов копятся.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_pdf_engine.py -q
+"""
+import asyncio
+from collections import deque
+
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from app import pdf_engine
+from app.pdf_engine import PdfLimitError, extract_pdf_text, slowest_documents, stream_pdf_pages
+
+
+def make_pdf(path, pages: int) -> str:
+    """PDF из pages страниц, на каждой строка "Page N"."""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for number in range(1, pages + 1):
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+        })
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td (Page {number}) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+@pytest.fixture
+def timings(monkeypatch):
+    records = deque(maxlen=200)
+    monkeypatch.setattr(pdf_engine, "pdf_timings", records)
+    return records
+
+
+def test_pages_in_order_across_parallel_ranges(tmp_path, monkeypatch):
+    # Диапазоны по 2 страницы: 9 страниц разбираются пятью задачами в пуле процессов
+    monkeypatch.setattr(pdf_engine, "PDF_PAGES_PER_CHUNK", 2)
+    monkeypatch.setattr(pdf_engine, "CPU_WORKERS", 4)
+    path = make_pdf(tmp_path / "doc.pdf", 9)
+
+    async def collect():
+        return [(page_no, text) async for page_no, text, _ in stream_pdf_pages(path)]
+
+    pages = asyncio.run(collect())
+    assert [page_no for page_no, _ in pages] == list(range(1, 10))
+    assert [text.strip() for _, text in pages] == [f"Page {n}" for n in range(1, 10)]
+
+
+def test_truncated_by_max_pages(tmp_path, timings, monkeypatch):
+    monkeypatch.setattr(pdf_engine, "PDF_MAX_PAGES", 3)
+    path = make_pdf(tmp_path / "doc.pdf", 5)
+
+    text = asyncio.run(extract_pdf_text(path))
+    lines = text.splitlines()
+    assert [line.strip() for line in lines[:-1]] == ["Page 1", "Page 2", "Page 3"]
+    assert lines[-1] == "... (truncated: 3 of 5 pages)"
+
+
+def test_truncated_by_max_chars(tmp_path, timings, monkeypatch):
+    monkeypatch.setattr(pdf_engine, "PDF_MAX_CHARS", 10)
+    path = make_pdf(tmp_path / "doc.pdf", 4)
+
+    text = asyncio.run(extract_pdf_text(path))
+    body, note = text.rsplit("\n", 1)
+    assert len(body.replace("\n", "")) <= 10
+    assert body.startswith("Page 1")
+    assert note == "... (truncated: 2 of 4 pages)"
+
+
+def test_whole_document_has_no_note(tmp_path, timings):
+    path = make_pdf(tmp_path / "doc.pdf", 3)
+    text = asyncio.run(extract_pdf_text(path))
+    assert "truncated" not in text
+    assert [line.strip() for line in text.splitlines()] == ["Page 1", "Page 2", "Page 3"]
+
+
+def test_oversized_pdf_is_rejected(tmp_path, timings, monkeypatch):
+    path = make_pdf(tmp_path / "doc.pdf", 2)
+    monkeypatch.setattr(pdf_engine, "PDF_MAX_BYTES", 100)
+
+    with pytest.raises(PdfLimitError):
+        asyncio.run(extract_pdf_text(path))
+
+    async def first_page():
+        async for page in stream_pdf_pages(path):
+            return page
+
+    with pytest.raises(PdfLimitError):
+        asyncio.run(first_page())
+    assert not timings
+
+
+def test_document_timings(tmp_path, timings):
+    path = make_pdf(tmp_path / "doc.pdf", 3)
+    asyncio.run(extract_pdf_text(path, label="report.pdf"))
+    asyncio.run(extract_pdf_text(path))
+
+    first, second = timings
+    assert first["file"] == "report.pdf" and second["file"] == "doc.pdf"
+    assert first["pages"] == 3 and 1 <= first["slowest_page"] <= 3
+    assert first["total_ms"] >= first["slowest_page_ms"] >= 0
+
+    timings.extend({"file": f"f{i}.pdf", "total_ms": float(ms)} for i, ms in enumerate([5000, 1, 9000]))
+    slowest = slowest_documents(limit=2)
+    assert [item["file"] for item in slowest] == ["f2.pdf", "f0.pdf"]
+    assert len(slowest_documents()) == 5
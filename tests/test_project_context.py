@@ -0,0 +1,107 @@
+"""
+Контекст проекта: .clinerules генерируется заново только при смене отпечатка, в промпт идет сжатый дайджест.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_project_context.py -q
+"""
+import asyncio
+import os
+
+from sqlmodel import Session, create_engine
+
+from app import project_context
+from app.chunker import estimate_tokens
+from app.db import init_db
+from app.project_context import digest_rules, load_project_context, project_fingerprint
+
+RULES = """# Правила проекта
+
+## 1. Фреймворки
+- **FastAPI** 0.110, SQLModel
+- **FastAPI** 0.110, SQLModel
+
+## 2. Стандарты
+1. Type hints во всех публичных функциях.
+2. Docstrings на русском.
+```
+---
+```
+""" + "\n".join(f"- Правило номер {i}: подробное объяснение, зачем оно нужно проекту." for i in range(200))
+
+
+def _write(root, rel_path, text):
+    path = os.path.join(root, *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_digest_fits_budget():
+    digest = digest_rules(RULES, budget=100)
+    lines = digest.splitlines()
+    assert lines[:4] == ["Правила проекта", "1. Фреймворки", "FastAPI 0.110, SQLModel", "2. Стандарты"]
+    assert estimate_tokens(digest) <= 100 + len(lines)
+    assert estimate_tokens(digest) < estimate_tokens(RULES) / 10
+
+
+def test_fingerprint_ignores_code_edits(tmp_path):
+    root = str(tmp_path)
+    _write(root, "requirements.txt", "fastapi\n")
+    _write(root, "app/main.py", "x = 1\n")
+    fingerprint, sample = project_fingerprint(root)
+    assert sample == [os.path.join(root, "requirements.txt"), os.path.join(root, "app", "main.py")]
+
+    _write(root, "app/main.py", "x = 2\n")
+    _write(root, "app/other.py", "y = 1\n")
+    _write(root, ".clinerules", "rules")
+    assert project_fingerprint(root)[0] == fingerprint
+
+    _write(root, "app/api/routes.py", "")
+    assert project_fingerprint(root)[0] != fingerprint
+    fingerprint = project_fingerprint(root)[0]
+    _write(root, "requirements.txt", "fastapi\nsqlmodel\n")
+    assert project_fingerprint(root)[0] != fingerprint
+
+
+def test_rules_regenerated_only_on_fingerprint_change(tmp_path, monkeypatch):
+    root = str(tmp_path / "project")
+    _write(root, "requirements.txt", "fastapi\n")
+    _write(root, "app/main.py", "x = 1\n")
+    calls = []
+
+    async def fake_generate(files, requirements, api_key):
+        calls.append(requirements)
+        return RULES
+
+    monkeypatch.setattr(project_context, "generate_clinerules_async", fake_generate)
+    monkeypatch.setattr(project_context, "_contexts", {})
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    init_db(engine)
+
+    def load():
+        with Session(engine) as session:
+            return asyncio.run(load_project_context(session, "project", root))
+
+    assert load()["action"] == "generated"
+    context = load()
+    assert context["action"] == "memory" and len(calls) == 1
+    assert context["digest_tokens"] <= project_context.RULES_DIGEST_TOKENS < context["rules_tokens"]
+
+    # Новая зависимость — правила генерируются заново
+    _write(root, "requirements.txt", "fastapi\nsqlmodel\n")
+    assert load()["action"] == "generated" and len(calls) == 2
+
+    # Ручную правку .clinerules не перезаписываем
+    _write(root, ".clinerules", "Только type hints.\n")
+    _write(root, "app/api/routes.py", "")
+    context = load()
+    assert context["action"] == "kept_edited" and context["digest"] == "Только type hints."
+    assert len(calls) == 2
+
+    # Следующая смена отпечатка тоже не трогает отредактированный файл
+    _write(root, "requirements.txt", "fastapi\nsqlmodel\nhttpx\n")
+    context = load()
+    assert context["action"] == "kept_edited" and context["digest"] == "Только type hints."
+    assert len(calls) == 2
+    with open(os.path.join(root, ".clinerules")) as f:
+        assert f.read() == "Только type hints.\n"
@@ -0,0 +1,136 @@
+"""
+Circuit breaker и лимитеры клиента Mistral: open -> half-open -> closed, проба не "застревает" после 4xx.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_resilience.py -q
+"""
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from app import ai_client
+from app.ai_client import MistralError, _call_mistral
+from app.resilience import AdaptiveConcurrency, CircuitBreaker, TokenBucket
+
+
+def test_breaker_open_half_open_closed():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    # Пока идет пробный запрос, остальные отклоняются
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.failures == 0
+
+
+def test_breaker_probe_released_without_verdict():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+def test_limiters():
+    bucket = TokenBucket(per_minute=60)
+    asyncio.run(bucket.acquire(60))
+    assert bucket.tokens < 1
+    bucket.adjust(-30)
+    assert bucket.tokens >= 30
+
+    concurrency = AdaptiveConcurrency(initial=4, maximum=5)
+    concurrency.on_throttle()
+    assert concurrency.limit == 2
+    for _ in range(20):
+        concurrency.on_success()
+    assert concurrency.limit == 5
+
+
+@pytest.fixture
+def fake_mistral(monkeypatch):
+    """Локальный сервер: отвечает статусами из списка statuses (последний повторяется; "slow" — 200 через 1 с)."""
+    statuses = []
+
+    async def handler(request):
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        if status == "slow":
+            await asyncio.sleep(1)
+            status = 200
+        if status != 200:
+            return web.Response(status=status, text="error")
+        return web.json_response({"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 10}})
+
+    monkeypatch.setattr(ai_client, "MISTRAL_MAX_RETRIES", 0)
+    monkeypatch.setattr(ai_client, "MISTRAL_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(ai_client, "MISTRAL_BREAKER_COOLDOWN", 0.05)
+    # Guard создается лениво с текущими настройками; другие тесты могли уже создать свой
+    monkeypatch.setattr(ai_client, "_guard", None)
+
+    async def run(scenario):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(ai_client, "MISTRAL_API_URL", f"http://127.0.0.1:{port}/v1/chat/completions")
+        try:
+            return await scenario(statuses)
+        finally:
+            await ai_client.close_http_session()
+            await runner.cleanup()
+
+    return run
+
+
+async def _call():
+    try:
+        return await _call_mistral([{"role": "user", "content": "hi"}], "key")
+    except MistralError as e:
+        return str(e)
+
+
+def test_breaker_recovers_after_4xx_probe(fake_mistral):
+    async def scenario(statuses):
+        statuses[:] = [503, 503, 401, 200]
+        assert "503" in await _call()
+        assert "503" in await _call()
+        assert "circuit open" in await _call()
+        await asyncio.sleep(0.06)
+        # Проба получила 401: API доступен, breaker замыкается
+        assert "401" in await _call()
+        assert await _call() == "ok"
+        assert await _call() == "ok"
+
+    asyncio.run(fake_mistral(scenario))
+
+
+def test_breaker_releases_cancelled_probe(fake_mistral):
+    async def scenario(statuses):
+        statuses[:] = [503, 503, "slow", 200]
+        await _call()
+        await _call()
+        await asyncio.sleep(0.06)
+        probe = asyncio.ensure_future(_call())
+        await asyncio.sleep(0.2)
+        assert ai_client._get_guard().breaker.probing
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert await _call() == "ok"
+
+    asyncio.run(fake_mistral(scenario))
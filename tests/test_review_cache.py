@@ -0,0 +1,152 @@
+"""
+Кэш ревью: ключ, счетчики попаданий (каждый ключ проверяется один раз), TTL, LRU-вытеснение и фоновая очистка.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_review_cache.py -q
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app import main, review_cache
+from app.db import make_async_engine, make_engine, new_async_session
+from app.models import ReviewCache
+from app.pipeline import review_files
+from app.review_cache import evict_review_cache, get_cached_review, make_cache_key, store_review
+
+SMALL = "def add(a, b):\n    return a + b\n"
+# Больше порога пакета, но меньше бюджета фрагмента: уходит одним запросом
+LARGE = "".join(f"def handler_{i}(request):\n    return request.user.id + {i}\n\n" for i in range(40))
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    counters = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+    monkeypatch.setattr(review_cache, "cache_stats", counters)
+    return counters
+
+
+def test_key_depends_on_rules_prompt_and_model(monkeypatch):
+    key = make_cache_key(SMALL, "PEP8")
+    assert make_cache_key(SMALL, "PEP8") == key
+    assert make_cache_key(SMALL + "\n", "PEP8") != key
+    assert make_cache_key(SMALL, "PEP8, type hints") != key
+    monkeypatch.setattr(review_cache, "REVIEW_PROMPT_VERSION", "next")
+    assert make_cache_key(SMALL, "PEP8") != key
+    monkeypatch.undo()
+    monkeypatch.setattr(review_cache, "MODEL_NAME", "another-model")
+    assert make_cache_key(SMALL, "PEP8") != key
+
+
+def test_each_key_is_checked_once(tmp_path, session, stats, fake_mistral):
+    requests = fake_mistral
+    paths = []
+    for name, code in (("a.py", SMALL), ("b.py", SMALL.replace("add", "sub")), ("big.py", LARGE)):
+        path = tmp_path / name
+        path.write_text(code)
+        paths.append(str(path))
+
+    outcomes = asyncio.run(review_files(session, paths, triage=False))
+    assert [outcome["result"][1] for outcome in outcomes] == [False, False, False]
+    # Промах считается один раз на ключ: повторной проверки в review_with_cache нет
+    assert stats == {"hits": 0, "misses": 3, "stored": 3, "evicted": 0}
+    assert len(requests) == 2
+
+    outcomes = asyncio.run(review_files(session, paths, triage=False))
+    assert [outcome["result"][1] for outcome in outcomes] == [True, True, True]
+    assert stats["hits"] == 3 and stats["misses"] == 3 and len(requests) == 2
+
+
+def test_review_with_cache_lookup(session, stats, monkeypatch):
+    async def fake_review(code, context="", api_key=""):
+        return "fresh"
+
+    monkeypatch.setattr(review_cache, "get_code_review_async", fake_review)
+    assert asyncio.run(review_cache.review_with_cache(session, SMALL)) == ("fresh", False)
+    assert asyncio.run(review_cache.review_with_cache(session, SMALL)) == ("fresh", True)
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    # lookup=False: промах уже известен — кэш не читается и не считается
+    assert asyncio.run(review_cache.review_with_cache(session, SMALL, lookup=False)) == ("fresh", False)
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_ttl_expiry(session, stats):
+    store_review(session, "old", "old review")
+    store_review(session, "new", "new review")
+    entry = session.get(ReviewCache, "old")
+    entry.created_at = datetime.utcnow() - timedelta(seconds=review_cache.REVIEW_CACHE_TTL + 60)
+    session.add(entry)
+    session.commit()
+
+    assert get_cached_review(session, "old") is None
+    assert get_cached_review(session, "new") == "new review"
+    assert evict_review_cache(session) == 1
+    assert session.get(ReviewCache, "old") is None and stats["evicted"] == 1
+
+
+def test_lru_eviction(session, stats, monkeypatch):
+    monkeypatch.setattr(review_cache, "REVIEW_CACHE_MAX_ENTRIES", 2)
+    started = datetime.utcnow() - timedelta(hours=1)
+    for i, key in enumerate(("a", "b", "c")):
+        store_review(session, key, f"review {key}")
+        entry = session.get(ReviewCache, key)
+        entry.last_used_at = started + timedelta(minutes=i)
+        session.add(entry)
+        session.commit()
+    # Попадание обновляет last_used_at: "a" становится самым свежим
+    assert get_cached_review(session, "a") == "review a"
+
+    assert evict_review_cache(session) == 1
+    assert session.get(ReviewCache, "b") is None
+    assert session.get(ReviewCache, "a") is not None and session.get(ReviewCache, "c") is not None
+
+
+def test_eviction_runs_as_startup_task(tmp_path, stats, monkeypatch):
+    db_path = str(tmp_path / "database.db")
+    engine = make_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for key in ("a", "b", "c"):
+            store_review(session, key, f"review {key}")
+    monkeypatch.setattr(review_cache, "REVIEW_CACHE_MAX_ENTRIES", 1)
+    monkeypatch.setattr(main, "REVIEW_CACHE_EVICT_INTERVAL", 0.05)
+    monkeypatch.setattr(main, "AGENT_ENABLED", False)
+
+    async def scenario():
+        async_engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        monkeypatch.setattr(main, "new_async_session", lambda: new_async_session(async_engine))
+        task = asyncio.create_task(main.review_cache_maintenance())
+        # Первая очистка — сразу при старте, дальше — по интервалу
+        for _ in range(200):
+            if stats["evicted"] >= 2:
+                break
+            await asyncio.sleep(0.01)
+        first = stats["evicted"]
+        with Session(engine) as session:
+            for key in ("d", "e"):
+                store_review(session, key, f"review {key}")
+        for _ in range(200):
+            if stats["evicted"] >= 4:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await async_engine.dispose()
+        return first
+
+    assert asyncio.run(scenario()) == 2
+    assert stats["evicted"] == 4
+    with Session(engine) as session:
+        assert len(session.exec(select(ReviewCache)).all()) == 1
+    engine.dispose()
@@ -0,0 +1,72 @@
+"""
+run_bounded: результаты в порядке входа, ошибка одного элемента не отменяет остальные,
+одновременно в работе не больше concurrency (SCAN_CONCURRENCY по умолчанию).
+
+Запуск из корня проекта:
+    python -m pytest tests/test_scan_engine.py -q
+"""
+import asyncio
+
+from app import scan_engine
+from app.scan_engine import run_bounded
+
+
+class InFlight:
+    """Счетчик задач в работе и его пик."""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    async def run(self, seconds: float):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.current -= 1
+
+
+def test_results_in_input_order():
+    async def worker(item):
+        # Первые элементы заканчиваются последними
+        await asyncio.sleep(0.002 * (10 - item))
+        return item * item
+
+    outcomes = asyncio.run(run_bounded(range(10), worker, concurrency=4))
+    assert [outcome["item"] for outcome in outcomes] == list(range(10))
+    assert [outcome["result"] for outcome in outcomes] == [item * item for item in range(10)]
+
+
+def test_failure_does_not_cancel_others():
+    finished = []
+
+    async def worker(item):
+        if item == 2:
+            raise ValueError(f"broken {item}")
+        await asyncio.sleep(0.01)
+        finished.append(item)
+        return item
+
+    outcomes = asyncio.run(run_bounded(range(6), worker, concurrency=3))
+    assert outcomes[2] == {"item": 2, "ok": False, "error": "broken 2"}
+    assert [outcome["result"] for i, outcome in enumerate(outcomes) if i != 2] == [0, 1, 3, 4, 5]
+    assert sorted(finished) == [0, 1, 3, 4, 5]
+
+
+def test_peak_in_flight_within_limit(monkeypatch):
+    counter = InFlight()
+
+    async def worker(item):
+        await counter.run(0.005)
+        return item
+
+    outcomes = asyncio.run(run_bounded(range(20), worker, concurrency=3))
+    assert all(outcome["ok"] for outcome in outcomes)
+    assert counter.peak == 3 and counter.current == 0
+
+    # Без concurrency — общий лимит SCAN_CONCURRENCY
+    monkeypatch.setattr(scan_engine, "SCAN_CONCURRENCY", 5)
+    counter = InFlight()
+    asyncio.run(run_bounded(range(20), worker))
+    assert counter.peak == 5
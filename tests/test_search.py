@@ -0,0 +1,62 @@
+"""
+Поиск по отчетам: удаленный или измененный отчет (в том числе из админки, в обход ORM) не находится по старому тексту.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_search.py -q
+"""
+import sqlite3
+
+from sqlmodel import Session
+
+from app.blobs import new_report
+from app.db import make_engine, init_db
+from app.search import ensure_search_index, search_reports
+
+
+def _add(session, review_text, file_path):
+    report = new_report(
+        session, review_text, project_name="demo", file_path=file_path,
+        content_type="code", summary="Local scan", status="completed"
+    )
+    session.add(report)
+    session.commit()
+    return report.id
+
+
+def _found(session, query):
+    return [item["file_path"] for item in search_reports(session, query, limit=20)]
+
+
+def test_deleted_and_updated_reports_leave_the_index(tmp_path):
+    db_path = str(tmp_path / "database.db")
+    engine = make_engine(f"sqlite:///{db_path}")
+    init_db(engine)
+    ensure_search_index(engine)
+
+    with Session(engine) as session:
+        _add(session, "SQL-инъекция в запросе", "/src/a.py")
+        last_id = _add(session, "Утечка памяти в кэше", "/src/b.py")
+        _add(session, "Нет замечаний", "/src/c.py")
+        assert _found(session, "утечка") == ["/src/b.py"]
+
+    # Админка удаляет и правит отчеты обычным SQL, минуя приложение
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM reviewreport WHERE file_path = '/src/c.py'")
+    conn.execute("DELETE FROM reviewreport WHERE id = ?", (last_id,))
+    conn.execute("UPDATE reviewreport SET file_path = '/src/renamed.py' WHERE file_path = '/src/a.py'")
+    conn.commit()
+    conn.close()
+
+    with Session(engine) as session:
+        # Новый отчет получает rowid удаленного (AUTOINCREMENT нет) — старый текст к нему не прилипает
+        assert _add(session, "Гонка данных в воркере", "/src/d.py") == last_id
+        assert _found(session, "утечка") == []
+        assert _found(session, "гонка") == ["/src/d.py"]
+        assert _found(session, "замечаний") == []
+        assert _found(session, "инъекция") == ["/src/renamed.py"]
+        assert _found(session, "renamed") == ["/src/renamed.py"]
+
+        conn = session.connection().connection.dbapi_connection
+        count, = conn.execute("SELECT COUNT(*) FROM reviewreport_fts").fetchone()
+        assert count == 2
+    engine.dispose()
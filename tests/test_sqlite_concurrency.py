@@ -0,0 +1,76 @@
+"""
+Админка читает общую database.db, пока Агент пишет отчеты: ни одного "database is locked".
+
+Запуск из корня проекта:
+    python -m pytest tests/test_sqlite_concurrency.py -q
+"""
+import asyncio
+import sqlite3
+import threading
+
+from sqlmodel import SQLModel
+
+from app import main
+from app.db import make_engine, make_async_engine, new_async_session
+
+
+def admin_reads(db_path: str, stop: threading.Event, errors: list, counts: list):
+    """Как Django-админка: отдельное соединение sqlite3, список отчетов и счетчик."""
+    conn = sqlite3.connect(db_path, timeout=20)
+    try:
+        while not stop.is_set():
+            try:
+                conn.execute(
+                    "SELECT id, project_name, file_path, status, created_at FROM reviewreport ORDER BY id DESC LIMIT 20"
+                ).fetchall()
+                counts.append(conn.execute("SELECT COUNT(*) FROM reviewreport").fetchone()[0])
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+    finally:
+        conn.close()
+
+
+def test_admin_reads_during_agent_scan(tmp_path, monkeypatch, fake_mistral):
+    db_path = str(tmp_path / "database.db")
+    engine = make_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+
+    project = tmp_path / "PycharmProjects" / "demo"
+    project.mkdir(parents=True)
+    (project / ".clinerules").write_text("PEP8")
+    files = []
+    for i in range(300):
+        path = project / f"module_{i}.py"
+        # Часть файлов крупные (по одному на запрос), остальные уходят пакетами
+        path.write_text(f"def f{i}():\n    return {i}\n" * (1 if i % 3 else 200))
+        files.append(str(path))
+
+    monkeypatch.setattr(main, "MISTRAL_API_KEY", "test")
+
+    stop = threading.Event()
+    errors, counts = [], []
+    readers = [threading.Thread(target=admin_reads, args=(db_path, stop, errors, counts)) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    async def agent_scan():
+        async_engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        async with new_async_session(async_engine) as session:
+            await main._agent_review_project(session, "demo", str(project), files)
+        await async_engine.dispose()
+
+    try:
+        asyncio.run(agent_scan())
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert counts and max(counts) == len(files)
+    # Отчеты появлялись пачками по ходу скана, а не одним коммитом в конце
+    assert len(set(counts)) > 2
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+    engine.dispose()
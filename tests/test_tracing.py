@@ -0,0 +1,58 @@
+"""
+Трассировка фаз запроса (JSON-спаны с trace_id) и профилирование следующих N запросов.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_tracing.py -q
+"""
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import tracing
+from app.tracing import TracedRoute, span
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+def test_request_spans_and_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "PROFILE_DIR", str(tmp_path))
+    collect = _Collect()
+    tracing.trace_logger.addHandler(collect)
+
+    app = FastAPI()
+    app.router.route_class = TracedRoute
+
+    @app.get("/work")
+    async def work():
+        with span("phase.one", items=3) as trace_span:
+            trace_span.set(done=True)
+        return {"ok": True}
+
+    try:
+        tracing.profiler.arm(requests=1)
+        response = TestClient(app).get("/work", headers={"X-Trace-Id": "abc-123"})
+    finally:
+        tracing.trace_logger.removeHandler(collect)
+
+    assert response.headers["X-Trace-Id"] == "abc-123"
+    phase, root = collect.records
+    assert root["name"] == "GET /work" and root["parent_id"] is None
+    assert phase == {**phase, "name": "phase.one", "trace_id": "abc-123", "parent_id": root["span_id"], "items": 3, "done": True}
+    # Профиль одного запроса сохранен, повторный запрос уже не профилируется
+    assert tracing.profiler.status()["remaining_requests"] == 0
+    assert [p["name"].endswith("requests-1.prof") for p in tracing.list_profiles()] == [True]
+
+
+def test_span_outside_trace_is_noop():
+    with span("orphan") as trace_span:
+        trace_span.set(ignored=True)
+    assert tracing.current_trace_id() is None
@@ -0,0 +1,59 @@
+"""
+Локальный разбор перед ревью: шаблонные файлы не отправляются в Mistral, рискованные идут первыми.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_triage.py -q
+"""
+from app.triage import order_by_risk, triage_source, triage_sources
+
+RISKY = '''
+import subprocess
+
+def run(cmd, user_id, cursor):
+    try:
+        subprocess.run(cmd, shell=True)
+        cursor.execute(f"SELECT * FROM users WHERE id = {user_id}")
+        return eval(cmd)
+    except:
+        pass
+'''
+
+PLAIN = '''
+def add(a, b):
+    """Сумма."""
+    if a is None or b is None:
+        return None
+    return a + b
+'''
+
+MIGRATION = '''
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = []
+    operations = []
+'''
+
+
+def test_skip_reasons():
+    assert triage_source("pkg/__init__.py", "")["skip"] == "empty"
+    assert triage_source("pkg/__init__.py", '"""Пакет."""\nfrom .core import run\n')["skip"] == "imports_only"
+    assert triage_source("app/migrations/0001_initial.py", MIGRATION)["skip"] == "migration"
+    assert triage_source("api/schema_pb2.py", PLAIN)["skip"] == "generated"
+    assert triage_source("gen.py", "# Code generated by protoc. DO NOT EDIT.\n" + PLAIN)["skip"] == "generated"
+    assert triage_source("const.py", "LIMIT = 10\n")["skip"] == "trivial"
+    assert triage_source("broken.py", "def f(:\n    pass\n")["signals"] == {"syntax_error": 1}
+
+
+def test_risk_signals_and_order():
+    risky = triage_source("service.py", RISKY)
+    assert risky["skip"] is None
+    assert risky["signals"] == {"subprocess": 1, "shell": 1, "sql_string": 1, "eval_exec": 1, "bare_except": 1}
+    plain = triage_source("math_utils.py", PLAIN)
+    assert plain["signals"] == {} and plain["complexity"] == 3
+
+    files = [("math_utils.py", PLAIN), ("test_service.py", RISKY), ("service.py", RISKY)]
+    results = {info["path"]: info for info in triage_sources(files)}
+    assert results["test_service.py"]["downgraded"]
+    assert [path for path, _ in order_by_risk(files, results)] == ["service.py", "test_service.py", "math_utils.py"]
@@ -0,0 +1,115 @@
+"""
+SSE-ревью загрузки (/api/upload-and-review/stream): токены, затем done или error; отчет сохраняется,
+только когда поток закончился; отказ Mistral — отчет со статусом failed; попадание в кэш — один token.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_upload_stream.py -q
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, select
+
+from app import main
+from app.ai_client import MistralError
+from app.auth import get_current_user
+from app.blobs import load_text
+from app.db import make_async_engine, make_engine, new_async_session
+from app.models import ReviewReport, User
+from app.review_cache import make_cache_key, store_review
+
+CODE = "def add(a, b):\n    return a + b\n"
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "database.db")
+    engine = make_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    async_engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    monkeypatch.setattr(main, "new_async_session", lambda: new_async_session(async_engine))
+    # Без startup-задач приложения (миграции, Агент, очистка кэша) — только эндпоинт
+    monkeypatch.setattr(main.app.router, "on_startup", [])
+    monkeypatch.setattr(main.app.router, "on_shutdown", [])
+    main.app.dependency_overrides[get_current_user] = lambda: User(username="admin", hashed_password="")
+    with TestClient(main.app) as client:
+        yield client, engine
+        client.portal.call(async_engine.dispose)
+    main.app.dependency_overrides.pop(get_current_user, None)
+    engine.dispose()
+
+
+def _post(client):
+    response = client.post("/api/upload-and-review/stream", files={"file": ("a.py", CODE.encode())})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def _reports(engine):
+    with Session(engine) as session:
+        return [(report, load_text(session, report.review_hash)) for report in session.exec(select(ReviewReport)).all()]
+
+
+def test_tokens_then_done(env, monkeypatch):
+    client, engine = env
+    saved_during_stream = []
+
+    async def fake_stream(code, context="", api_key=""):
+        for delta in ("Замечание ", "к ", "a.py"):
+            yield delta
+            saved_during_stream.append(len(_reports(engine)))
+
+    monkeypatch.setattr(main, "stream_code_review_async", fake_stream)
+    events = _post(client)
+
+    assert [event for event, _ in events] == ["token", "token", "token", "done"]
+    assert "".join(data["text"] for _, data in events[:-1]) == "Замечание к a.py"
+    done = events[-1][1]
+    assert done["cached"] is False and done["ttft_ms"] >= 0
+    # Пока идут токены, отчета еще нет: он пишется одним коммитом в конце потока
+    assert saved_during_stream == [0, 0, 0]
+    (report, review), = _reports(engine)
+    assert report.id == done["report_id"] and report.status == "completed"
+    assert review == "Замечание к a.py"
+
+
+def test_mistral_error_saves_failed_report(env, monkeypatch):
+    client, engine = env
+
+    async def failing_stream(code, context="", api_key=""):
+        yield "Начало "
+        raise MistralError("503 Service Unavailable", status=503)
+
+    monkeypatch.setattr(main, "stream_code_review_async", failing_stream)
+    events = _post(client)
+
+    assert [event for event, _ in events] == ["token", "error"]
+    error = events[-1][1]
+    assert "503" in error["detail"]
+    (report, review), = _reports(engine)
+    assert report.id == error["report_id"] and report.status == "failed"
+    assert "503" in review
+
+
+def test_cache_hit_is_one_token(env, monkeypatch):
+    client, engine = env
+    with Session(engine) as session:
+        store_review(session, make_cache_key(CODE), "Ревью из кэша")
+
+    async def unexpected_stream(code, context="", api_key=""):
+        raise AssertionError("при попадании в кэш Mistral не вызывается")
+        yield
+
+    monkeypatch.setattr(main, "stream_code_review_async", unexpected_stream)
+    events = _post(client)
+
+    assert events[0] == ("token", {"text": "Ревью из кэша"})
+    assert [event for event, _ in events] == ["token", "done"] and events[-1][1]["cached"] is True
+    (report, review), = _reports(engine)
+    assert report.status == "completed" and review == "Ревью из кэша"
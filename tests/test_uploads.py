@@ -0,0 +1,130 @@
+"""
+Потоковая загрузка: файл в сотни МБ читается кусками, пиковая память не зависит от размера файла.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_uploads.py -q
+"""
+import asyncio
+import io
+import os
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app import uploads
+from app.uploads import UploadSizeLimitMiddleware, UploadTooLargeError, copy_upload, decode_text, read_upload
+
+BIG_SIZE = 300 * 1024 * 1024
+PEAK_LIMIT = 16 * 1024 * 1024
+
+
+@pytest.fixture(scope="module")
+def big_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("uploads") / "big.py")
+    block = ("def handler(request):\n    return request.user  # комментарий\n" * 20000).encode()
+    with open(path, "wb") as f:
+        written = 0
+        while written < BIG_SIZE:
+            f.write(block)
+            written += len(block)
+    return path
+
+
+def _peak(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_big_upload_memory_is_bounded(big_file, tmp_path, monkeypatch):
+    # Путь PDF: read_upload прочитывает всю загрузку (копия на диск кусками), а не первые символы
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1024 * 1024 * 1024)
+    monkeypatch.setattr(uploads, "PDF_MAX_BYTES", 1024 * 1024 * 1024)
+    monkeypatch.setattr(uploads, "_upload_dir", str(tmp_path))
+    copied = []
+
+    async def fake_extract(path, label=None):
+        copied.append(os.path.getsize(path))
+        return f"{label}: {copied[-1]} bytes"
+
+    monkeypatch.setattr(uploads, "extract_pdf_text", fake_extract)
+    with open(big_file, "rb") as f:
+        upload = UploadFile(f, filename="big.pdf", size=os.path.getsize(big_file))
+        (text, kind), peak = _peak(lambda: asyncio.run(read_upload(upload)))
+        assert f.tell() == os.path.getsize(big_file)
+    assert kind == "pdf"
+    assert copied == [os.path.getsize(big_file)] and text == f"big.pdf: {copied[0]} bytes"
+    assert os.listdir(tmp_path) == []  # Временная копия удалена
+    assert peak < PEAK_LIMIT
+
+
+def test_big_text_upload_stops_at_max_chars(big_file, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1024 * 1024 * 1024)
+    with open(big_file, "rb") as f:
+        upload = UploadFile(f, filename="big.py", size=os.path.getsize(big_file))
+        (text, kind), peak = _peak(lambda: asyncio.run(read_upload(upload)))
+        # Прочитано только нужное для UPLOAD_MAX_CHARS символов, а не весь файл
+        assert f.tell() <= uploads.UPLOAD_MAX_CHARS * 4 + uploads.UPLOAD_CHUNK_BYTES
+    assert kind == "code"
+    assert text.startswith("def handler(request):")
+    assert text.endswith(f"(truncated: first {uploads.UPLOAD_MAX_CHARS} characters)")
+    assert peak < PEAK_LIMIT
+
+
+def test_big_copy_memory_is_bounded(big_file, tmp_path):
+    target = str(tmp_path / "copy.pdf")
+    with open(big_file, "rb") as f:
+        size, peak = _peak(lambda: copy_upload(f, target, max_bytes=BIG_SIZE * 2))
+    assert size == os.path.getsize(big_file) == os.path.getsize(target)
+    assert peak < PEAK_LIMIT
+
+
+def test_size_limit(big_file):
+    with open(big_file, "rb") as f:
+        # Размер известен из multipart — отказ до чтения
+        with pytest.raises(UploadTooLargeError):
+            asyncio.run(read_upload(UploadFile(f, filename="big.py", size=os.path.getsize(big_file))))
+        assert f.tell() == 0
+        # Размер неизвестен — отказ на первом куске сверх лимита
+        with pytest.raises(UploadTooLargeError):
+            decode_text(f, max_bytes=10 * 1024 * 1024, max_chars=BIG_SIZE)
+        assert f.tell() <= 10 * 1024 * 1024 + uploads.UPLOAD_CHUNK_BYTES
+
+    assert decode_text(io.BytesIO("привет".encode()[:-1] + b"\xff"), max_chars=10) == "приве"
+
+
+def test_middleware_rejects_before_parsing(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1024 * 1024)
+    monkeypatch.setattr(uploads, "UPLOAD_FORM_OVERHEAD_BYTES", 1024)
+    parsed = []
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=("/upload",))
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        parsed.append(file.filename)
+        return {"size": file.size}
+
+    client = TestClient(app)
+    small = client.post("/upload", files={"file": ("a.py", b"x = 1\n")})
+    assert small.status_code == 200 and small.json() == {"size": 6}
+
+    # Content-Length больше лимита — 413 без чтения тела
+    big = client.post("/upload", files={"file": ("big.py", b"x" * (2 * 1024 * 1024))})
+    assert big.status_code == 413 and "too large" in big.json()["detail"]
+
+    # Без Content-Length (chunked) — отказ, как только тело перевалит за лимит
+    def chunks():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.py\"\r\n\r\n"
+        for _ in range(40):
+            yield b"x" * 64 * 1024
+        yield b"\r\n--b--\r\n"
+
+    chunked = client.post("/upload", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert chunked.status_code == 413
+    assert parsed == ["a.py"]
@@ -0,0 +1,50 @@
+"""
+Обход проекта: окружения и служебные папки отбрасываются, .gitignore/.reviewignore учитываются.
+
+Запуск из корня проекта:
+    python -m pytest tests/test_walker.py -q
+"""
+import os
+
+from app.walker import ignored_reason, new_walk_stats, walk_project
+
+
+def _touch(root, rel_path, size=10):
+    path = os.path.join(root, *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("x" * size)
+
+
+def test_walk_prunes_and_honors_ignore_files(tmp_path):
+    root = str(tmp_path)
+    for rel_path in (
+        "app/main.py", "app/models.py", "app/generated/schema_pb2.py", "app/keep_pb2.py",
+        "scripts/tool.py", "docs/conf.py", "data/dump.py",
+        ".venv/lib/python3.11/site-packages/requests/api.py", "node_modules/pkg/x.py",
+        ".git/hooks/pre-commit.py", "app/__pycache__/main.cpython-311.py",
+        "env311/lib/site.py", "env311/pyvenv.cfg",
+    ):
+        _touch(root, rel_path)
+    _touch(root, "app/big.py", size=2048)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("# comment\n/docs/\n*_pb2.py\n!keep_pb2.py\n")
+    with open(os.path.join(root, "app", ".reviewignore"), "w") as f:
+        f.write("generated/\n")
+    with open(os.path.join(root, ".reviewignore"), "w") as f:
+        f.write("data\n")
+
+    stats = new_walk_stats()
+    files = list(walk_project(root, max_bytes=1024, stats=stats))
+
+    assert [os.path.relpath(path, root) for path in files] == [
+        os.path.join("app", "keep_pb2.py"), os.path.join("app", "main.py"),
+        os.path.join("app", "models.py"), os.path.join("scripts", "tool.py"),
+    ]
+    assert stats["files"] == 4
+    assert stats["skipped"] == {"too_large": 1}
+    assert stats["pruned_dirs"] == {"builtin": 4, "ignored": 3, "virtualenv": 1}
+
+    assert ignored_reason(root, os.path.join(root, "app", "generated", "schema_pb2.py")) == "ignored"
+    assert ignored_reason(root, os.path.join(root, "env311", "lib", "site.py")) == "virtualenv"
+    assert ignored_reason(root, os.path.join(root, "app", "main.py")) is None